@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app import profiling
+from app.config import get_settings
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Admin endpoints are disabled unless ADMIN_TOKEN is set, and then require
+    it in the X-Admin-Token header.
+    """
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin/profile", dependencies=[Depends(require_admin)])
+index_router = APIRouter(prefix="/admin/index", dependencies=[Depends(require_admin)])
+
+
+@router.get("/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(10.0, gt=0, le=profiling.MAX_CPU_PROFILE_S),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    include_idle: bool = Query(False),
+):
+    """
+    Sample all worker threads for `seconds` and return folded stacks
+    (`flamegraph.pl`, speedscope, inferno). Waiting threads are left out
+    unless `include_idle`.
+    """
+    try:
+        counts = await run_in_threadpool(profiling.sample_cpu, seconds, interval_ms, include_idle)
+    except profiling.ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return PlainTextResponse(profiling.folded_stacks(counts))
+
+
+@router.post("/memory/start")
+def memory_start(frames: int = Query(10, ge=1, le=64)):
+    return profiling.start_memory_tracing(frames)
+
+
+@router.get("/memory")
+def memory_snapshot(
+    top: int = Query(25, ge=1, le=500),
+    group: str = Query("module", pattern="^(module|line)$"),
+    reset: bool = False,
+):
+    """
+    Allocation growth since `/memory/start` (or the last `reset=true`).
+    """
+    try:
+        return profiling.memory_diff(top=top, group=group, reset=reset)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+@router.post("/memory/stop")
+def memory_stop():
+    return profiling.stop_memory_tracing()
+
+
+@index_router.get("")
+def index_info():
+    from app.tools.policy_retriever import index_status
+
+    return index_status()
+
+
+@index_router.post("/rebuild", status_code=202)
+def index_rebuild():
+    """
+    Rebuild the policy index into a new collection in the background and
+    switch to it once validated; queries keep using the current one.
+    """
+    from app.tools.policy_retriever import index_status, schedule_index_rebuild
+
+    return {"scheduled": schedule_index_rebuild(), **index_status()}
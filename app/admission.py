@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class AdmissionRejected(Exception):
+    """
+    The request was not admitted. `status_code` is 429 when the wait queue is
+    full and 503 when the request was shed or waited too long.
+    """
+
+    def __init__(self, reason: str, retry_after_s: int, status_code: int = 503):
+        super().__init__(reason)
+        self.retry_after_s = retry_after_s
+        self.status_code = status_code
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded priority wait queue.
+
+    At most `max_concurrent` requests run at once; up to `max_queue` more wait
+    in priority order (lower value first, FIFO within a priority). When the
+    queue is full a higher-priority arrival displaces the newest lowest-priority
+    waiter; otherwise the arrival is rejected immediately.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout_s: float,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # EWMA of time spent holding a slot, used to size Retry-After.
+        self._service_time_s = 1.0
+
+    def _queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> int:
+        backlog = self._queued() + 1
+        return max(1, math.ceil(backlog * self._service_time_s / self.max_concurrent))
+
+    def _shed_lowest(self, priority: int) -> bool:
+        live = [w for w in self._waiters if not w[2].done()]
+        if not live:
+            return False
+        worst = max(live, key=lambda w: (w[0], w[1]))
+        if worst[0] <= priority:
+            return False
+        worst[2].set_exception(
+            AdmissionRejected("Shed in favour of a higher-priority request", self.retry_after())
+        )
+        return True
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, timeout_s: Optional[float] = None) -> None:
+        if self._active < self.max_concurrent and not self._queued():
+            self._active += 1
+            return
+
+        if self._queued() >= self.max_queue and not self._shed_lowest(priority):
+            raise AdmissionRejected("Server is at capacity", self.retry_after(), status_code=429)
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+
+        timeout = self.queue_timeout_s if timeout_s is None else min(timeout_s, self.queue_timeout_s)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # Slot was handed over just as we timed out; give it back.
+                self.release()
+            else:
+                fut.cancel()
+            raise AdmissionRejected("Timed out waiting for capacity", self.retry_after())
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            else:
+                fut.cancel()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # Hand the slot straight to the next waiter.
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    def _observe(self, elapsed_s: float) -> None:
+        self._service_time_s = 0.9 * self._service_time_s + 0.1 * elapsed_s
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL, timeout_s: Optional[float] = None):
+        await self.acquire(priority, timeout_s=timeout_s)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._observe(time.monotonic() - start)
+            self.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": self._queued(),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
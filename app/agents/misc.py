@@ -21,11 +21,7 @@ def clarification_node(state: State) -> State:
             "If you’re not sure which product fits your situation, I can first recommend the most "
             "suitable product for your trip and then detail what it covers."
         )
-        state["response"] = {
-            "type": "clarification",
-            "question": question,
-        }
-        return state
+        return {"response": {"type": "clarification", "question": question}}
 
     required_fields = ["age", "destination", "duration_days", "purpose"]
     missing = [f for f in required_fields if user_profile.get(f) is None]
@@ -49,23 +45,21 @@ def clarification_node(state: State) -> State:
             "or a detailed explanation of what is covered by a specific product?"
         )
 
-    state["response"] = {
-        "type": "clarification",
-        "question": question,
-    }
-    return state
+    return {"response": {"type": "clarification", "question": question}}
 
 def low_confidence_node(state: State) -> State:
     
     question = state.get("rag_query") or "your question"
 
-    state["response"] = {
-        "type": "policy_answer",
-        "answer": (
-            "Based on the policy documents I have, I’m not confident enough to give a reliable answer "
-            f"to '{question}'. Please contact the insurer or refer to the full policy document for confirmation."
-        ),
-        "confidence": 0.0,
-        "sources": [],
+    return {
+        "response": {
+            "type": "policy_answer",
+            "answer": (
+                "Based on the policy documents I have, I’m not confident enough to give a reliable answer "
+                f"to '{question}'. Please contact the insurer or refer to the full policy document for confirmation."
+            ),
+            "confidence": 0.0,
+            "sources": [],
+            "answer_mode": "low_confidence",
+        }
     }
-    return state
@@ -1,17 +1,22 @@
 # app/agents/policy_rag.py
 from __future__ import annotations
 
-import json
-from typing import Any, Dict, List
-
-from langchain_core.messages import SystemMessage, HumanMessage
+from typing import Any, Dict, List, Optional, Tuple
 
+from app.config import get_settings
 from app.state import State
-from app.tools.policy_retriever import retrieve_policy_chunks, PolicyChunk
-from app.llm import get_chat_llm
+from app.deadline import budget_exhausted
+from app.tracing import set_attributes
+from app.tools.policy_retriever import INDEXED_PRODUCTS, retrieve_policy_chunks, PolicyChunk
+from app.agents.router import detect_products, is_comparison_question
+from app.tools.faq_store import lookup_faq
+from app.tools.extractive_answer import ExtractiveDecision, extract_answer, retrieval_margin
+from app.llm import LLMUnavailable, parse_json_reply, simple_chat_call
 
 
 CONFIDENCE_THRESHOLD = 0.4  # tune as needed
+RETRIEVAL_ONLY_CHUNKS = 3
+RETRIEVAL_ONLY_EXCERPT_CHARS = 400
 
 
 def _compute_confidence(chunks: List[PolicyChunk]) -> float:
@@ -22,6 +27,17 @@ def _compute_confidence(chunks: List[PolicyChunk]) -> float:
     return float(max_score)
 
 
+def _retrieval_scope(question: str) -> List[str]:
+    """
+    Products to restrict retrieval to: the ones named in the question, or
+    every indexed product for comparison questions that name none.
+    """
+    products = detect_products(question)
+    if not products and is_comparison_question(question):
+        return list(INDEXED_PRODUCTS)
+    return products
+
+
 def _generate_policy_answer(
     question: str,
     chunks: List[PolicyChunk],
@@ -29,13 +45,12 @@ def _generate_policy_answer(
     """
     Ask LLM to answer in English + provide sources and confidence.
     Returns dict with keys: answer, confidence, sources[].
+    Raises LLMUnavailable when the LLM cannot be called in time.
     """
-    llm = get_chat_llm()
-
     context_pieces = []
     for c in chunks:
         context_pieces.append(
-            f"[{c.product} | {c.section}] {c.content}"
+            f"[{', '.join(c.products or [c.product])} | {c.section}] {c.content}"
         )
     context_text = "\n\n".join(context_pieces)
 
@@ -55,13 +70,10 @@ def _generate_policy_answer(
         f"Policy excerpts:\n{context_text}"
     )
 
-    resp = llm.invoke(
-        [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-    )
-    content = resp.content if isinstance(resp.content, str) else str(resp.content)
+    content = simple_chat_call(system_prompt, user_prompt, site="rag_answer")
 
     try:
-        data = json.loads(content)
+        data = parse_json_reply(content)
         answer = str(data.get("answer", ""))
         confidence = float(data.get("confidence", 0.0))
         sources = data.get("sources", [])
@@ -88,31 +100,114 @@ def _generate_policy_answer(
         }
 
 
+def _retrieval_only_answer(chunks: List[PolicyChunk], confidence: float) -> Dict[str, Any]:
+    """
+    Answer without the LLM (circuit open, or no time left for the call):
+    the best excerpts, quoted with their sources.
+    """
+    top = chunks[:RETRIEVAL_ONLY_CHUNKS]
+    lines = ["I can't write a full answer right now, but these policy excerpts look most relevant:"]
+    for c in top:
+        excerpt = " ".join(c.content.split())
+        if len(excerpt) > RETRIEVAL_ONLY_EXCERPT_CHARS:
+            excerpt = excerpt[:RETRIEVAL_ONLY_EXCERPT_CHARS].rsplit(" ", 1)[0] + "…"
+        lines.append(f"- {', '.join(c.products or [c.product])} ({c.section}): {excerpt}")
+    return {
+        "type": "policy_answer",
+        "answer": "\n".join(lines),
+        "confidence": confidence,
+        "sources": [{"product": c.product, "section": c.section} for c in top],
+        "answer_mode": "retrieval_only",
+    }
+
+
+def _extractive_answer(
+    question: str,
+    chunks: List[PolicyChunk],
+) -> Tuple[Optional[Dict[str, Any]], Optional[ExtractiveDecision]]:
+    """
+    Quote the best sentences instead of generating when the top hit is strong
+    and clearly ahead of the rest. Returns (answer or None, decision); the
+    decision is None while the mode is off.
+    """
+    settings = get_settings()
+    if not settings.extractive_answers_enabled:
+        return None, None
+
+    top_score, margin = retrieval_margin(chunks)
+    decision = ExtractiveDecision(taken=False, reason="confident", top_score=top_score, margin=margin)
+    answer = None
+    if is_comparison_question(question):
+        decision.reason = "comparison"
+    elif top_score < settings.extractive_min_score:
+        decision.reason = "low_score"
+    elif margin < settings.extractive_min_margin:
+        decision.reason = "low_margin"
+    else:
+        answer, decision.sentence_score = extract_answer(question, chunks)
+        if answer is None:
+            decision.reason = "no_sentence"
+        else:
+            decision.taken = True
+
+    set_attributes(extractive=decision.taken, extractive_reason=decision.reason)
+    return answer, decision
+
+
 def policy_rag_node(state: State) -> State:
     
     messages = state.get("messages") or []
     last = messages[-1]
     question = last.get("content") if isinstance(last, dict) else getattr(last, "content", "")
 
-    state["rag_query"] = question
+    update: State = {"rag_query": question}
+
+    # Without a response the graph falls through to low_confidence_node.
+    if budget_exhausted(state):
+        return update
+
+    faq_response = lookup_faq(question)
+    if faq_response is not None:
+        update["response"] = {**faq_response, "answer_mode": "faq"}
+        update["rag_confidence"] = float(faq_response.get("confidence", 0.0))
+        return update
 
-    chunks = retrieve_policy_chunks(question, top_k=5)
+    chunks = retrieve_policy_chunks(question, top_k=5, products=_retrieval_scope(question))
 
     confidence = _compute_confidence(chunks)
-    state["rag_confidence"] = confidence
+    update["rag_confidence"] = confidence
 
     if confidence < CONFIDENCE_THRESHOLD or not chunks:
-        return state
+        return update
+
+    extracted, decision = _extractive_answer(question, chunks)
+    extractive = {"extractive": decision.as_dict()} if decision is not None else {}
+    if extracted is not None:
+        update["response"] = {
+            "type": "policy_answer",
+            "answer": extracted["answer"],
+            "confidence": confidence,
+            "sources": extracted["sources"],
+            "answer_mode": "extractive",
+            **extractive,
+        }
+        return update
 
-    rag_answer = _generate_policy_answer(question, chunks)
+    try:
+        rag_answer = _generate_policy_answer(question, chunks)
+    except LLMUnavailable:
+        update["response"] = {**_retrieval_only_answer(chunks, confidence), **extractive}
+        return update
 
     final_conf = float((confidence + rag_answer.get("confidence", 0.0)) / 2.0)
 
-    state["response"] = {
+    update["response"] = {
         "type": "policy_answer",
         "answer": rag_answer["answer"],
         "confidence": final_conf,
         "sources": rag_answer["sources"],
+        "answer_mode": "generated",
+        **extractive,
     }
-    state["rag_confidence"] = final_conf
-    return state
+    update["rag_confidence"] = final_conf
+    return update
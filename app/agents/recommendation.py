@@ -3,12 +3,21 @@ from __future__ import annotations
 import json
 from typing import Any, Dict, List, Optional
 
-from langchain_core.messages import SystemMessage, HumanMessage
-
 from app.state import State
+from app.config import get_settings
+from app.deadline import budget_exhausted
 from app.tools.product_rules import get_eligible_and_scored_products
 from app.tools.product_rules import product_id
-from app.llm import get_chat_llm
+from app.tools.catalog import CatalogSnapshot, get_catalog
+from app.tools.recommendation_reasons import (
+    bucket_profile,
+    get_reasons_cache,
+    reasons_cache_key,
+    template_reasons,
+)
+from app.llm import LLMUnavailable, llm_degraded, parse_json_reply, simple_chat_call
+from app.tracing import set_attributes
+from app.tools.trip_profile import parse_trip_profile
 
 import re
 
@@ -53,49 +62,82 @@ def _normalize_purpose(purpose: Optional[str]) -> Optional[str]:
             return canon
     return purpose  # fallback: return as-is
 
-def _extract_profile_from_text(user_text: str) -> Dict[str, Any]:
-    llm = get_chat_llm()
-    system_prompt = (
-        "You extract a structured trip profile from a user message for travel insurance.\n"
-        "Extract the following fields:\n"
-        "- age: integer or null\n"
-        "- destination: short string (e.g. 'Spain', 'Europe', 'Thailand') or null\n"
-        "- duration_days: integer number of days of the trip or null\n"
+_PROFILE_FIELD_PROMPTS = {
+    "age": "- age: integer or null\n",
+    "destination": "- destination: short string (e.g. 'Spain', 'Europe', 'Thailand') or null\n",
+    "duration_days": "- duration_days: integer number of days of the trip or null\n",
+    "purpose": (
         "- purpose: short English label describing the trip purpose, or null.\n"
         "Purpose should be one of (if possible): "
         "'Personal trip', 'Tourism', 'Business trip', "
         "'Expatriation', 'Long-term stay', 'Relocation', 'Work abroad', "
-        "'Working Holiday', 'PVT'.\n\n"
-        "Return ONLY JSON, no explanation."
+        "'Working Holiday', 'PVT'.\n"
+    ),
+}
+
+
+def _rule_based_profile(user_text: str, known: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    LLM-free profile extraction (degraded mode, no time left): every field
+    the parser found, whatever its confidence.
+    """
+    known = known or {}
+    return parse_trip_profile(user_text, default_purpose=known.get("purpose") is None).values
+
+
+def _extract_profile_from_text(user_text: str, known: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Parse the profile locally and ask the LLM only for the fields the parser
+    could not fill with confidence (and that `known` does not already hold).
+    """
+    known = known or {}
+    parsed = parse_trip_profile(user_text, default_purpose=known.get("purpose") is None)
+    min_confidence = get_settings().profile_parser_min_confidence
+    confident = parsed.confident(min_confidence)
+    missing = [f for f in parsed.missing(min_confidence) if known.get(f) is None]
+    set_attributes(profile_parsed=",".join(sorted(confident)), profile_llm_fields=",".join(missing))
+    if not missing:
+        return confident
+    # Unsure guesses never overwrite what earlier turns established.
+    best_effort = {k: v for k, v in parsed.values.items() if k in confident or known.get(k) is None}
+    if llm_degraded():
+        return best_effort
+
+    system_prompt = (
+        "You extract a structured trip profile from a user message for travel insurance.\n"
+        "Extract the following fields:\n"
+        + "".join(_PROFILE_FIELD_PROMPTS[f] for f in missing)
+        + "\nReturn ONLY JSON, no explanation."
     )
     user_prompt = f"User message:\n{user_text}"
 
-    resp = llm.invoke(
-        [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-    )
-    content = resp.content if isinstance(resp.content, str) else str(resp.content)
-    content = content[7:-3]
     try:
-        data = json.loads(content)
-        return {
-            "age": data.get("age"),
-            "destination": data.get("destination"),
-            "duration_days": data.get("duration_days"),
-            "purpose": data.get("purpose"),
-        }
+        content = simple_chat_call(system_prompt, user_prompt, site="profile_extract")
+    except LLMUnavailable:
+        return best_effort
+    try:
+        data = parse_json_reply(content)
     except Exception:
-        return {}
+        return best_effort
+    extracted = dict(best_effort)
+    for f in missing:
+        if data.get(f) is not None:
+            extracted[f] = data.get(f)
+    extracted.update(confident)
+    return extracted
 
 
-def _generate_reasons_for_products(
+def _llm_reasons(
     user_profile: Dict[str, Any],
     products: List[Dict[str, Any]],
-) -> Dict[str, str]:
-    
+) -> Optional[Dict[str, str]]:
+    """
+    Ask the LLM for one short reason per product. Returns None when the LLM
+    is unavailable or its reply cannot be parsed.
+    """
     if not products:
         return {}
 
-    llm = get_chat_llm()
     system_prompt = (
         "You are an assistant generating SHORT reasons for recommending travel insurance products.\n"
         "For each product, write 1–2 sentences explaining why it fits the user's age, destination and trip duration.\n"
@@ -119,16 +161,56 @@ def _generate_reasons_for_products(
         f"Products: {json.dumps(products_summary, ensure_ascii=False)}"
     )
 
-    resp = llm.invoke(
-        [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-    )
-    content = resp.content if isinstance(resp.content, str) else str(resp.content)
+    try:
+        content = simple_chat_call(system_prompt, user_prompt, site="reasons")
+    except LLMUnavailable:
+        return None
 
     try:
-        data = json.loads(content)
-        return data.get("reasons", {})
+        data = parse_json_reply(content)
+        reasons = data.get("reasons", {})
     except Exception:
-        return {p["id"]: f"{p['name']} matches your trip profile." for p in products}
+        return None
+    if not isinstance(reasons, dict):
+        return None
+    return {str(k): str(v) for k, v in reasons.items()}
+
+
+def _generate_reasons_for_products(
+    user_profile: Dict[str, Any],
+    products: List[Dict[str, Any]],
+    allow_llm: bool = True,
+    snapshot: Optional[CatalogSnapshot] = None,
+) -> Dict[str, str]:
+    """
+    Reasons per product id. In "cache" mode the LLM is only asked once per
+    (products, profile bucket) and with the bucketed profile, so its answer is
+    reusable by every traveller in the bucket; templates cover the rest.
+    """
+    if not products:
+        return {}
+
+    template = template_reasons(user_profile, products)
+    mode = get_settings().reasons_mode
+    if mode == "template" or not allow_llm:
+        return template
+
+    if mode == "llm":
+        reasons = _llm_reasons(user_profile, products)
+        return {**template, **(reasons or {})}
+
+    if snapshot is None:
+        snapshot = get_catalog().current()
+    bucket = bucket_profile(user_profile)
+    key = reasons_cache_key([product_id(p) for p in products], bucket, snapshot.fingerprints)
+    cache = get_reasons_cache()
+    cached = cache.get(key)
+    if cached is None:
+        cached = _llm_reasons(bucket, products)
+        if not cached:
+            return template
+        cache.put(key, cached)
+    return {**template, **cached}
 
 
 def recommendation_node(state: State) -> State:
@@ -137,32 +219,41 @@ def recommendation_node(state: State) -> State:
     user_text = last.get("content") if isinstance(last, dict) else getattr(last, "content", "")
 
     if _is_prompt_injection(user_text):
-        state["response"] = {
-            "type": "clarification",
-            "question": (
-                "I can’t follow requests to ignore my instructions or to choose products "
-                "without considering your actual travel profile. "
-                "To recommend a suitable insurance product, please tell me your age, "
-                "destination, and trip duration."
-            ),
+        return {
+            "response": {
+                "type": "clarification",
+                "question": (
+                    "I can’t follow requests to ignore my instructions or to choose products "
+                    "without considering your actual travel profile. "
+                    "To recommend a suitable insurance product, please tell me your age, "
+                    "destination, and trip duration."
+                ),
+            }
         }
-        return state
 
-    user_profile = state.get("user_profile") or {}
+    # Copy: the state's dict must not be mutated, only replaced via the update.
+    user_profile = dict(state.get("user_profile") or {})
+    update: State = {}
 
     if not user_profile or any(k not in user_profile for k in ["age", "destination", "duration_days", "purpose"]):
-        extracted = _extract_profile_from_text(user_text)
+        if budget_exhausted(state):
+            extracted = _rule_based_profile(user_text, known=user_profile)
+        else:
+            extracted = _extract_profile_from_text(user_text, known=user_profile)
         if extracted:
             extracted["purpose"] = _normalize_purpose(extracted.get("purpose"))
         user_profile.update({k: v for k, v in extracted.items() if v is not None})
-        state["user_profile"] = user_profile
+        update["user_profile"] = user_profile
 
 
     if any(k not in user_profile or user_profile.get(k) is None for k in ["age", "destination", "duration_days"]):
-        state["intent"] = "clarification"
-        return state
+        update["intent"] = "clarification"
+        return update
 
-    scored = get_eligible_and_scored_products(user_profile, max_products=2)
+    # One catalog version for the whole request, even if products.json is
+    # hot-reloaded while we work.
+    catalog = get_catalog().current()
+    scored = get_eligible_and_scored_products(user_profile, max_products=2, snapshot=catalog)
     products = [p for p, _ in scored]
 
     if not products:
@@ -188,17 +279,19 @@ def recommendation_node(state: State) -> State:
 
         question = " ".join(msg_parts)
 
-        state["response"] = {
+        update["response"] = {
             "type": "clarification",
             "question": question,
+            "catalog_version": catalog.version,
         }
-        return state
+        return update
 
-    if not products:
-        state["intent"] = "clarification"
-        return state
-
-    reasons = _generate_reasons_for_products(user_profile, products)
+    reasons = _generate_reasons_for_products(
+        user_profile,
+        products,
+        allow_llm=not budget_exhausted(state) and not llm_degraded(),
+        snapshot=catalog,
+    )
 
     rec_products = []
     for p in products:
@@ -214,8 +307,9 @@ def recommendation_node(state: State) -> State:
             }
         )
 
-    state["response"] = {
+    update["response"] = {
         "type": "recommendation",
         "products": rec_products,
+        "catalog_version": catalog.version,
     }
-    return state
+    return update
@@ -1,14 +1,13 @@
 from __future__ import annotations
 
-import json
 import re
 from typing import Literal
 
 from langgraph.graph import END
-from langchain_core.messages import HumanMessage, SystemMessage
 
 from app.state import State, Intent
-from app.llm import get_chat_llm
+from app.deadline import budget_exhausted
+from app.llm import LLMUnavailable, parse_json_reply, simple_chat_call
 
 
 INTENT_TYPES: list[Intent] = [
@@ -17,12 +16,22 @@ INTENT_TYPES: list[Intent] = [
     "clarification",
 ]
 
-PRODUCT_NAME_PATTERNS = [
-    r"\beuropax\b",
-    r"\bglobe\b",
-    r"\btraveller\b",
-    r"\bacs\b",
-    r"\bexpat\b",
+# Product name (as used in the policy index metadata) -> patterns naming it.
+PRODUCT_NAME_ALIASES = {
+    "EUROPAX": [r"\beuropax\b"],
+    "GLOBE TRAVELLER": [r"\bglobe\b", r"\btraveller\b"],
+    "ACS EXPAT": [r"\bacs\b", r"\bexpat\b"],
+}
+
+PRODUCT_NAME_PATTERNS = [p for patterns in PRODUCT_NAME_ALIASES.values() for p in patterns]
+
+COMPARISON_PATTERNS = [
+    r"\bcompar(e|ed|ing|ison)\b",
+    r"\bdifferen(ce|ces|t)\b",
+    r"\bvs\.?\b",
+    r"\bversus\b",
+    r"\bboth\b",
+    r"\bwhich (one|product|plan) (is|has|covers)\b",
 ]
 
 
@@ -54,6 +63,22 @@ def _mentions_product_name(text: str) -> bool:
     t = text.lower()
     return any(re.search(p, t) for p in PRODUCT_NAME_PATTERNS)
 
+def detect_products(text: str) -> list[str]:
+    """
+    Products named in the text, in PRODUCT_NAME_ALIASES order.
+    """
+    t = text.lower()
+    return [
+        product
+        for product, patterns in PRODUCT_NAME_ALIASES.items()
+        if any(re.search(p, t) for p in patterns)
+    ]
+
+
+def is_comparison_question(text: str) -> bool:
+    t = text.lower()
+    return len(detect_products(t)) >= 2 or any(re.search(p, t) for p in COMPARISON_PATTERNS)
+
 def _is_ambiguous_policy_question(text: str) -> bool:
     t = text.lower().strip()
     tokens = t.split()
@@ -114,8 +139,6 @@ def _heuristic_intent(user_text: str) -> tuple[Intent | None, float]:
 
 def _llm_classify_intent(user_text: str) -> tuple[Intent, float]:
 
-    llm = get_chat_llm()
-
     system_prompt = (
         "You are an intent classifier for a travel insurance assistant.\n"
         "You must classify the user's message into one of:\n"
@@ -127,16 +150,10 @@ def _llm_classify_intent(user_text: str) -> tuple[Intent, float]:
     )
     user_prompt = f"User message:\n{user_text}"
 
-    resp = llm.invoke(
-        [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt),
-        ]
-    )
-    content = resp.content if isinstance(resp.content, str) else str(resp.content)
+    content = simple_chat_call(system_prompt, user_prompt, site="router", hedge=True)
 
     try:
-        data = json.loads(content)
+        data = parse_json_reply(content)
         intent = data.get("intent")
         conf = float(data.get("confidence", 0.0))
         if intent not in INTENT_TYPES:
@@ -150,9 +167,7 @@ def router_node(state: State) -> State:
     
     messages = state.get("messages") or []
     if not messages:
-        state["intent"] = "clarification"
-        state["router_confidence"] = 0.0
-        return state
+        return {"intent": "clarification", "router_confidence": 0.0}
 
     last = messages[-1]
     user_text = last.get("content") if isinstance(last, dict) else getattr(last, "content", "")
@@ -160,11 +175,16 @@ def router_node(state: State) -> State:
     intent, conf = _heuristic_intent(user_text)
 
     if intent is None or conf < 0.7:
-        intent, conf = _llm_classify_intent(user_text)
-
-    state["intent"] = intent
-    state["router_confidence"] = conf
-    return state
+        if budget_exhausted(state):
+            intent = intent or "clarification"
+        else:
+            try:
+                intent, conf = _llm_classify_intent(user_text)
+            except LLMUnavailable:
+                # Out of time: keep the heuristic guess, else ask the user.
+                intent = intent or "clarification"
+
+    return {"intent": intent, "router_confidence": conf}
 
 
 def route_selector(state: State) -> str:
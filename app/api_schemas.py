@@ -12,6 +12,9 @@ class RecommendationResponse(BaseModel):
     products: List[RecommendedProduct] = Field(
         ..., description="One or more recommended products"
     )
+    catalog_version: Optional[str] = Field(
+        None, description="Version of products.json used for eligibility and scoring"
+    )
 
 class PolicySource(BaseModel):
     product: str = Field(
@@ -24,6 +27,18 @@ class PolicySource(BaseModel):
     )
 
 
+class ExtractiveCheck(BaseModel):
+    taken: bool = Field(..., description="Whether the answer was extracted instead of generated")
+    reason: Literal["confident", "comparison", "low_score", "low_margin", "no_sentence"] = Field(
+        ..., description="Why the extractive path was taken or skipped"
+    )
+    top_score: float = Field(..., description="Retrieval score of the top chunk")
+    margin: float = Field(..., description="Lead of the top chunk over the runner-up")
+    sentence_score: Optional[float] = Field(
+        None, description="Score of the best-matching sentence, when sentences were scored"
+    )
+
+
 class PolicyAnswerResponse(BaseModel):
     type: Literal["policy_answer"] = "policy_answer"
     answer: str = Field(
@@ -40,6 +55,18 @@ class PolicyAnswerResponse(BaseModel):
         ...,
         description="Where in the policy docs the answer comes from",
     )
+    answer_mode: Literal["generated", "extractive", "faq", "retrieval_only", "low_confidence"] = Field(
+        "generated",
+        description=(
+            "How the answer was produced: LLM-generated, sentences extracted from a "
+            "high-confidence retrieval hit, precomputed FAQ, quoted excerpts without the "
+            "LLM (degraded mode), or a low-confidence notice"
+        ),
+    )
+    extractive: Optional[ExtractiveCheck] = Field(
+        None,
+        description="Extractive fast-path decision, present when EXTRACTIVE_ANSWERS_ENABLED is on",
+    )
 
 class ClarificationResponse(BaseModel):
     type: Literal["clarification"] = "clarification"
@@ -47,6 +74,9 @@ class ClarificationResponse(BaseModel):
         ...,
         description="Clarifying question to the user when intent/profile is ambiguous",
     )
+    catalog_version: Optional[str] = Field(
+        None, description="Version of products.json used, when eligibility was evaluated"
+    )
 
 class QueryResponse(BaseModel):
     type: Literal["recommendation", "policy_answer", "clarification"]
@@ -0,0 +1,152 @@
+"""
+Circuit breaker around the LLM provider.
+
+Closed: calls go through and their outcomes (ok, slow, failed) are kept in
+a rolling window. When enough of the window failed or was slow, the circuit
+opens: LLM calls are refused immediately and every call site takes its
+non-LLM fallback (heuristic intent, local destination match, template
+reasons, retrieval-only policy answers). After `open_s` the circuit goes
+half-open and lets a few real calls through as probes; enough successful
+probes close it again, a failed or slow one reopens it.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class Permit:
+    probe: bool
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: int = 20,
+        window_s: float = 60.0,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_s: float = 10.0,
+        slow_call_rate: float = 0.8,
+        open_s: float = 30.0,
+        half_open_probes: int = 2,
+    ):
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.slow_call_rate = slow_call_rate
+        self.open_s = open_s
+        self.half_open_probes = half_open_probes
+        self._outcomes: Deque[Tuple[float, str]] = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_s:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+    def _open(self, now: float, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._counts["opened"] += 1
+        print(f"LLM circuit opened ({reason}); serving degraded answers for {self.open_s:.0f}s")
+
+    def allow(self) -> Optional[Permit]:
+        """
+        Permission for one provider call, or None while the circuit is open
+        (or half-open with all probe slots taken).
+        """
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self._state == CLOSED:
+                return Permit(probe=False)
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return Permit(probe=True)
+            self._counts["rejected"] += 1
+            return None
+
+    def release(self, permit: Permit) -> None:
+        """The call never reached the provider (deadline, rate-limit wait)."""
+        if permit.probe:
+            with self._lock:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_success(self, permit: Permit, latency_s: float) -> None:
+        if latency_s >= self.slow_call_s:
+            self._record(permit, "slow")
+        else:
+            self._record(permit, "ok")
+
+    def record_failure(self, permit: Permit) -> None:
+        self._record(permit, "failed")
+
+    def _record(self, permit: Permit, outcome: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._counts[outcome] += 1
+            if permit.probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if self._state != HALF_OPEN:
+                    return
+                if outcome != "ok":
+                    self._open(now, f"probe {outcome}")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    print("LLM circuit closed; full mode restored")
+                return
+
+            if self._state != CLOSED:
+                return
+            self._outcomes.append((now, outcome))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_s:
+                self._outcomes.popleft()
+            n = len(self._outcomes)
+            if n < self.min_calls:
+                return
+            failed = sum(1 for _, o in self._outcomes if o == "failed")
+            slow = sum(1 for _, o in self._outcomes if o == "slow")
+            if failed / n >= self.failure_rate:
+                self._open(now, f"{failed}/{n} calls failed")
+            elif slow / n >= self.slow_call_rate:
+                self._open(now, f"{slow}/{n} calls slower than {self.slow_call_s:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            window = Counter(o for _, o in self._outcomes)
+            return {
+                "state": self._state,
+                "window": {"ok": window["ok"], "slow": window["slow"], "failed": window["failed"]},
+                "opened": self._counts["opened"],
+                "rejected": self._counts["rejected"],
+                "reopens_in_s": round(max(0.0, self.open_s - (now - self._opened_at)), 1)
+                if self._state == OPEN
+                else None,
+            }
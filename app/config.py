@@ -1,20 +1,136 @@
 from pydantic import BaseModel
 from functools import lru_cache
+from typing import Dict
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+class LLMProfile(BaseModel):
+    model: str
+    max_tokens: int
+    temperature: float = 0.1
+    timeout_s: float = 15.0
+    json_mode: bool = False
+    # Rate-limit queue order: 0 user-facing answer, 1 classification, 2 enrichment.
+    priority: int = 1
+
+
+# Defaults per LLM call site; model and timeout default to OPENAI_MODEL_CHAT
+# and LLM_TIMEOUT_S. Override with LLM_PROFILE_<SITE>_MODEL, _MAX_TOKENS,
+# _TEMPERATURE, _TIMEOUT_S, _JSON_MODE and _PRIORITY.
+LLM_PROFILE_DEFAULTS: Dict[str, Dict[str, object]] = {
+    "router": {"max_tokens": 64, "temperature": 0.0, "json_mode": True, "priority": 1},
+    "profile_extract": {"max_tokens": 256, "temperature": 0.0, "json_mode": True, "priority": 1},
+    "destination_check": {"max_tokens": 16, "temperature": 0.0, "json_mode": True, "priority": 1},
+    "reasons": {"max_tokens": 1024, "temperature": 0.3, "json_mode": True, "priority": 2},
+    "rag_answer": {"max_tokens": 1500, "temperature": 0.1, "json_mode": True, "priority": 0},
+}
+
+
 class Settings(BaseModel):
     openai_api_key: str
     openai_model_chat: str = "gpt-4.1-mini"
     openai_model_embed: str = "text-embedding-3-small"
+    openai_base_url: str = ""
 
     vector_db_dir: str = ".vectorstore"
 
+    retriever_mode: str = "local"
+    retriever_backend: str = "chroma"
+    exact_index_dtype: str = "float16"
+    retriever_socket: str = ".vectorstore/retriever.sock"
+    retriever_batch_size: int = 16
+    retriever_batch_wait_ms: float = 5.0
+    embed_batch_size: int = 32
+    embed_batch_wait_ms: float = 3.0
+    index_dedupe_threshold: float = 0.85
+
+    faq_enabled: bool = True
+    faq_min_similarity: float = 0.9
+
+    extractive_answers_enabled: bool = False
+    extractive_min_score: float = 0.6
+    extractive_min_margin: float = 0.05
+    extractive_min_sentence_score: float = 0.45
+    extractive_max_sentences: int = 3
+
+    profile_parser_min_confidence: float = 0.8
+    reasons_mode: str = "cache"
+    catalog_poll_interval_s: float = 2.0
+
     max_steps: int = 8
     max_tokens_per_call: int = 4096
 
+    request_timeout_s: float = 20.0
+    llm_timeout_s: float = 15.0
+    llm_min_budget_s: float = 0.5
+    llm_profiles: Dict[str, LLMProfile] = {}
+
+    # Worker processes sharing the provider limits (uvicorn reads the same
+    # variable).
+    web_concurrency: int = 1
+    llm_rpm_limit: int = 0
+    llm_tpm_limit: int = 0
+    llm_rate_limit_retries: int = 2
+    llm_rate_limit_max_wait_s: float = 30.0
+    llm_rate_limit_max_backoff_s: float = 30.0
+
+    circuit_breaker_enabled: bool = True
+    circuit_window: int = 20
+    circuit_window_s: float = 60.0
+    circuit_min_calls: int = 10
+    circuit_failure_rate: float = 0.5
+    circuit_slow_call_s: float = 10.0
+    circuit_slow_call_rate: float = 0.8
+    circuit_open_s: float = 30.0
+    circuit_half_open_probes: int = 2
+
+    admission_max_concurrent: int = 16
+    admission_max_queue: int = 64
+    admission_queue_timeout_s: float = 5.0
+
+    singleflight_enabled: bool = True
+    singleflight_timeout_s: float = 10.0
+
+    llm_hedge_enabled: bool = True
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_delay_s: float = 0.3
+    llm_hedge_default_delay_s: float = 2.0
+    llm_hedge_min_samples: int = 20
+    llm_hedge_budget: float = 0.05
+
+    llm_cassette_mode: str = "off"
+    llm_cassette_dir: str = ".cassettes"
+    llm_cassette_on_miss: str = "fail"
+
+    tracing_exporter: str = "off"
+    tracing_jsonl_path: str = "traces.jsonl"
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_service_name: str = "multi-agent"
+
+    admin_token: str = ""
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, "true" if default else "false").lower() in ("1", "true", "yes")
+
+
+def _llm_profiles(model: str, timeout_s: float) -> Dict[str, LLMProfile]:
+    profiles: Dict[str, LLMProfile] = {}
+    for site, defaults in LLM_PROFILE_DEFAULTS.items():
+        prefix = f"LLM_PROFILE_{site.upper()}_"
+        profiles[site] = LLMProfile(
+            model=os.environ.get(prefix + "MODEL", model),
+            max_tokens=int(os.environ.get(prefix + "MAX_TOKENS", defaults["max_tokens"])),
+            temperature=float(os.environ.get(prefix + "TEMPERATURE", defaults["temperature"])),
+            timeout_s=float(os.environ.get(prefix + "TIMEOUT_S", timeout_s)),
+            json_mode=_env_bool(prefix + "JSON_MODE", bool(defaults["json_mode"])),
+            priority=int(os.environ.get(prefix + "PRIORITY", defaults["priority"])),
+        )
+    return profiles
+
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -22,7 +138,68 @@ def get_settings() -> Settings:
         openai_api_key=os.environ.get("OPENAI_API_KEY", ""),
         openai_model_chat=os.environ.get("OPENAI_MODEL_CHAT", "gpt-4.1-mini"),
         openai_model_embed=os.environ.get("OPENAI_MODEL_EMBED", "text-embedding-3-small"),
+        openai_base_url=os.environ.get("OPENAI_BASE_URL", ""),
         vector_db_dir=os.environ.get("VECTOR_DB_DIR", ".vectorstore"),
+        retriever_mode=os.environ.get("RETRIEVER_MODE", "local"),
+        retriever_backend=os.environ.get("RETRIEVER_BACKEND", "chroma"),
+        exact_index_dtype=os.environ.get("EXACT_INDEX_DTYPE", "float16"),
+        retriever_socket=os.environ.get("RETRIEVER_SOCKET", ".vectorstore/retriever.sock"),
+        retriever_batch_size=int(os.environ.get("RETRIEVER_BATCH_SIZE", "16")),
+        retriever_batch_wait_ms=float(os.environ.get("RETRIEVER_BATCH_WAIT_MS", "5")),
+        embed_batch_size=int(os.environ.get("EMBED_BATCH_SIZE", "32")),
+        embed_batch_wait_ms=float(os.environ.get("EMBED_BATCH_WAIT_MS", "3")),
+        index_dedupe_threshold=float(os.environ.get("INDEX_DEDUPE_THRESHOLD", "0.85")),
+        faq_enabled=_env_bool("FAQ_ENABLED", True),
+        faq_min_similarity=float(os.environ.get("FAQ_MIN_SIMILARITY", "0.9")),
+        extractive_answers_enabled=_env_bool("EXTRACTIVE_ANSWERS_ENABLED", False),
+        extractive_min_score=float(os.environ.get("EXTRACTIVE_MIN_SCORE", "0.6")),
+        extractive_min_margin=float(os.environ.get("EXTRACTIVE_MIN_MARGIN", "0.05")),
+        extractive_min_sentence_score=float(os.environ.get("EXTRACTIVE_MIN_SENTENCE_SCORE", "0.45")),
+        extractive_max_sentences=int(os.environ.get("EXTRACTIVE_MAX_SENTENCES", "3")),
+        profile_parser_min_confidence=float(os.environ.get("PROFILE_PARSER_MIN_CONFIDENCE", "0.8")),
+        reasons_mode=os.environ.get("REASONS_MODE", "cache"),
+        catalog_poll_interval_s=float(os.environ.get("CATALOG_POLL_INTERVAL_S", "2")),
         max_steps=int(os.environ.get("MAX_STEPS", "8")),
         max_tokens_per_call=int(os.environ.get("MAX_TOKENS_PER_CALL", "4096")),
+        request_timeout_s=float(os.environ.get("REQUEST_TIMEOUT_S", "20")),
+        admission_max_concurrent=int(os.environ.get("ADMISSION_MAX_CONCURRENT", "16")),
+        admission_max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "64")),
+        admission_queue_timeout_s=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_S", "5")),
+        singleflight_enabled=_env_bool("SINGLEFLIGHT_ENABLED", True),
+        singleflight_timeout_s=float(os.environ.get("SINGLEFLIGHT_TIMEOUT_S", "10")),
+        llm_timeout_s=float(os.environ.get("LLM_TIMEOUT_S", "15")),
+        llm_min_budget_s=float(os.environ.get("LLM_MIN_BUDGET_S", "0.5")),
+        web_concurrency=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        llm_rpm_limit=int(os.environ.get("LLM_RPM_LIMIT", "0")),
+        llm_tpm_limit=int(os.environ.get("LLM_TPM_LIMIT", "0")),
+        llm_rate_limit_retries=int(os.environ.get("LLM_RATE_LIMIT_RETRIES", "2")),
+        llm_rate_limit_max_wait_s=float(os.environ.get("LLM_RATE_LIMIT_MAX_WAIT_S", "30")),
+        llm_rate_limit_max_backoff_s=float(os.environ.get("LLM_RATE_LIMIT_MAX_BACKOFF_S", "30")),
+        circuit_breaker_enabled=_env_bool("CIRCUIT_BREAKER_ENABLED", True),
+        circuit_window=int(os.environ.get("CIRCUIT_WINDOW", "20")),
+        circuit_window_s=float(os.environ.get("CIRCUIT_WINDOW_S", "60")),
+        circuit_min_calls=int(os.environ.get("CIRCUIT_MIN_CALLS", "10")),
+        circuit_failure_rate=float(os.environ.get("CIRCUIT_FAILURE_RATE", "0.5")),
+        circuit_slow_call_s=float(os.environ.get("CIRCUIT_SLOW_CALL_S", "10")),
+        circuit_slow_call_rate=float(os.environ.get("CIRCUIT_SLOW_CALL_RATE", "0.8")),
+        circuit_open_s=float(os.environ.get("CIRCUIT_OPEN_S", "30")),
+        circuit_half_open_probes=int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", "2")),
+        llm_profiles=_llm_profiles(
+            os.environ.get("OPENAI_MODEL_CHAT", "gpt-4.1-mini"),
+            float(os.environ.get("LLM_TIMEOUT_S", "15")),
+        ),
+        llm_hedge_enabled=_env_bool("LLM_HEDGE_ENABLED", True),
+        llm_hedge_percentile=float(os.environ.get("LLM_HEDGE_PERCENTILE", "95")),
+        llm_hedge_min_delay_s=float(os.environ.get("LLM_HEDGE_MIN_DELAY_S", "0.3")),
+        llm_hedge_default_delay_s=float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY_S", "2.0")),
+        llm_hedge_min_samples=int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20")),
+        llm_hedge_budget=float(os.environ.get("LLM_HEDGE_BUDGET", "0.05")),
+        llm_cassette_mode=os.environ.get("LLM_CASSETTE_MODE", "off"),
+        llm_cassette_dir=os.environ.get("LLM_CASSETTE_DIR", ".cassettes"),
+        llm_cassette_on_miss=os.environ.get("LLM_CASSETTE_ON_MISS", "fail"),
+        tracing_exporter=os.environ.get("TRACING_EXPORTER", "off"),
+        tracing_jsonl_path=os.environ.get("TRACING_JSONL_PATH", "traces.jsonl"),
+        tracing_otlp_endpoint=os.environ.get("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+        tracing_service_name=os.environ.get("TRACING_SERVICE_NAME", "multi-agent"),
+        admin_token=os.environ.get("ADMIN_TOKEN", ""),
     )
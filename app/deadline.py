@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Mapping, Optional
+
+# Absolute time.monotonic() deadline of the request currently being served.
+# Set by the graph around every node so that deep helpers (LLM calls,
+# eligibility checks) can size their timeouts without threading it through.
+_current_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def make_deadline(timeout_s: Optional[float]) -> Optional[float]:
+    if timeout_s is None or timeout_s <= 0:
+        return None
+    return time.monotonic() + timeout_s
+
+
+def current_deadline() -> Optional[float]:
+    return _current_deadline.get()
+
+
+def remaining_time(deadline: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left before `deadline` (or the current request deadline),
+    or None when the request is unbounded.
+    """
+    if deadline is None:
+        deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_expired(deadline: Optional[float] = None, margin_s: float = 0.0) -> bool:
+    left = remaining_time(deadline)
+    return left is not None and left <= margin_s
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def budget_exhausted(state: Mapping[str, Any], margin_s: float = 0.0) -> bool:
+    """
+    True when a node should stop doing expensive work: the request deadline
+    has passed or the graph is about to hit its step limit.
+    """
+    remaining_steps = state.get("remaining_steps")
+    if remaining_steps is not None and remaining_steps <= 1:
+        return True
+    return deadline_expired(state.get("deadline"), margin_s=margin_s)
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+from functools import wraps
+
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 
 from app.state import State
 from app.config import get_settings
+from app.deadline import deadline_scope
+from app.tracing import span
 from app.agents.router import router_node, route_selector
 from app.agents.recommendation import recommendation_node
 from app.agents.policy_rag import policy_rag_node
@@ -33,15 +37,52 @@ def policy_rag_branch(state: State) -> str:
         return "__end__"
     return "low_confidence"
 
-def build_graph():
+def _with_deadline(node):
+    """
+    Expose the request deadline stored in the state to everything the node
+    calls (LLM timeouts are derived from it).
+    """
+    @wraps(node)
+    def wrapped(state: State) -> State:
+        with deadline_scope(state.get("deadline")):
+            return node(state)
+
+    return wrapped
+
+
+def _traced(name: str, node):
+    """
+    Run the node inside a `graph.<name>` span and record where it routed.
+    """
+    @wraps(node)
+    def wrapped(state: State) -> State:
+        with span(f"graph.{name}") as s:
+            result = node(state)
+            if isinstance(result, dict):
+                s.set_attributes({"intent": result.get("intent"), "error": result.get("error")})
+            return result
+
+    return wrapped
+
+
+def _node(name: str, node):
+    return _traced(name, _with_deadline(node))
+
+
+def build_graph(stateful: bool = True):
+    """
+    Compile the agent graph. `stateful=True` attaches an in-memory
+    checkpointer so a thread_id resumes a conversation; `stateful=False`
+    skips checkpointing entirely for single-shot requests.
+    """
     workflow = StateGraph(State)
 
     # --- Nodes ---
-    workflow.add_node("router", router_node)
-    workflow.add_node("recommendation", recommendation_node)
-    workflow.add_node("policy_rag", policy_rag_node)
-    workflow.add_node("clarification", clarification_node)
-    workflow.add_node("low_confidence", low_confidence_node)
+    workflow.add_node("router", _node("router", router_node))
+    workflow.add_node("recommendation", _node("recommendation", recommendation_node))
+    workflow.add_node("policy_rag", _node("policy_rag", policy_rag_node))
+    workflow.add_node("clarification", _node("clarification", clarification_node))
+    workflow.add_node("low_confidence", _node("low_confidence", low_confidence_node))
 
     workflow.set_entry_point("router")
 
@@ -76,7 +117,7 @@ def build_graph():
 
     workflow.add_edge("low_confidence", END)
 
-    checkpointer = MemorySaver()
+    checkpointer = MemorySaver() if stateful else None
 
     app = workflow.compile(checkpointer=checkpointer)
     return app
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent call latencies per call site.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, site: str, latency_s: float) -> None:
+        with self._lock:
+            self._samples[site].append(latency_s)
+
+    def count(self, site: str) -> int:
+        with self._lock:
+            return len(self._samples[site])
+
+    def percentile(self, site: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples[site])
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, max(0, int(round(pct / 100.0 * (len(samples) - 1)))))
+        return samples[idx]
+
+
+class HedgeBudget:
+    """
+    Token bucket that earns `ratio` of a hedge per call, so hedges stay within
+    `ratio` of total traffic (plus a small burst allowance).
+    """
+
+    def __init__(self, ratio: float, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def on_call(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class Hedger:
+    """
+    Runs a call and, if it has not returned after the site's latency
+    percentile, issues one duplicate and returns whichever finishes first.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_delay_s: float = 0.3,
+        default_delay_s: float = 2.0,
+        min_samples: int = 20,
+        budget_ratio: float = 0.05,
+        max_workers: int = 32,
+    ):
+        self.percentile = percentile
+        self.min_delay_s = min_delay_s
+        self.default_delay_s = default_delay_s
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(budget_ratio)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "hedges": 0, "hedge_wins": 0})
+        self._stats_lock = threading.Lock()
+
+    def hedge_delay(self, site: str) -> float:
+        if self.latencies.count(site) < self.min_samples:
+            return self.default_delay_s
+        observed = self.latencies.percentile(site, self.percentile) or self.default_delay_s
+        return max(self.min_delay_s, observed)
+
+    def _bump(self, site: str, key: str) -> None:
+        with self._stats_lock:
+            self._stats[site][key] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._stats_lock:
+            return {site: dict(counts) for site, counts in self._stats.items()}
+
+    def _submit(self, fn: Callable[[], T]) -> "Future[T]":
+        # Copy the caller's context so the request deadline follows the call.
+        ctx = contextvars.copy_context()
+        return self._executor.submit(ctx.run, fn)
+
+    def call(self, site: str, fn: Callable[[], T]) -> T:
+        self._bump(site, "calls")
+        self.budget.on_call()
+
+        start = time.monotonic()
+        primary = self._submit(fn)
+
+        def _record(f: Future) -> None:
+            if f.exception() is None:
+                self.latencies.record(site, time.monotonic() - start)
+
+        primary.add_done_callback(_record)
+
+        try:
+            return primary.result(timeout=self.hedge_delay(site))
+        except FuturesTimeout:
+            pass
+
+        if not self.budget.try_acquire():
+            return primary.result()
+
+        self._bump(site, "hedges")
+        hedge = self._submit(fn)
+
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = primary if primary in done else hedge
+        if first.exception() is not None:
+            # The first finisher failed; fall back to the other attempt.
+            other = hedge if first is primary else primary
+            wait([other])
+            if other.exception() is not None:
+                return primary.result()
+            first = other
+
+        if first is hedge:
+            self._bump(site, "hedge_wins")
+        return first.result()
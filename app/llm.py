@@ -1,24 +1,425 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
-from typing import List
-from app.config import get_settings
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.circuit_breaker import CLOSED, CircuitBreaker
+from app.config import LLMProfile, get_settings
+from app.deadline import remaining_time
+from app.hedging import Hedger
+from app.rate_limit import RateLimitScheduler, RateLimitTimeout, estimate_tokens, retry_after_from_headers
+from app.singleflight import SingleFlight
+from app.tracing import span
 
 settings = get_settings()
 
-def get_chat_llm():
+CASSETTE_MODES = ("off", "record", "replay")
+
+
+class LLMUnavailable(RuntimeError):
+    """The LLM could not be called; callers should fall back to a non-LLM path."""
+
+
+class LLMTimeout(LLMUnavailable, TimeoutError):
+    """The request deadline left no time for, or expired during, an LLM call."""
+
+
+class LLMCircuitOpen(LLMUnavailable):
+    """The circuit breaker is open; the LLM is not called until it recovers."""
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when no recorded response matches a request."""
+
+
+class LLMCassette:
+    """
+    Content-addressed store of LLM responses.
+
+    Each request (model, messages, params) is hashed into a key and its
+    response is stored as one compact JSON file under `<root>/<key[:2]>/<key>.json`.
+    """
+
+    def __init__(self, root: str, mode: str, on_miss: str = "fail"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode!r}")
+        if on_miss not in ("fail", "passthrough"):
+            raise ValueError(f"Unknown cassette miss policy: {on_miss!r}")
+        self.root = Path(root)
+        self.mode = mode
+        self.on_miss = on_miss
+
+    @staticmethod
+    def request_key(request: Dict[str, Any]) -> str:
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def load(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)["response"]
+
+    def save(self, key: str, request: Dict[str, Any], response: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name: threads and processes may record the same key.
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=path.parent, prefix=f".{key[:12]}.", suffix=".tmp", delete=False
+        ) as f:
+            json.dump(
+                {"request": request, "response": response},
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(f.name, path)
+
+
+@lru_cache()
+def get_cassette() -> Optional[LLMCassette]:
+    if settings.llm_cassette_mode == "off":
+        return None
+    return LLMCassette(
+        settings.llm_cassette_dir,
+        settings.llm_cassette_mode,
+        on_miss=settings.llm_cassette_on_miss,
+    )
+
+
+@lru_cache()
+def get_hedger() -> Hedger:
+    return Hedger(
+        percentile=settings.llm_hedge_percentile,
+        min_delay_s=settings.llm_hedge_min_delay_s,
+        default_delay_s=settings.llm_hedge_default_delay_s,
+        min_samples=settings.llm_hedge_min_samples,
+        budget_ratio=settings.llm_hedge_budget,
+    )
+
+
+def hedge_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Per call site: calls, hedges issued, and hedges that won the race.
+    """
+    return get_hedger().stats()
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimitScheduler:
+    return RateLimitScheduler(
+        rpm=settings.llm_rpm_limit,
+        tpm=settings.llm_tpm_limit,
+        max_backoff_s=settings.llm_rate_limit_max_backoff_s,
+        workers=settings.web_concurrency,
+    )
+
+
+def rate_limit_stats() -> Dict[str, Any]:
+    return get_rate_limiter().stats()
+
+
+@lru_cache()
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    if not settings.circuit_breaker_enabled:
+        return None
+    return CircuitBreaker(
+        window=settings.circuit_window,
+        window_s=settings.circuit_window_s,
+        min_calls=settings.circuit_min_calls,
+        failure_rate=settings.circuit_failure_rate,
+        slow_call_s=settings.circuit_slow_call_s,
+        slow_call_rate=settings.circuit_slow_call_rate,
+        open_s=settings.circuit_open_s,
+        half_open_probes=settings.circuit_half_open_probes,
+    )
+
+
+def llm_degraded() -> bool:
+    """True while the circuit breaker keeps (most) LLM calls from going out."""
+    breaker = get_circuit_breaker()
+    return breaker is not None and breaker.state != CLOSED
+
+
+def circuit_stats() -> Dict[str, Any]:
+    breaker = get_circuit_breaker()
+    return breaker.stats() if breaker is not None else {"state": "disabled"}
+
+
+def llm_profile(site: str) -> LLMProfile:
+    """
+    Model and request parameters for a call site (see LLM_PROFILE_DEFAULTS);
+    unknown sites get the chat model with MAX_TOKENS_PER_CALL.
+    """
+    profile = settings.llm_profiles.get(site)
+    if profile is None:
+        profile = LLMProfile(
+            model=settings.openai_model_chat,
+            max_tokens=settings.max_tokens_per_call,
+            timeout_s=settings.llm_timeout_s,
+        )
+    return profile
+
+
+def get_chat_llm(
+    timeout: Optional[float] = None,
+    max_retries: int = 2,
+    profile: Optional[LLMProfile] = None,
+):
+    from langchain_openai import ChatOpenAI
+
+    profile = profile or llm_profile("default")
     return ChatOpenAI(
-        model=settings.openai_model_chat,
-        temperature=0.1,
-        max_tokens=settings.max_tokens_per_call,
+        model=profile.model,
+        temperature=profile.temperature,
+        max_tokens=profile.max_tokens,
         openai_api_key=settings.openai_api_key,
+        base_url=settings.openai_base_url or None,
+        timeout=timeout if timeout is not None else profile.timeout_s,
+        max_retries=max_retries,
+        include_response_headers=True,
+        model_kwargs={"response_format": {"type": "json_object"}} if profile.json_mode else {},
     )
 
-def simple_chat_call(system_prompt: str, user_prompt: str) -> str:
-    llm = get_chat_llm()
-    resp = llm.invoke(
-        [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt),
-        ]
+
+def parse_json_reply(content: str) -> Any:
+    """
+    json.loads for model replies, tolerating a ```json fence around the
+    object (models add one without JSON mode).
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else text[3:]
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return json.loads(text)
+
+
+def _call_timeout(limit_s: float) -> Optional[float]:
+    """
+    Per-call timeout: the call site's LLM timeout, capped by whatever is left
+    of the current request deadline. Raises LLMTimeout when too little is left.
+    """
+    left = remaining_time()
+    if left is None:
+        return None
+    if left < settings.llm_min_budget_s:
+        raise LLMTimeout(f"Request deadline leaves {max(left, 0.0):.2f}s for the LLM call")
+    return min(left, limit_s)
+
+
+def _cassette_request(system_prompt: str, user_prompt: str, profile: LLMProfile) -> Dict[str, Any]:
+    messages: List[Dict[str, str]] = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    params: Dict[str, Any] = {
+        "temperature": profile.temperature,
+        "max_tokens": profile.max_tokens,
+    }
+    if profile.json_mode:
+        params["response_format"] = "json_object"
+    return {
+        "model": profile.model,
+        "messages": messages,
+        "params": params,
+    }
+
+
+def _invoke_chat(system_prompt: str, user_prompt: str, profile: LLMProfile) -> str:
+    import openai
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    breaker = get_circuit_breaker()
+    permit = breaker.allow() if breaker is not None else None
+    if breaker is not None and permit is None:
+        raise LLMCircuitOpen("LLM circuit is open; degraded mode")
+
+    limiter = get_rate_limiter()
+    # Tokenizing the prompt only pays off against a TPM limit.
+    estimate = (
+        estimate_tokens(profile.model, system_prompt, user_prompt, profile.max_tokens)
+        if limiter.counts_tokens
+        else 0
     )
+    # Outcome for the circuit breaker; None means the provider was never
+    # reached (deadline, rate-limit wait) and says nothing about its health.
+    outcome: Optional[str] = None
+    latency = 0.0
+    with span("llm.request", kind="client", model=profile.model, max_tokens=profile.max_tokens) as s:
+        try:
+            waited = 0.0
+            for attempt in range(settings.llm_rate_limit_retries + 1):
+                _call_timeout(profile.timeout_s)
+                left = remaining_time()
+                max_wait = settings.llm_rate_limit_max_wait_s
+                if left is not None:
+                    max_wait = min(max_wait, max(0.0, left - settings.llm_min_budget_s))
+                try:
+                    waited += limiter.acquire(profile.priority, estimate, timeout_s=max_wait)
+                except RateLimitTimeout as exc:
+                    raise LLMTimeout(str(exc)) from exc
+                timeout = _call_timeout(profile.timeout_s)
+                # Under a request deadline 429s are retried here, through the
+                # scheduler, and other retries cannot fit; without one the
+                # client keeps its own retries.
+                llm = get_chat_llm(timeout=timeout, max_retries=0 if timeout is not None else 2, profile=profile)
+                started = time.monotonic()
+                try:
+                    resp = llm.invoke(
+                        [
+                            SystemMessage(content=system_prompt),
+                            HumanMessage(content=user_prompt),
+                        ]
+                    )
+                except openai.RateLimitError as exc:
+                    # Counted in rate_limit_stats().
+                    limiter.on_rate_limited(retry_after_from_headers(exc.response.headers))
+                    if attempt == settings.llm_rate_limit_retries:
+                        outcome = "failed"
+                        raise LLMUnavailable("LLM provider rate limit exceeded") from exc
+                    continue
+                except openai.APITimeoutError as exc:
+                    # A timeout cut short by the request deadline says nothing
+                    # about the provider's health.
+                    if timeout is None or timeout >= profile.timeout_s:
+                        outcome = "failed"
+                    raise LLMTimeout(f"LLM call timed out after {timeout or profile.timeout_s:.2f}s") from exc
+                except openai.APIError as exc:
+                    outcome = "failed"
+                    raise LLMUnavailable(f"LLM provider error: {type(exc).__name__}") from exc
+                latency = time.monotonic() - started
+                outcome = "ok"
+                break
+        finally:
+            if permit is not None:
+                if outcome == "ok":
+                    breaker.record_success(permit, latency)
+                elif outcome == "failed":
+                    breaker.record_failure(permit)
+                else:
+                    breaker.release(permit)
+
+        usage = getattr(resp, "usage_metadata", None) or {}
+        limiter.sync_headers((getattr(resp, "response_metadata", None) or {}).get("headers"))
+        limiter.settle(estimate, usage.get("total_tokens"))
+        s.set_attributes(
+            {
+                "timeout_s": timeout,
+                "circuit_probe": permit.probe if permit is not None else False,
+                "rate_limit_wait_ms": round(waited * 1000, 1),
+                "rate_limit_retries": attempt,
+                "estimated_tokens": estimate or None,
+                "input_tokens": usage.get("input_tokens"),
+                "output_tokens": usage.get("output_tokens"),
+            }
+        )
     return resp.content if isinstance(resp.content, str) else str(resp.content)
+
+
+_llm_flight: Optional[SingleFlight] = None
+_llm_flight_lock = threading.Lock()
+
+
+def _get_llm_flight() -> SingleFlight:
+    global _llm_flight
+    if _llm_flight is None:
+        with _llm_flight_lock:
+            if _llm_flight is None:
+                _llm_flight = SingleFlight("llm", settings.singleflight_timeout_s)
+    return _llm_flight
+
+
+def _call_provider(
+    site: str,
+    system_prompt: str,
+    user_prompt: str,
+    hedge: bool,
+    record: Optional[Callable[[str], None]] = None,
+) -> str:
+    """
+    Identical concurrent prompts from the same call site share one provider
+    call (see app.singleflight). `record` runs on the reply of every call
+    actually made, not in followers served by a leader.
+    """
+    if not settings.singleflight_enabled:
+        return _call_provider_uncoalesced(site, system_prompt, user_prompt, hedge, record)
+    digest = hashlib.sha256(f"{system_prompt}\0{user_prompt}".encode("utf-8")).hexdigest()
+    return _get_llm_flight().do(
+        (site, digest),
+        lambda: _call_provider_uncoalesced(site, system_prompt, user_prompt, hedge, record),
+    )
+
+
+def _call_provider_uncoalesced(
+    site: str,
+    system_prompt: str,
+    user_prompt: str,
+    hedge: bool,
+    record: Optional[Callable[[str], None]] = None,
+) -> str:
+    profile = llm_profile(site)
+    if hedge and settings.llm_hedge_enabled:
+        content = get_hedger().call(site, lambda: _invoke_chat(system_prompt, user_prompt, profile))
+    else:
+        content = _invoke_chat(system_prompt, user_prompt, profile)
+    if record is not None:
+        record(content)
+    return content
+
+
+def simple_chat_call(
+    system_prompt: str,
+    user_prompt: str,
+    site: str = "default",
+    hedge: bool = False,
+) -> str:
+    """
+    Single system+user chat completion, returning the reply text.
+
+    All agent LLM calls go through here so the cassette can record them
+    (LLM_CASSETTE_MODE=record) or serve them offline (LLM_CASSETTE_MODE=replay).
+    `site` names the call site and selects its model profile (llm_profile);
+    `hedge=True` lets a stalled call be raced by a duplicate request (see
+    app.hedging).
+    """
+    profile = llm_profile(site)
+    with span("llm.chat", site=site, model=profile.model, hedge=hedge) as s:
+        cassette = get_cassette()
+        if cassette is None:
+            return _call_provider(site, system_prompt, user_prompt, hedge)
+
+        request = _cassette_request(system_prompt, user_prompt, profile)
+        key = cassette.request_key(request)
+        s.set_attribute("cassette", cassette.mode)
+
+        if cassette.mode == "replay":
+            recorded = cassette.load(key)
+            if recorded is not None:
+                s.set_attribute("cassette_hit", True)
+                return recorded
+            s.set_attribute("cassette_hit", False)
+            if cassette.on_miss == "fail":
+                raise CassetteMiss(f"No recorded LLM response for request {key[:12]}")
+            return _call_provider(site, system_prompt, user_prompt, hedge)
+
+        # Saved by the call that reached the provider (the single-flight
+        # leader), not again by every follower sharing its reply.
+        return _call_provider(
+            site,
+            system_prompt,
+            user_prompt,
+            hedge,
+            record=lambda content: cassette.save(key, request, content),
+        )
@@ -0,0 +1,169 @@
+"""
+On-demand profiling of a live worker, exposed through the /admin endpoints.
+
+CPU: a wall-clock stack sampler over all Python threads (no dependency, no
+restart). Threads parked in a lock, queue or selector wait (idle pool
+workers, the event loop between requests) are skipped unless asked for, so
+the profile shows where requests spend their time. Output is the folded-stack format read by flamegraph.pl, speedscope
+and inferno: one `thread;frame;frame;... count` line per distinct stack.
+
+Memory: tracemalloc snapshot diffs against a baseline, grouped by module
+(`app.agents.router`) or top-level package (`langgraph`, `chromadb`).
+tracemalloc slows allocations down, so it only runs between start and stop.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+MAX_CPU_PROFILE_S = 60.0
+# A thread whose innermost Python frame is in one of these modules is waiting.
+IDLE_MODULES = frozenset({"threading", "queue", "selectors"})
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+)
+
+_cpu_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+class ProfilerBusy(RuntimeError):
+    """Another CPU profile is already running in this worker."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_globals.get("__name__") in IDLE_MODULES
+
+
+def sample_cpu(seconds: float, interval_ms: float = 10.0, include_idle: bool = False) -> Dict[str, int]:
+    """
+    Sample the stacks of all other threads every `interval_ms` for `seconds`.
+    Returns folded stack -> sample count.
+    """
+    if not _cpu_lock.acquire(blocking=False):
+        raise ProfilerBusy("A CPU profile is already running")
+    try:
+        seconds = min(max(seconds, 0.1), MAX_CPU_PROFILE_S)
+        interval_s = max(interval_ms, 1.0) / 1000.0
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not include_idle and _is_idle(frame)):
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval_s)
+        return dict(counts)
+    finally:
+        _cpu_lock.release()
+
+
+def folded_stacks(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+def _module_index() -> Dict[str, str]:
+    index: Dict[str, str] = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path:
+            index[os.path.abspath(path)] = name
+    return index
+
+
+def _module_group(filename: str, index: Dict[str, str]) -> str:
+    name = index.get(os.path.abspath(filename))
+    if name is None:
+        return filename
+    # Our own code per module, third-party code per top-level package.
+    if name == "app" or name.startswith("app.") or name == "main":
+        return name
+    return name.split(".")[0]
+
+
+def memory_tracing() -> bool:
+    return tracemalloc.is_tracing()
+
+
+def start_memory_tracing(frames: int = 10) -> Dict[str, Any]:
+    """
+    Start tracemalloc (if needed) and take the baseline snapshot.
+    """
+    global _baseline
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+        _baseline = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    return {"tracing": True, "traced_bytes": current, "peak_bytes": peak}
+
+
+def stop_memory_tracing() -> Dict[str, Any]:
+    global _baseline
+    with _memory_lock:
+        _baseline = None
+        tracemalloc.stop()
+    return {"tracing": False}
+
+
+def memory_diff(top: int = 25, group: str = "module", reset: bool = False) -> Dict[str, Any]:
+    """
+    Allocation growth since the baseline. `group` is "module" or "line";
+    `reset` makes the current snapshot the new baseline.
+    """
+    global _baseline
+    with _memory_lock:
+        if not tracemalloc.is_tracing() or _baseline is None:
+            raise RuntimeError("Memory tracing is not running; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+        # Filtered like the snapshot, or tracemalloc's own allocations at
+        # baseline time show up as freed.
+        baseline = _baseline.filter_traces(_MEMORY_FILTERS)
+        if reset:
+            _baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+
+    if group == "line":
+        stats = snapshot.compare_to(baseline, "lineno")
+        rows = [
+            {
+                "site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                "size_diff": s.size_diff,
+                "size": s.size,
+                "count_diff": s.count_diff,
+            }
+            for s in stats[:top]
+        ]
+    else:
+        index = _module_index()
+        grouped: Dict[str, Dict[str, int]] = {}
+        for s in snapshot.compare_to(baseline, "filename"):
+            key = _module_group(s.traceback[0].filename, index)
+            row = grouped.setdefault(key, {"size_diff": 0, "size": 0, "count_diff": 0})
+            row["size_diff"] += s.size_diff
+            row["size"] += s.size
+            row["count_diff"] += s.count_diff
+        ordered = sorted(grouped.items(), key=lambda kv: -abs(kv[1]["size_diff"]))
+        rows = [{"site": key, **values} for key, values in ordered[:top]]
+
+    return {"traced_bytes": current, "peak_bytes": peak, "group": group, "top": rows}
@@ -0,0 +1,303 @@
+"""
+Client-side scheduling of LLM calls against the provider's rate limits.
+
+Every provider call first acquires capacity from two token buckets, one for
+requests per minute and one for tokens per minute. A call's token cost is
+estimated up front with tiktoken (prompt plus max_tokens, which is how the
+provider counts it) and settled against the actual usage afterwards.
+
+Waiting calls are served in priority order (lower value first, FIFO within
+a priority), so user-facing answers get capacity before classification and
+enrichment calls. On a 429 the scheduler pauses all calls for the provider's
+retry-after (or an exponential backoff when none is given) and lowers its
+effective rate, then raises it again gradually as calls succeed. Bursts are
+therefore held just under the limit instead of turning into retry storms.
+
+The buckets live in one process. With several workers the account limits
+are split evenly between them (`workers`), and so is the remaining capacity
+the provider reports.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+PRIORITY_ANSWER = 0
+PRIORITY_CLASSIFICATION = 1
+PRIORITY_ENRICHMENT = 2
+
+# Seconds of traffic a bucket may burst; providers enforce per-minute limits
+# over shorter windows too.
+BURST_S = 10.0
+# On a 429 the effective rate is multiplied by this factor, and recovers by
+# RECOVERY_STEP per successful call.
+BACKOFF_FACTOR = 0.7
+RECOVERY_STEP = 0.05
+MIN_RATE_FACTOR = 0.25
+
+# Per-message framing tokens in the chat format.
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class RateLimitTimeout(TimeoutError):
+    """A call could not get rate-limit capacity within its wait budget."""
+
+
+class TokenBucket:
+    """
+    Continuously refilled bucket; not thread-safe on its own. The level may go
+    negative when a call costs more than was reserved.
+    """
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.base_rate_per_s = rate_per_s
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A call larger than the whole bucket goes through once it is full.
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate_per_s
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+    def cap(self, remaining: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+
+def _make_bucket(per_minute: float) -> Optional[TokenBucket]:
+    if per_minute <= 0:
+        return None
+    rate = per_minute / 60.0
+    return TokenBucket(rate, max(1.0, rate * BURST_S))
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """OpenAI reset headers look like "1s", "6m0s" or "20ms"."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+def retry_after_from_headers(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        value = headers.get(name)
+        if value:
+            seconds = _parse_duration(value.strip())
+            if seconds is not None:
+                return seconds
+    return None
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """
+    tiktoken encoding for `model`, or None when it cannot be loaded (offline,
+    no BPE cache); cached either way so the download is tried once.
+    """
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as exc:
+        print(f"tiktoken unavailable for {model} ({type(exc).__name__}); estimating 4 characters per token")
+        return None
+
+
+def estimate_tokens(model: str, system_prompt: str, user_prompt: str, max_tokens: int) -> int:
+    """
+    Token cost the provider charges against the TPM limit: prompt tokens plus
+    the requested max_tokens.
+    """
+    text = system_prompt + user_prompt
+    encoding = _encoding(model)
+    if encoding is None:
+        prompt_tokens = len(text) // 4 + 1
+    else:
+        prompt_tokens = len(encoding.encode(text))
+    return prompt_tokens + 2 * _MESSAGE_OVERHEAD_TOKENS + max_tokens
+
+
+class RateLimitScheduler:
+    """
+    Priority queue in front of the provider. rpm / tpm are account-wide
+    limits shared by `workers` processes; <= 0 disables the corresponding
+    bucket. 429 backoff and priorities apply regardless.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_backoff_s: float = 30.0, workers: int = 1):
+        self.max_backoff_s = max_backoff_s
+        self._workers = max(1, workers)
+        self._requests = _make_bucket(rpm / self._workers if rpm > 0 else 0)
+        self._tokens = _make_bucket(tpm / self._workers if tpm > 0 else 0)
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        self._backoff_s = 0.0
+        self._rate_factor = 1.0
+        self._stats: Counter = Counter()
+        self._wait_total_s = 0.0
+
+    @property
+    def counts_tokens(self) -> bool:
+        """Whether calls need a token estimate (a TPM limit is set)."""
+        return self._tokens is not None
+
+    def _buckets(self) -> List[TokenBucket]:
+        return [b for b in (self._requests, self._tokens) if b is not None]
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self._blocked_until - now)
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+    def _set_rate_factor(self, factor: float) -> None:
+        self._rate_factor = min(1.0, max(MIN_RATE_FACTOR, factor))
+        for bucket in self._buckets():
+            bucket.rate_per_s = bucket.base_rate_per_s * self._rate_factor
+
+    def acquire(self, priority: int, tokens: int, timeout_s: Optional[float]) -> float:
+        """
+        Block until the call may be sent; returns the time waited. Raises
+        RateLimitTimeout after `timeout_s`.
+        """
+        start = time.monotonic()
+        deadline = None if timeout_s is None else start + timeout_s
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait: Optional[float] = None
+                    if self._waiters[0] == entry:
+                        wait = self._wait_time(tokens, now)
+                        if wait <= 0:
+                            heapq.heappop(self._waiters)
+                            if self._requests is not None:
+                                self._requests.take(1)
+                            if self._tokens is not None:
+                                self._tokens.take(tokens)
+                            waited = now - start
+                            self._stats["calls"] += 1
+                            if waited > 0.001:
+                                self._stats["delayed"] += 1
+                            self._wait_total_s += waited
+                            self._cond.notify_all()
+                            return waited
+                    if deadline is not None:
+                        if now >= deadline:
+                            self._stats["timeouts"] += 1
+                            raise RateLimitTimeout(f"No LLM rate-limit capacity within {timeout_s:.2f}s")
+                        wait = deadline - now if wait is None else min(wait, deadline - now)
+                    # Waiters behind the head sleep until the queue moves.
+                    self._cond.wait(wait)
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def settle(self, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        """A call succeeded: refund the unused estimate and recover the rate."""
+        with self._cond:
+            if self._tokens is not None and used_tokens is not None:
+                self._tokens.give(reserved_tokens - used_tokens)
+            self._backoff_s = 0.0
+            if self._rate_factor < 1.0:
+                self._set_rate_factor(self._rate_factor + RECOVERY_STEP)
+            self._cond.notify_all()
+
+    def sync_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Never assume more capacity than the provider reports remaining."""
+        if not headers:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for bucket, name in ((self._requests, "requests"), (self._tokens, "tokens")):
+                value = headers.get(f"x-ratelimit-remaining-{name}")
+                if bucket is None or value is None:
+                    continue
+                try:
+                    bucket.cap(float(value) / self._workers, now)
+                except ValueError:
+                    continue
+
+    def on_rate_limited(self, retry_after_s: Optional[float]) -> float:
+        """
+        The provider answered 429: pause every call for `retry_after_s` (or the
+        next exponential backoff step) and slow down. Returns the pause.
+        """
+        with self._cond:
+            self._stats["rate_limited"] += 1
+            if retry_after_s is None:
+                self._backoff_s = min(self.max_backoff_s, max(1.0, self._backoff_s * 2))
+                pause = self._backoff_s
+            else:
+                pause = min(self.max_backoff_s, max(0.0, retry_after_s))
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + pause)
+            for bucket in self._buckets():
+                bucket.cap(0.0, now)
+            self._set_rate_factor(self._rate_factor * BACKOFF_FACTOR)
+            self._cond.notify_all()
+            return pause
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            calls = self._stats["calls"]
+            return {
+                "calls": calls,
+                "delayed": self._stats["delayed"],
+                "rate_limited": self._stats["rate_limited"],
+                "timeouts": self._stats["timeouts"],
+                "queued": len(self._waiters),
+                "mean_wait_ms": round(self._wait_total_s * 1000 / calls, 1) if calls else 0.0,
+                "rate_factor": round(self._rate_factor, 3),
+                "paused_for_s": round(max(0.0, self._blocked_until - now), 2),
+            }
@@ -0,0 +1,146 @@
+"""
+Single-flight coalescing: concurrent callers asking for the same key share
+one execution.
+
+The first caller for a key (the leader) runs the work; callers arriving while
+it is in flight (followers) wait for its result instead of repeating it.
+Followers wait at most `timeout_s` (and never past their own request
+deadline); if the leader is too slow or fails, each follower runs the work
+itself, so one bad leader cannot stall or fail the others. Followers get a
+deep copy of the leader's result.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from app.deadline import remaining_time
+
+T = TypeVar("T")
+
+_registry: Dict[str, "_FlightStats"] = {}
+
+
+def normalize_key(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+class _FlightStats:
+    def __init__(self, name: str):
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def bump(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Per layer: leaders (executions), shared (followers served by a leader),
+    fallbacks (followers that ran the work themselves).
+    """
+    return {name: stats.snapshot() for name, stats in _registry.items()}
+
+
+def _follower_wait(timeout_s: float) -> float:
+    left = remaining_time()
+    return timeout_s if left is None else max(0.0, min(timeout_s, left))
+
+
+class _Call:
+    __slots__ = ("done", "result", "failed")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.failed = False
+
+
+class SingleFlight:
+    """
+    Thread-based single-flight for blocking work (retrieval, LLM calls).
+    """
+
+    def __init__(self, name: str, timeout_s: float):
+        self.timeout_s = timeout_s
+        self.stats = _FlightStats(name)
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            self.stats.bump("leaders")
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException:
+                call.failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        if call.done.wait(_follower_wait(self.timeout_s)) and not call.failed:
+            self.stats.bump("shared")
+            return copy.deepcopy(call.result)
+        self.stats.bump("fallbacks")
+        return fn()
+
+
+_LEADER_FAILED = object()
+
+
+class AsyncSingleFlight:
+    """
+    asyncio variant, used in front of the graph so that followers wait on the
+    event loop without holding a worker thread or an admission slot.
+    """
+
+    def __init__(self, name: str, timeout_s: float):
+        self.timeout_s = timeout_s
+        self.stats = _FlightStats(name)
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._calls[key] = future
+            self.stats.bump("leaders")
+            result: Any = _LEADER_FAILED
+            try:
+                result = await fn()
+                return result
+            finally:
+                self._calls.pop(key, None)
+                future.set_result(result)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), _follower_wait(self.timeout_s))
+        except asyncio.TimeoutError:
+            result = _LEADER_FAILED
+        if result is _LEADER_FAILED:
+            self.stats.bump("fallbacks")
+            return await fn()
+        self.stats.bump("shared")
+        return copy.deepcopy(result)
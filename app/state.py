@@ -4,6 +4,8 @@ from typing_extensions import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 from langgraph.managed.is_last_step import RemainingSteps
 
+from app.deadline import make_deadline
+
 
 Intent = Literal["product_recommendation", "policy_question", "clarification"]
 
@@ -26,10 +28,21 @@ class State(TypedDict, total=False):
 
     error: Optional[str]
 
+    # time.monotonic() deadline for the whole request (None = unbounded)
+    deadline: Optional[float]
+
 
-def make_initial_state(user_message: str, max_steps: int) -> State:
+def make_initial_state(
+    user_message: str,
+    max_steps: int,
+    timeout_s: Optional[float] = None,
+) -> State:
     """
     Create the initial State for a new /api/query call.
+    `max_steps` is enforced through the run config (see make_run_config).
+
+    Per-turn keys are reset explicitly so that a checkpointed thread never
+    carries a previous turn's response or deadline into this one.
     """
     return {
         "messages": [
@@ -38,4 +51,24 @@ def make_initial_state(user_message: str, max_steps: int) -> State:
                 "content": user_message,
             }
         ],
+        "intent": None,
+        "router_confidence": None,
+        "rag_query": None,
+        "rag_results": None,
+        "rag_confidence": None,
+        "response": None,
+        "error": None,
+        "deadline": make_deadline(timeout_s),
     }
+
+
+def make_run_config(thread_id: Optional[str], max_steps: int) -> Dict[str, Any]:
+    """
+    LangGraph run config: `recursion_limit` bounds the number of graph steps
+    and feeds `remaining_steps`. `thread_id` is only needed by the stateful
+    (checkpointed) graph.
+    """
+    config: Dict[str, Any] = {"recursion_limit": max_steps}
+    if thread_id is not None:
+        config["configurable"] = {"thread_id": thread_id}
+    return config
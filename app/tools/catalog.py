@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+PRODUCTS_PATH = Path(__file__).resolve().parent.parent / "data" / "products.json"
+
+WORLDWIDE_DESTINATIONS = {"monde entier", "world", "worldwide"}
+
+
+class CatalogError(ValueError):
+    """products.json could not be parsed or failed validation."""
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    One immutable, validated version of products.json plus the structures
+    derived from it. Readers grab a snapshot once per request and keep using
+    it even if a newer version is swapped in meanwhile.
+    """
+
+    version: str
+    products: List[Dict[str, Any]]
+    # product id -> product, in file order
+    by_id: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # per product id: short hash of that product's definition
+    fingerprints: Dict[str, str] = field(default_factory=dict)
+    purposes_norm: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    worldwide: Dict[str, bool] = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+
+def product_id(product: Dict[str, Any]) -> str:
+    name = str(product.get("name", "")).strip().lower()
+    return name.replace(" ", "_")
+
+
+def _validate_product(product: Any, idx: int) -> None:
+    if not isinstance(product, dict):
+        raise CatalogError(f"products[{idx}] must be an object")
+    if not str(product.get("name", "")).strip():
+        raise CatalogError(f"products[{idx}] has no name")
+    for key in ("age_min", "age_max", "duration_min_days", "duration_max_days"):
+        value = product.get(key)
+        if value is not None and not isinstance(value, int):
+            raise CatalogError(f"products[{idx}].{key} must be an integer")
+    for key in ("destinations", "purposes", "key_features"):
+        value = product.get(key, [])
+        if not isinstance(value, list):
+            raise CatalogError(f"products[{idx}].{key} must be a list")
+    if product.get("age_min") is not None and product.get("age_max") is not None:
+        if product["age_min"] > product["age_max"]:
+            raise CatalogError(f"products[{idx}] has age_min > age_max")
+
+
+def parse_catalog(raw: bytes) -> CatalogSnapshot:
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise CatalogError(f"products.json is not valid JSON: {exc}") from exc
+
+    if not isinstance(data, dict) or not isinstance(data.get("products"), list):
+        raise CatalogError("products.json must be an object with a 'products' list")
+
+    products: List[Dict[str, Any]] = data["products"]
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for idx, product in enumerate(products):
+        _validate_product(product, idx)
+        pid = product_id(product)
+        if pid in by_id:
+            raise CatalogError(f"duplicate product id {pid!r}")
+        by_id[pid] = product
+
+    fingerprints = {
+        pid: hashlib.sha256(
+            json.dumps(p, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        for pid, p in by_id.items()
+    }
+    purposes_norm = {
+        pid: tuple(str(x).strip().lower() for x in p.get("purposes") or [])
+        for pid, p in by_id.items()
+    }
+
+    return CatalogSnapshot(
+        version=hashlib.sha256(raw).hexdigest()[:12],
+        products=products,
+        by_id=by_id,
+        fingerprints=fingerprints,
+        purposes_norm=purposes_norm,
+        worldwide={
+            pid: any(str(d).strip().lower() in WORLDWIDE_DESTINATIONS for d in p.get("destinations") or [])
+            for pid, p in by_id.items()
+        },
+        loaded_at=time.time(),
+    )
+
+
+class CatalogManager:
+    """
+    Holds the current catalog snapshot and hot-reloads products.json.
+
+    A background thread polls the file; a changed file is parsed and
+    validated off the request path and swapped in atomically (a single
+    reference assignment). An invalid file is reported and ignored, so the
+    previous version keeps serving.
+    """
+
+    def __init__(self, path: Path = PRODUCTS_PATH, poll_interval_s: float = 2.0):
+        self.path = Path(path)
+        self.poll_interval_s = poll_interval_s
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._stat: Optional[Tuple[float, int]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def _file_stat(self) -> Tuple[float, int]:
+        st = os.stat(self.path)
+        return (st.st_mtime, st.st_size)
+
+    def current(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    def reload(self) -> bool:
+        """
+        Load the file if it changed. Returns True when a new version was
+        swapped in. Raises only if no version has been loaded yet.
+        """
+        with self._lock:
+            if not self.path.exists():
+                if self._snapshot is None:
+                    raise FileNotFoundError(f"products.json not found at {self.path}")
+                return False
+            stat = self._file_stat()
+            raw = self.path.read_bytes()
+            try:
+                snapshot = parse_catalog(raw)
+            except CatalogError as exc:
+                self.last_error = str(exc)
+                if self._snapshot is None:
+                    raise
+                print(f"Ignoring invalid products.json: {exc}")
+                self._stat = stat
+                return False
+
+            self._stat = stat
+            self.last_error = None
+            if self._snapshot is not None and snapshot.version == self._snapshot.version:
+                return False
+            self._snapshot = snapshot
+            return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval_s):
+            try:
+                if self._file_stat() != self._stat and self.reload():
+                    print(f"Catalog reloaded: version {self._snapshot.version}")
+            except OSError as exc:
+                self.last_error = str(exc)
+
+    def start_watching(self) -> None:
+        if self._thread is not None:
+            return
+        self.current()
+        self._thread = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_manager: Optional[CatalogManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_catalog() -> CatalogManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                from app.config import get_settings
+
+                _manager = CatalogManager(poll_interval_s=get_settings().catalog_poll_interval_s)
+    return _manager
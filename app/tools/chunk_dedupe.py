@@ -0,0 +1,157 @@
+"""
+Near-duplicate chunk detection for the policy index.
+
+The product notices share long stretches of boilerplate (definitions,
+claims procedure, exclusions), so many chunks are near-identical across
+products. Each chunk is reduced to a MinHash signature over word shingles;
+LSH banding proposes candidate pairs and the exact shingle Jaccard
+similarity decides. Groups are formed transitively and collapsed into their
+first chunk, which records every product and page the text appears in.
+
+Chunks that differ in any number are never merged: the notices reuse the
+same wording with different ceilings, excesses and durations, and those
+numbers are exactly what questions ask about.
+"""
+from __future__ import annotations
+
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# 32 bands of 4 rows: pairs from roughly 0.4 Jaccard up become candidates,
+# well below any useful threshold, so LSH misses almost nothing.
+BANDS = 32
+
+_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"\w+")
+# "150 000", "1.500,00", "30": French thousands separators included.
+_NUMBER_RE = re.compile(r"\d+(?:[ \u00a0\u202f.,]\d+)*")
+_NUMBER_SEP_RE = re.compile(r"[ \u00a0\u202f.,]")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> Set[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def numeric_tokens(text: str) -> Tuple[str, ...]:
+    """Numbers of `text` in order, separators stripped."""
+    return tuple(_NUMBER_SEP_RE.sub("", n) for n in _NUMBER_RE.findall(text))
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def minhash_signatures(shingle_sets: Sequence[Set[str]], num_perm: int = NUM_PERM, seed: int = 1) -> np.ndarray:
+    """
+    (len(shingle_sets) x num_perm) MinHash signatures using universal hashes
+    (a * h + b) mod p; with p < 2**31 every product fits in uint64.
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, _PRIME, size=(num_perm, 1)).astype(np.uint64)
+    b = rng.randint(0, _PRIME, size=(num_perm, 1)).astype(np.uint64)
+    signatures = np.full((len(shingle_sets), num_perm), _PRIME, dtype=np.uint64)
+    for row, shingle_set in enumerate(shingle_sets):
+        if not shingle_set:
+            continue
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set),
+        )
+        signatures[row] = ((a * hashes[None, :] + b) % np.uint64(_PRIME)).min(axis=1)
+    return signatures
+
+
+def _candidate_pairs(signatures: np.ndarray, bands: int) -> Set[Tuple[int, int]]:
+    rows_per_band = signatures.shape[1] // bands
+    pairs: Set[Tuple[int, int]] = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        start = band * rows_per_band
+        for i, sig in enumerate(signatures[:, start : start + rows_per_band]):
+            buckets[sig.tobytes()].append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def near_duplicate_groups(texts: Sequence[str], threshold: float) -> List[List[int]]:
+    """
+    Indices of `texts` grouped by near-duplication (shingle Jaccard >=
+    threshold and identical numbers, transitively). Groups are in
+    first-occurrence order and each group starts with its first member, which
+    is the one to keep.
+    """
+    sets = [shingles(t) for t in texts]
+    numbers = [numeric_tokens(t) for t in texts]
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(texts) > 1:
+        for i, j in _candidate_pairs(minhash_signatures(sets), BANDS):
+            if numbers[i] == numbers[j] and jaccard(sets[i], sets[j]) >= threshold:
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def collapse_near_duplicates(
+    ids: List[str],
+    texts: List[str],
+    metadatas: List[Dict[str, Any]],
+    threshold: float,
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """
+    Keep the first chunk of every near-duplicate group. Its metadata keeps
+    "product"/"section" of that first occurrence and gains:
+
+        occurrences   "EUROPAX@page:3|GLOBE TRAVELLER@page:5"
+        in_<product>  True for every product the text appears in
+
+    Chroma metadata values must be scalars, hence the joined string and the
+    per-product flags (which product filters match on).
+    """
+    from app.tools.policy_retriever import product_flag
+
+    groups = near_duplicate_groups(texts, threshold) if threshold > 0 else [[i] for i in range(len(texts))]
+    out_ids: List[str] = []
+    out_texts: List[str] = []
+    out_metas: List[Dict[str, Any]] = []
+    for group in groups:
+        first = group[0]
+        meta = dict(metadatas[first])
+        occurrences: List[str] = []
+        for i in group:
+            product = metadatas[i].get("product", "UNKNOWN")
+            occurrence = f"{product}@{metadatas[i].get('section', '')}"
+            if occurrence not in occurrences:
+                occurrences.append(occurrence)
+            meta[product_flag(product)] = True
+        meta["occurrences"] = "|".join(occurrences)
+        out_ids.append(ids[first])
+        out_texts.append(texts[first])
+        out_metas.append(meta)
+    return out_ids, out_texts, out_metas
@@ -0,0 +1,109 @@
+"""
+Micro-batching for query embeddings.
+
+Concurrent retrievals each embed a single short question, which leaves most
+of the CPU model's throughput unused. `EmbeddingBatcher` queues texts from
+all callers and runs the embedding function once per batch: a batch closes
+after `max_batch` texts or `max_wait_ms`, whichever comes first. A text that
+arrives while the batcher is idle is embedded straight away, so a lone
+request does not pay the wait window.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+EmbedFn = Callable[[List[str]], Sequence[Any]]
+
+
+@dataclass
+class _PendingEmbedding:
+    texts: List[str]
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[List[Any]] = None
+    error: Optional[BaseException] = None
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_fn: EmbedFn, max_batch: int = 32, max_wait_ms: float = 3.0):
+        self.embed_fn = embed_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._pending: List[_PendingEmbedding] = []
+        self._cond = threading.Condition()
+        self._busy = False
+        self._last_batch_end = 0.0
+        self._stats = {"batches": 0, "texts": 0, "max_batch": 0}
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, texts: List[str]) -> List[Any]:
+        if not texts:
+            return []
+        pending = _PendingEmbedding(texts=list(texts))
+        with self._cond:
+            self._pending.append(pending)
+            self._cond.notify()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result or []
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            stats: Dict[str, float] = dict(self._stats)
+        stats["mean_batch"] = stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _pending_texts(self) -> int:
+        return sum(len(p.texts) for p in self._pending)
+
+    def _idle(self) -> bool:
+        # Nothing ran within the last window: no concurrent traffic to wait for.
+        return not self._busy and time.monotonic() - self._last_batch_end > self.max_wait_s
+
+    def _next_batch(self) -> List[_PendingEmbedding]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            if not (len(self._pending) == 1 and self._idle()):
+                deadline = time.monotonic() + self.max_wait_s
+                while self._pending_texts() < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            batch: List[_PendingEmbedding] = []
+            n = 0
+            while self._pending and (not batch or n + len(self._pending[0].texts) <= self.max_batch):
+                p = self._pending.pop(0)
+                batch.append(p)
+                n += len(p.texts)
+            self._busy = True
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            texts = [t for p in batch for t in p.texts]
+            try:
+                vectors = list(self.embed_fn(texts))
+            except Exception as exc:
+                for p in batch:
+                    p.error = exc
+                    p.done.set()
+            else:
+                offset = 0
+                for p in batch:
+                    p.result = vectors[offset : offset + len(p.texts)]
+                    offset += len(p.texts)
+                    p.done.set()
+            with self._cond:
+                self._busy = False
+                self._last_batch_end = time.monotonic()
+                self._stats["batches"] += 1
+                self._stats["texts"] += len(texts)
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(texts))
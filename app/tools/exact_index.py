@@ -0,0 +1,358 @@
+"""
+Exact (brute-force) in-process vector index for the policy corpus.
+
+The corpus is a few thousand chunks at most, so one matrix-vector product
+over all chunk embeddings is cheaper than a round-trip through Chroma's
+client, SQLite metadata store and HNSW graph. Files live in
+`<vector_db_dir>/exact/<index version>.<dtype>/`; a directory is written
+under a temporary name and renamed into place, so an export never rewrites
+files a running worker has mapped:
+
+    embeddings.npy   float16 (N x D), or int8 with per-row scales.npy
+    offsets.npy      int64 (N + 1) byte offsets into records.bin
+    records.bin      concatenated UTF-8 JSON {id, content, **metadata}
+    products.npy     uint32 (N) bitmask of product codes per row (a chunk
+                     collapsed from near-duplicates belongs to several)
+    meta.json        dtype, dimension, product codes, index version
+
+Matrices are memory-mapped. Select it with RETRIEVER_BACKEND=exact.
+
+    python -m app.tools.exact_index build   # export from the Chroma collection
+    python -m app.tools.exact_index check   # recall parity against Chroma
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import get_settings
+from app.tools.policy_retriever import PolicyChunk, chunk_from_metadata
+from app.tracing import span
+
+EXACT_INDEX_DIRNAME = "exact"
+SUPPORTED_DTYPES = ("float16", "int8")
+# Rows upcast to float32 at a time; bounds the scratch memory of a query.
+_SCORE_BLOCK_ROWS = 4096
+
+
+def exact_index_root() -> Path:
+    return Path(get_settings().vector_db_dir) / EXACT_INDEX_DIRNAME
+
+
+def exact_index_dir(version: Optional[str] = None, dtype: Optional[str] = None) -> Path:
+    if version is None:
+        from app.tools.policy_retriever import get_index_version
+
+        version = get_index_version()
+    return exact_index_root() / f"{version or 'unversioned'}.{dtype or get_settings().exact_index_dtype}"
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_exact_index(
+    directory: Path,
+    ids: Sequence[str],
+    embeddings: np.ndarray,
+    documents: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    dtype: str = "float16",
+    index_version: Optional[str] = None,
+) -> None:
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported exact index dtype: {dtype!r}")
+
+    target = Path(directory)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Hidden names are skipped by _collect_old_versions.
+    directory = target.parent / f".{target.name}.tmp-{os.getpid()}-{int(time.time() * 1000)}"
+    directory.mkdir()
+    vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        np.save(directory / "embeddings.npy", quantized)
+        np.save(directory / "scales.npy", scales.astype(np.float32))
+    else:
+        np.save(directory / "embeddings.npy", vectors.astype(np.float16))
+
+    product_codes: List[str] = []
+    product_rows = np.zeros(len(ids), dtype=np.uint32)
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    with (directory / "records.bin").open("wb") as f:
+        for i, (doc_id, doc, meta) in enumerate(zip(ids, documents, metadatas)):
+            for product in chunk_from_metadata(doc, meta, 0.0).products:
+                if product not in product_codes:
+                    product_codes.append(product)
+                product_rows[i] |= np.uint32(1 << product_codes.index(product))
+            record = {"id": doc_id, "content": doc, **meta}
+            data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(directory / "offsets.npy", offsets)
+    np.save(directory / "products.npy", product_rows)
+
+    with (directory / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "dtype": dtype,
+                "dim": int(vectors.shape[1]) if len(vectors) else 0,
+                "count": len(ids),
+                "products": product_codes,
+                "product_encoding": "bitmask",
+                "index_version": index_version,
+            },
+            f,
+        )
+
+    # Readers only ever open a complete directory. A re-export of the same
+    # version moves the old directory aside first: its files stay valid for
+    # workers that have them mapped until they are unmapped.
+    stale = None
+    if target.exists():
+        stale = target.parent / f".{target.name}.old-{os.getpid()}-{int(time.time() * 1000)}"
+        os.replace(target, stale)
+    os.replace(directory, target)
+    if stale is not None:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+class ExactPolicyIndex:
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with (self.directory / "meta.json").open("r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.dtype = self.meta["dtype"]
+        self.embeddings = np.load(self.directory / "embeddings.npy", mmap_mode="r")
+        self.scales = (
+            np.load(self.directory / "scales.npy", mmap_mode="r") if self.dtype == "int8" else None
+        )
+        self.offsets = np.load(self.directory / "offsets.npy", mmap_mode="r")
+        self.products = np.load(self.directory / "products.npy", mmap_mode="r")
+        self._records_file = (self.directory / "records.bin").open("rb")
+        self._records = (
+            mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.meta["count"]
+            else b""
+        )
+
+    @property
+    def index_version(self) -> Optional[str]:
+        return self.meta.get("index_version")
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    def record(self, row: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._records[start:end].decode("utf-8"))
+
+    def _similarities(self, query_vectors: np.ndarray) -> np.ndarray:
+        n = len(self)
+        sims = np.empty((len(query_vectors), n), dtype=np.float32)
+        for start in range(0, n, _SCORE_BLOCK_ROWS):
+            end = min(n, start + _SCORE_BLOCK_ROWS)
+            block = np.asarray(self.embeddings[start:end], dtype=np.float32)
+            sims[:, start:end] = query_vectors @ block.T
+        if self.scales is not None:
+            sims *= self.scales
+        return sims
+
+    def query(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        product: Optional[str] = None,
+    ) -> List[List[PolicyChunk]]:
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+
+        sims = self._similarities(queries)
+        if product is not None:
+            if product not in self.meta["products"]:
+                return [[] for _ in range(len(queries))]
+            code = self.meta["products"].index(product)
+            if self.meta.get("product_encoding") == "bitmask":
+                mask = (self.products & np.uint32(1 << code)) == 0
+            else:
+                mask = self.products != code
+            sims[:, mask] = -np.inf
+
+        k = min(top_k, sims.shape[1])
+        results: List[List[PolicyChunk]] = []
+        for row_sims in sims:
+            top = np.argpartition(-row_sims, k - 1)[:k]
+            top = top[np.argsort(-row_sims[top])]
+            chunks: List[PolicyChunk] = []
+            for idx in top:
+                sim = float(row_sims[idx])
+                if not np.isfinite(sim):
+                    continue
+                rec = self.record(int(idx))
+                # Same scale as Chroma's default squared-L2 space on unit
+                # vectors, so CONFIDENCE_THRESHOLD keeps its meaning.
+                dist = max(0.0, 2.0 - 2.0 * sim)
+                chunks.append(chunk_from_metadata(rec.pop("content"), rec, 1.0 / (1.0 + dist), product))
+            results.append(chunks)
+        return results
+
+
+_index: Optional[ExactPolicyIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_exact_index() -> ExactPolicyIndex:
+    """
+    The exact index for the active index version; reloaded after the index
+    alias is switched to a new version.
+    """
+    global _index
+    directory = exact_index_dir()
+    index = _index
+    if index is None or index.directory != directory:
+        with _index_lock:
+            if _index is None or _index.directory != directory:
+                _index = ExactPolicyIndex(directory)
+            index = _index
+    return index
+
+
+def reset_exact_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def export_exact_index(
+    dtype: Optional[str] = None,
+    collection: Any = None,
+    version: Optional[str] = None,
+) -> int:
+    """
+    Copy ids, embeddings, documents and metadata out of a Chroma collection
+    (the active one by default) into the exact index files for `version`.
+    Returns the number of chunks exported.
+    """
+    from app.tools.policy_retriever import _get_policy_collection, get_index_version
+
+    dtype = dtype or get_settings().exact_index_dtype
+    if collection is None:
+        collection = _get_policy_collection()
+        version = get_index_version()
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    write_exact_index(
+        exact_index_dir(version, dtype),
+        ids=data["ids"],
+        embeddings=embeddings,
+        documents=data["documents"],
+        metadatas=data["metadatas"],
+        dtype=dtype,
+        index_version=version,
+    )
+    reset_exact_index()
+    _collect_old_versions()
+    return len(data["ids"])
+
+
+def _collect_old_versions(keep: int = 2) -> None:
+    """
+    Remove all but the `keep` most recent version directories; the previous
+    one stays for workers that have not switched yet. Temporary directories
+    left by an interrupted export are removed after an hour.
+    """
+    dirs = [d for d in exact_index_root().iterdir() if d.is_dir()]
+    cutoff = time.time() - 3600
+    for d in dirs:
+        if d.name.startswith(".") and d.stat().st_mtime < cutoff:
+            shutil.rmtree(d, ignore_errors=True)
+    versions = sorted(
+        (d for d in dirs if not d.name.startswith(".")),
+        key=lambda d: d.stat().st_mtime,
+        reverse=True,
+    )
+    for old in versions[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def ensure_exact_index() -> None:
+    """
+    Export the exact index if it is missing or was built from another index version.
+    """
+    from app.tools.policy_retriever import get_index_version
+
+    meta_path = exact_index_dir() / "meta.json"
+    if meta_path.exists():
+        with meta_path.open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("index_version") == get_index_version() and meta.get("dtype") == get_settings().exact_index_dtype:
+            return
+    export_exact_index()
+
+
+def query_exact(
+    questions: List[str],
+    top_k: int = 5,
+    product: Optional[str] = None,
+) -> List[List[PolicyChunk]]:
+    from app.tools.policy_retriever import embed_queries
+
+    embeddings = np.asarray(embed_queries(questions), dtype=np.float32)
+    with span("vector.query", backend="exact", queries=len(questions), top_k=top_k, product=product):
+        return get_exact_index().query(embeddings, top_k=top_k, product=product)
+
+
+def check_recall_parity(questions: Sequence[str], top_k: int = 5) -> Dict[str, float]:
+    """
+    Fraction of Chroma's top-k chunks that the exact index also returns
+    (recall@k), averaged over `questions`.
+    """
+    from app.tools.policy_retriever import _get_policy_collection
+
+    collection = _get_policy_collection()
+    index = get_exact_index()
+    ids_by_content: Dict[str, str] = {}
+    for row in range(len(index)):
+        rec = index.record(row)
+        ids_by_content[rec["content"]] = rec["id"]
+
+    recalls: List[float] = []
+    for question in questions:
+        reference = set(collection.query(query_texts=[question], n_results=top_k)["ids"][0])
+        exact = query_exact([question], top_k=top_k)[0]
+        found = {ids_by_content.get(c.content) for c in exact}
+        recalls.append(len(reference & found) / max(1, len(reference)))
+
+    return {
+        "questions": float(len(recalls)),
+        "mean_recall": float(np.mean(recalls)) if recalls else 0.0,
+        "min_recall": float(np.min(recalls)) if recalls else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        n = export_exact_index()
+        print(f"Exported {n} chunks to {exact_index_dir()} ({get_settings().exact_index_dtype}).")
+    elif command == "check":
+        from app.tools.faq_store import seed_questions
+
+        print(check_recall_parity(seed_questions()))
+    else:
+        raise SystemExit(f"Unknown command: {command!r} (expected 'build' or 'check')")
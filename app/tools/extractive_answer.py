@@ -0,0 +1,193 @@
+"""
+Extractive answers for policy questions with a clear retrieval winner.
+
+When the top chunk scores high and well ahead of the next one, the answer is
+usually stated in a sentence or two of that chunk. Instead of a generation
+call, the sentences of the top chunks are scored against the question with
+the local embedding model (the notices are French, the questions mostly
+English, so word overlap alone does not work) plus a small bonus for shared
+terms such as amounts and product names, and the best ones are quoted with
+their sources.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.tools.policy_retriever import PolicyChunk, embed_queries
+
+# Sentences are taken from this many top chunks.
+EXTRACTIVE_CHUNKS = 2
+MIN_SENTENCE_WORDS = 4
+MAX_SENTENCE_CHARS = 400
+LEXICAL_WEIGHT = 0.2
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+")
+# Bullets come out of pypdf as U+F0B7 or DEL depending on the font.
+_BULLET_RE = re.compile(r"^\s*[\-*\u2022\u25cf\uf0b7\x7f]\s*")
+_TERM_RE = re.compile(r"\w+")
+
+
+@dataclass
+class ExtractiveDecision:
+    taken: bool
+    reason: str
+    top_score: float
+    margin: float
+    sentence_score: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "taken": self.taken,
+            "reason": self.reason,
+            "top_score": round(self.top_score, 4),
+            "margin": round(self.margin, 4),
+            "sentence_score": None if self.sentence_score is None else round(self.sentence_score, 4),
+        }
+
+
+def _text_units(text: str) -> List[str]:
+    """
+    Re-join PDF lines: prose wrapped over several lines becomes one unit,
+    every bullet item its own.
+    """
+    units: List[str] = []
+    open_prose = False
+    for raw in text.splitlines():
+        bullet = _BULLET_RE.match(raw) is not None
+        line = _BULLET_RE.sub("", raw).strip()
+        if not line:
+            continue
+        continues = line[0].islower() or (open_prose and not bullet)
+        if units and continues:
+            units[-1] += " " + line
+        else:
+            units.append(line)
+            open_prose = not bullet
+        if line.endswith((".", "!", "?", ":", ";")):
+            open_prose = False
+    return units
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of a notice chunk; headings and fragments are dropped."""
+    sentences: List[str] = []
+    for unit in _text_units(text):
+        for sentence in _SENTENCE_END_RE.split(unit):
+            sentence = " ".join(sentence.split())
+            if len(_TERM_RE.findall(sentence)) < MIN_SENTENCE_WORDS:
+                continue
+            sentences.append(sentence[:MAX_SENTENCE_CHARS])
+    return sentences
+
+
+def _terms(text: str) -> set:
+    return {t for t in _TERM_RE.findall(text.lower()) if len(t) > 2 or t.isdigit()}
+
+
+def _lexical_overlap(question_terms: set, sentence: str) -> float:
+    if not question_terms:
+        return 0.0
+    return len(question_terms & _terms(sentence)) / len(question_terms)
+
+
+def _normalize(vectors: Sequence[Any]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+@lru_cache(maxsize=1024)
+def _chunk_sentences(content: str) -> Tuple[Tuple[str, ...], np.ndarray]:
+    """Sentences of a chunk with their normalized embeddings (chunks repeat a lot)."""
+    sentences = tuple(split_sentences(content))
+    if not sentences:
+        return sentences, np.zeros((0, 0), dtype=np.float32)
+    return sentences, _normalize(embed_queries(list(sentences)))
+
+
+def score_sentences_local(question: str, contents: List[str]) -> List[List[Tuple[str, float]]]:
+    """
+    Sentences of every chunk in `contents` with their cosine similarity to
+    the question.
+    """
+    question_vec = _normalize(embed_queries([question]))[0]
+    scored: List[List[Tuple[str, float]]] = []
+    for content in contents:
+        sentences, vectors = _chunk_sentences(content)
+        similarities = vectors @ question_vec if sentences else []
+        scored.append([(s, float(sim)) for s, sim in zip(sentences, similarities)])
+    return scored
+
+
+def score_sentences(question: str, contents: List[str]) -> List[List[Tuple[str, float]]]:
+    if get_settings().retriever_mode == "sidecar":
+        from app.tools.retriever_sidecar import score_sentences_via_sidecar
+
+        return score_sentences_via_sidecar(question, contents)
+    return score_sentences_local(question, contents)
+
+
+def retrieval_margin(chunks: List[PolicyChunk]) -> Tuple[float, float]:
+    """
+    Top retrieval score and its lead over the best chunk from another page.
+    Overlapping chunks of the same page score alike and say the same thing,
+    so they are not competitors.
+    """
+    if not chunks:
+        return 0.0, 0.0
+    top = chunks[0]
+    runner_up = next(
+        (c.score for c in chunks[1:] if (c.product, c.section) != (top.product, top.section)),
+        0.0,
+    )
+    return top.score, top.score - runner_up
+
+
+def extract_answer(
+    question: str,
+    chunks: List[PolicyChunk],
+) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+    """
+    Best-matching sentences from the top chunks as an answer dict (answer,
+    sources), plus the best sentence score; (None, score) when no sentence
+    is good enough.
+    """
+    settings = get_settings()
+    question_terms = _terms(question)
+    scored: List[Tuple[float, int, int, str]] = []
+    seen = set()
+    top = chunks[:EXTRACTIVE_CHUNKS]
+    for rank, sentences in enumerate(score_sentences(question, [c.content for c in top])):
+        for position, (sentence, similarity) in enumerate(sentences):
+            # Overlapping chunks repeat sentences.
+            if sentence in seen:
+                continue
+            seen.add(sentence)
+            score = similarity + LEXICAL_WEIGHT * _lexical_overlap(question_terms, sentence)
+            scored.append((score, rank, position, sentence))
+
+    if not scored:
+        return None, None
+    scored.sort(key=lambda s: s[0], reverse=True)
+    best = scored[0][0]
+    if best < settings.extractive_min_sentence_score:
+        return None, best
+
+    # Near-ties with the best sentence are kept, in notice order.
+    picked = [s for s in scored[: settings.extractive_max_sentences] if s[0] >= best - 0.1]
+    picked.sort(key=lambda s: (s[1], s[2]))
+
+    parts: List[str] = []
+    sources: List[Dict[str, str]] = []
+    for rank in dict.fromkeys(s[1] for s in picked):
+        chunk = chunks[rank]
+        text = " ".join(s[3] for s in picked if s[1] == rank)
+        parts.append(f"According to {', '.join(chunk.products or [chunk.product])} ({chunk.section}): {text}")
+        sources.append({"product": chunk.product, "section": chunk.section})
+    return {"answer": "\n".join(parts), "sources": sources}, best
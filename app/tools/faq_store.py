@@ -0,0 +1,321 @@
+"""
+Precomputed answers for the most frequent policy questions.
+
+An offline job answers a question list against the current policy index and
+stores each answer next to the question's embedding in a separate Chroma
+collection. `policy_rag_node` looks questions up here first and serves close
+matches without retrieval or an LLM call. Stored answers are tied to the
+index version they were generated from and are rebuilt when it changes.
+
+    python -m app.tools.faq_store [--traffic-log queries.jsonl] [--top N]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import get_settings
+
+FAQ_COLLECTION_NAME = "policy_faq"
+FAQ_STATE_FILE = "faq_store.json"
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+SEED_QUESTIONS_PATH = ROOT_DIR / "app" / "data" / "faq_questions.json"
+TEST_QUERIES_PATH = ROOT_DIR / "tests" / "test_queries.json"
+
+_rebuild_lock = threading.Lock()
+_rebuild_thread: Optional[threading.Thread] = None
+
+
+def _normalize_question(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def _state_path() -> str:
+    return os.path.join(get_settings().vector_db_dir, FAQ_STATE_FILE)
+
+
+_state_cache: Tuple[Optional[Tuple[int, int]], Dict[str, Any]] = (None, {})
+
+
+def _read_state() -> Dict[str, Any]:
+    """
+    The store's state file, re-read only when it changes: it is consulted on
+    every policy question.
+    """
+    global _state_cache
+    path = _state_path()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    key = (st.st_mtime_ns, st.st_size)
+    cached_key, cached = _state_cache
+    if cached_key == key:
+        return cached
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return cached
+    _state_cache = (key, state)
+    return state
+
+
+def _write_state(state: Dict[str, Any]) -> None:
+    path = _state_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def seed_questions() -> List[str]:
+    """
+    Curated FAQ list plus the policy questions from the regression set.
+    """
+    questions: List[str] = []
+    if SEED_QUESTIONS_PATH.exists():
+        with SEED_QUESTIONS_PATH.open("r", encoding="utf-8") as f:
+            questions.extend(json.load(f).get("questions", []))
+    if TEST_QUERIES_PATH.exists():
+        with TEST_QUERIES_PATH.open("r", encoding="utf-8") as f:
+            for q in json.load(f).get("test_queries", []):
+                if q.get("expected_type") == "policy_answer":
+                    questions.append(q["query"])
+    return questions
+
+
+def questions_from_traffic_log(path: Path, top_n: int = 50) -> List[str]:
+    """
+    Most frequent policy questions in a JSONL log with one {"message": ...}
+    object per line.
+    """
+    from app.agents.router import _heuristic_intent
+
+    counts: Counter = Counter()
+    originals: Dict[str, str] = {}
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            message = str(json.loads(line).get("message", ""))
+            intent, _ = _heuristic_intent(message)
+            if intent != "policy_question":
+                continue
+            key = _normalize_question(message)
+            counts[key] += 1
+            originals.setdefault(key, message.strip())
+    return [originals[k] for k, _ in counts.most_common(top_n)]
+
+
+def _dedupe(questions: Iterable[str]) -> List[str]:
+    seen = set()
+    out: List[str] = []
+    for q in questions:
+        key = _normalize_question(q)
+        if key and key not in seen:
+            seen.add(key)
+            out.append(q.strip())
+    return out
+
+
+@lru_cache(maxsize=4)
+def _open_faq_collection(name: str):
+    from app.tools.policy_retriever import _get_chroma_client, _get_embedding_function
+
+    return _get_chroma_client().get_collection(name=name, embedding_function=_get_embedding_function())
+
+
+def _get_faq_collection():
+    """The collection the state file points to (stores built before versioning used one fixed name)."""
+    return _open_faq_collection(_read_state().get("collection") or FAQ_COLLECTION_NAME)
+
+
+def _collect_old_faq_collections(keep: Iterable[str]) -> None:
+    from app.tools.policy_retriever import _get_chroma_client
+
+    keep = set(keep)
+    client = _get_chroma_client()
+    for c in client.list_collections():
+        name = getattr(c, "name", c)
+        if name.startswith(FAQ_COLLECTION_NAME) and name not in keep:
+            client.delete_collection(name)
+    _open_faq_collection.cache_clear()
+
+
+def build_faq_store(questions: Optional[List[str]] = None, only_if_stale: bool = False) -> int:
+    """
+    Answer every question against the current index and switch the store to
+    the new answers. Questions whose retrieval confidence is too low are
+    skipped. Returns the number of stored answers.
+
+    One process builds at a time. With only_if_stale (background rebuilds,
+    which every worker may trigger) a build already running elsewhere, or a
+    store that has become current meanwhile, makes this a no-op.
+    """
+    from app.tools.policy_retriever import build_lock
+
+    with build_lock(".faq_build.lock", blocking=not only_if_stale) as acquired:
+        if not acquired or (only_if_stale and faq_store_is_current()):
+            return 0
+        return _build_faq_store_locked(questions)
+
+
+def _build_faq_store_locked(questions: Optional[List[str]]) -> int:
+    from app.agents.policy_rag import (
+        CONFIDENCE_THRESHOLD,
+        _compute_confidence,
+        _generate_policy_answer,
+        _retrieval_scope,
+    )
+    from app.tools.policy_retriever import (
+        _get_chroma_client,
+        _get_embedding_function,
+        get_index_version,
+        retrieve_policy_chunks,
+    )
+
+    if questions is None:
+        questions = _read_state().get("questions") or seed_questions()
+    questions = _dedupe(questions)
+
+    index_version = get_index_version()
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+
+    for i, question in enumerate(questions):
+        # The same scoped retrieval as policy_rag_node, so a stored answer
+        # matches what the live path would say.
+        chunks = retrieve_policy_chunks(question, top_k=5, products=_retrieval_scope(question))
+        retrieval_conf = _compute_confidence(chunks)
+        if retrieval_conf < CONFIDENCE_THRESHOLD or not chunks:
+            continue
+        answer = _generate_policy_answer(question, chunks)
+        if not answer.get("sources"):
+            continue
+        response = {
+            "type": "policy_answer",
+            "answer": answer["answer"],
+            "confidence": float((retrieval_conf + answer.get("confidence", 0.0)) / 2.0),
+            "sources": answer["sources"],
+        }
+        ids.append(f"faq_{i}")
+        documents.append(question)
+        metadatas.append({"response": json.dumps(response, ensure_ascii=False)})
+
+    # Build next to the live collection and switch via the state file, so
+    # lookups never see a half-filled store.
+    name = f"{FAQ_COLLECTION_NAME}__{index_version or 'unversioned'}_{int(time.time() * 1000)}"
+    collection = _get_chroma_client().create_collection(name=name, embedding_function=_get_embedding_function())
+    if ids:
+        collection.add(ids=ids, documents=documents, metadatas=metadatas)
+
+    previous = _read_state().get("collection") or FAQ_COLLECTION_NAME
+    _write_state(
+        {"index_version": index_version, "collection": name, "questions": questions, "answers": len(ids)}
+    )
+    _collect_old_faq_collections(keep=[name, previous])
+    print(f"FAQ store: {len(ids)}/{len(questions)} answers for index version {index_version}.")
+    return len(ids)
+
+
+def _rebuild_in_background() -> None:
+    try:
+        build_faq_store(only_if_stale=True)
+    except Exception as exc:
+        print(f"FAQ store rebuild failed: {type(exc).__name__}: {exc}")
+
+
+def schedule_faq_rebuild() -> None:
+    """
+    Rebuild the store in a background thread (at most one at a time).
+    """
+    global _rebuild_thread
+    with _rebuild_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return
+        _rebuild_thread = threading.Thread(target=_rebuild_in_background, name="faq-rebuild", daemon=True)
+        _rebuild_thread.start()
+
+
+def faq_store_is_current() -> bool:
+    from app.tools.policy_retriever import get_index_version
+
+    state = _read_state()
+    return bool(state) and state.get("index_version") == get_index_version()
+
+
+def lookup_faq_local(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Stored response for the closest FAQ question, if it is similar enough and
+    was generated from the current index.
+    """
+    if not faq_store_is_current():
+        if _read_state():
+            schedule_faq_rebuild()
+        return None
+
+    from app.agents.router import detect_products
+    from app.tools.policy_retriever import embed_queries
+
+    try:
+        collection = _get_faq_collection()
+        if collection.count() == 0:
+            return None
+        # Through the batcher and its cache: retrieval reuses the vector on a miss.
+        results = collection.query(query_embeddings=embed_queries([question]), n_results=1)
+    except Exception:
+        # Collection switched or dropped by another process's rebuild.
+        _open_faq_collection.cache_clear()
+        return None
+    metadatas = (results.get("metadatas") or [[]])[0]
+    distances = (results.get("distances") or [[]])[0]
+    documents = (results.get("documents") or [[]])[0]
+    if not metadatas or distances[0] is None:
+        return None
+
+    similarity = 1.0 / (1.0 + float(distances[0]))
+    if similarity < get_settings().faq_min_similarity:
+        return None
+    # "Does ACS Expat cover baggage?" embeds close to the EUROPAX question;
+    # an answer about other products is not a hit.
+    if documents and sorted(detect_products(question)) != sorted(detect_products(documents[0])):
+        return None
+    return json.loads(metadatas[0]["response"])
+
+
+def lookup_faq(question: str) -> Optional[Dict[str, Any]]:
+    settings = get_settings()
+    if not settings.faq_enabled:
+        return None
+    if settings.retriever_mode == "sidecar":
+        from app.tools.retriever_sidecar import lookup_faq_via_sidecar
+
+        return lookup_faq_via_sidecar(question)
+    return lookup_faq_local(question)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the precomputed policy FAQ store.")
+    parser.add_argument("--traffic-log", type=Path, help="JSONL file of {\"message\": ...} queries")
+    parser.add_argument("--top", type=int, default=50, help="Top-N traffic questions to include")
+    args = parser.parse_args()
+
+    questions = seed_questions()
+    if args.traffic_log:
+        questions += questions_from_traffic_log(args.traffic_log, top_n=args.top)
+    build_faq_store(questions)
+
+
+if __name__ == "__main__":
+    main()
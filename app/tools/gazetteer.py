@@ -0,0 +1,257 @@
+"""
+Country and region gazetteer for destinations.
+
+Travellers write destinations in English or French ("Spain", "Espagne",
+"Thaïlande") while products.json lists them in French, so names are matched
+on an accent-free lowercase key. Every country carries the regions it belongs
+to, which decides coverage without an LLM: "Spain" is covered by a product
+listing "Espagne" or "Europe", "Morocco" by one listing "Afrique".
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+# Region -> aliases. Sub-regions list their parent in REGION_PARENTS.
+REGIONS: Dict[str, Tuple[str, ...]] = {
+    "world": ("world", "worldwide", "monde entier", "around the world", "everywhere"),
+    "europe": ("europe",),
+    "schengen": ("schengen", "schengen area", "espace schengen", "zone schengen"),
+    "eu": ("EU", "european union", "union europeenne"),
+    "asia": ("asia", "asie"),
+    "southeast_asia": ("southeast asia", "south-east asia", "asie du sud-est"),
+    "middle_east": ("middle east", "moyen-orient", "moyen orient"),
+    "americas": ("america", "americas", "amerique", "ameriques"),
+    "north_america": ("north america", "amerique du nord"),
+    "latin_america": ("latin america", "south america", "amerique latine", "amerique du sud"),
+    "caribbean": ("caribbean", "caraibes", "antilles"),
+    "africa": ("africa", "afrique"),
+    "oceania": ("oceania", "oceanie"),
+}
+
+REGION_PARENTS: Dict[str, Tuple[str, ...]] = {
+    "schengen": ("europe",),
+    "eu": ("europe",),
+    "southeast_asia": ("asia",),
+    "middle_east": ("asia",),
+    "north_america": ("americas",),
+    "latin_america": ("americas",),
+    "caribbean": ("americas",),
+}
+
+_EU_SCHENGEN = ("europe", "eu", "schengen")
+_SCHENGEN_ONLY = ("europe", "schengen")
+_EUROPE_ONLY = ("europe",)
+_EU_ONLY = ("europe", "eu")
+
+# Country -> (regions, aliases). The first alias is the English name.
+COUNTRIES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "France": (_EU_SCHENGEN, ("france",)),
+    "Spain": (_EU_SCHENGEN, ("spain", "espagne", "canary islands", "canaries", "baleares", "balearic islands")),
+    "Italy": (_EU_SCHENGEN, ("italy", "italie", "sicily", "sicile", "sardinia", "sardaigne")),
+    "Germany": (_EU_SCHENGEN, ("germany", "allemagne")),
+    "Portugal": (_EU_SCHENGEN, ("portugal", "madeira", "madere", "azores", "acores")),
+    "Belgium": (_EU_SCHENGEN, ("belgium", "belgique")),
+    "Netherlands": (_EU_SCHENGEN, ("netherlands", "pays-bas", "pays bas", "holland", "hollande")),
+    "Luxembourg": (_EU_SCHENGEN, ("luxembourg",)),
+    "Austria": (_EU_SCHENGEN, ("austria", "autriche")),
+    "Greece": (_EU_SCHENGEN, ("greece", "grece", "crete")),
+    "Malta": (_EU_SCHENGEN, ("malta", "malte")),
+    "Slovenia": (_EU_SCHENGEN, ("slovenia", "slovenie")),
+    "Croatia": (_EU_SCHENGEN, ("croatia", "croatie")),
+    "Slovakia": (_EU_SCHENGEN, ("slovakia", "slovaquie")),
+    "Czech Republic": (_EU_SCHENGEN, ("czech republic", "czechia", "republique tcheque", "tchequie")),
+    "Poland": (_EU_SCHENGEN, ("poland", "pologne")),
+    "Hungary": (_EU_SCHENGEN, ("hungary", "hongrie")),
+    "Denmark": (_EU_SCHENGEN, ("denmark", "danemark")),
+    "Sweden": (_EU_SCHENGEN, ("sweden", "suede")),
+    "Finland": (_EU_SCHENGEN, ("finland", "finlande")),
+    "Estonia": (_EU_SCHENGEN, ("estonia", "estonie")),
+    "Latvia": (_EU_SCHENGEN, ("latvia", "lettonie")),
+    "Lithuania": (_EU_SCHENGEN, ("lithuania", "lituanie")),
+    "Bulgaria": (_EU_SCHENGEN, ("bulgaria", "bulgarie")),
+    "Romania": (_EU_SCHENGEN, ("romania", "roumanie")),
+    "Ireland": (_EU_ONLY, ("ireland", "irlande")),
+    "Cyprus": (_EU_ONLY, ("cyprus", "chypre")),
+    "Switzerland": (_SCHENGEN_ONLY, ("switzerland", "suisse")),
+    "Norway": (_SCHENGEN_ONLY, ("norway", "norvege")),
+    "Iceland": (_SCHENGEN_ONLY, ("iceland", "islande")),
+    "Liechtenstein": (_SCHENGEN_ONLY, ("liechtenstein",)),
+    "United Kingdom": (
+        _EUROPE_ONLY,
+        ("united kingdom", "UK", "great britain", "britain", "england", "angleterre",
+         "royaume-uni", "royaume uni", "scotland", "ecosse", "wales", "pays de galles"),
+    ),
+    "Monaco": (_EUROPE_ONLY, ("monaco",)),
+    "Andorra": (_EUROPE_ONLY, ("andorra", "andorre")),
+    "Serbia": (_EUROPE_ONLY, ("serbia", "serbie")),
+    "Montenegro": (_EUROPE_ONLY, ("montenegro",)),
+    "Albania": (_EUROPE_ONLY, ("albania", "albanie")),
+    "Ukraine": (_EUROPE_ONLY, ("ukraine",)),
+    "Turkey": (("europe", "middle_east", "asia"), ("turkey", "turkiye", "turquie")),
+    "Russia": (("europe", "asia"), ("russia", "russie")),
+    "Morocco": (("africa",), ("morocco", "maroc")),
+    "Tunisia": (("africa",), ("tunisia", "tunisie")),
+    "Algeria": (("africa",), ("algeria", "algerie")),
+    "Egypt": (("africa", "middle_east"), ("egypt", "egypte")),
+    "Senegal": (("africa",), ("senegal",)),
+    "South Africa": (("africa",), ("south africa", "afrique du sud")),
+    "Kenya": (("africa",), ("kenya",)),
+    "Tanzania": (("africa",), ("tanzania", "tanzanie", "zanzibar")),
+    "Madagascar": (("africa",), ("madagascar",)),
+    "Mauritius": (("africa",), ("mauritius", "ile maurice")),
+    "Israel": (("middle_east",), ("israel",)),
+    "Jordan": (("middle_east",), ("jordan", "jordanie")),
+    "United Arab Emirates": (("middle_east",), ("united arab emirates", "UAE", "emirats arabes unis", "dubai", "abu dhabi")),
+    "Thailand": (("southeast_asia",), ("thailand", "thailande", "bangkok", "phuket")),
+    "Vietnam": (("southeast_asia",), ("vietnam", "viet nam")),
+    "Cambodia": (("southeast_asia",), ("cambodia", "cambodge")),
+    "Laos": (("southeast_asia",), ("laos",)),
+    "Indonesia": (("southeast_asia",), ("indonesia", "indonesie", "bali")),
+    "Malaysia": (("southeast_asia",), ("malaysia", "malaisie")),
+    "Singapore": (("southeast_asia",), ("singapore", "singapour")),
+    "Philippines": (("southeast_asia",), ("philippines",)),
+    "Japan": (("asia",), ("japan", "japon", "tokyo")),
+    "China": (("asia",), ("china", "chine")),
+    "South Korea": (("asia",), ("south korea", "korea", "coree du sud", "coree")),
+    "India": (("asia",), ("india", "inde")),
+    "Sri Lanka": (("asia",), ("sri lanka",)),
+    "Nepal": (("asia",), ("nepal",)),
+    "United States": (
+        ("north_america",),
+        ("united states", "USA", "US", "etats-unis", "etats unis", "new york", "california", "californie"),
+    ),
+    "Canada": (("north_america",), ("canada", "quebec")),
+    "Mexico": (("latin_america",), ("mexico", "mexique")),
+    "Brazil": (("latin_america",), ("brazil", "bresil")),
+    "Argentina": (("latin_america",), ("argentina", "argentine")),
+    "Chile": (("latin_america",), ("chile", "chili")),
+    "Peru": (("latin_america",), ("peru", "perou")),
+    "Colombia": (("latin_america",), ("colombia", "colombie")),
+    "Costa Rica": (("latin_america",), ("costa rica",)),
+    "Cuba": (("caribbean",), ("cuba",)),
+    "Dominican Republic": (("caribbean",), ("dominican republic", "republique dominicaine")),
+    "Australia": (("oceania",), ("australia", "australie")),
+    "New Zealand": (("oceania",), ("new zealand", "nouvelle-zelande", "nouvelle zelande")),
+    "French Polynesia": (("oceania",), ("french polynesia", "polynesie francaise", "tahiti")),
+}
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    # "country" or "region"; for a region, `name` is its REGIONS key.
+    kind: str
+    # Every region the place lies in, including its own key for a region.
+    regions: FrozenSet[str]
+
+
+def fold(text: str) -> str:
+    """Lowercase, accent-free form used for matching."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def _with_parents(regions: Iterable[str]) -> FrozenSet[str]:
+    out = set(regions)
+    for region in list(out):
+        out.update(REGION_PARENTS.get(region, ()))
+    return frozenset(out)
+
+
+def _is_acronym(alias: str) -> bool:
+    # "US", "UK", "EU", "UAE" are only matched in capitals, so "us" in a
+    # sentence is not the United States.
+    return alias.isupper()
+
+
+@lru_cache()
+def _aliases() -> List[Tuple[str, Place]]:
+    """(alias, place), longest alias first so "south africa" beats "africa"."""
+    entries: List[Tuple[str, Place]] = []
+    for key, aliases in REGIONS.items():
+        place = Place(key, "region", _with_parents([key]))
+        entries.extend((alias if _is_acronym(alias) else fold(alias), place) for alias in aliases)
+    for name, (regions, aliases) in COUNTRIES.items():
+        place = Place(name, "country", _with_parents(regions))
+        entries.extend((alias if _is_acronym(alias) else fold(alias), place) for alias in aliases)
+    entries.sort(key=lambda e: len(e[0]), reverse=True)
+    return entries
+
+
+@lru_cache()
+def _alias_pattern() -> "re.Pattern[str]":
+    alternatives = "|".join(re.escape(alias) for alias, _ in _aliases() if not _is_acronym(alias))
+    return re.compile(rf"(?<![\w-])(?:{alternatives})(?![\w-])")
+
+
+@lru_cache()
+def _acronym_pattern() -> "re.Pattern[str]":
+    alternatives = "|".join(re.escape(alias) for alias, _ in _aliases() if _is_acronym(alias))
+    return re.compile(rf"(?<![\w.])(?:{alternatives})(?![\w.])")
+
+
+@lru_cache()
+def _by_alias() -> Dict[str, Place]:
+    return {alias: place for alias, place in reversed(_aliases())}
+
+
+def resolve_place(name: str) -> Optional[Place]:
+    """The country or region `name` denotes, if the gazetteer knows it."""
+    stripped = name.strip()
+    if not stripped:
+        return None
+    by_alias = _by_alias()
+    key = fold(stripped).strip(" .!?")
+    return by_alias.get(stripped) or by_alias.get(key) or by_alias.get(key.upper())
+
+
+def find_places(text: str) -> List[Tuple[int, int, Place]]:
+    """
+    Places mentioned in free text as (start, end, place), in text order.
+    Longer names win over the names they contain.
+    """
+    by_alias = _by_alias()
+    # Folding keeps offsets for the Latin alphabet the gazetteer covers.
+    folded = fold(text)
+    if len(folded) != len(text):
+        folded = text.lower()
+    found = [(m.start(), m.end(), by_alias[m.group(0)]) for m in _alias_pattern().finditer(folded)]
+    found += [(m.start(), m.end(), by_alias[m.group(0)]) for m in _acronym_pattern().finditer(text)]
+    found.sort()
+    kept: List[Tuple[int, int, Place]] = []
+    for start, end, place in found:
+        if kept and start < kept[-1][1]:
+            continue
+        kept.append((start, end, place))
+    return kept
+
+
+def covers(allowed: Place, destination: Place) -> bool:
+    if "world" in allowed.regions:
+        return True
+    if allowed.kind == "country":
+        return destination.kind == "country" and destination.name == allowed.name
+    return allowed.name in destination.regions
+
+
+def destination_covered(destination: str, allowed: Sequence[str]) -> Optional[bool]:
+    """
+    True/False when the gazetteer knows the destination and can decide from
+    the allowed list; None when it cannot (unknown destination, or not
+    covered by known entries while some entries are unknown).
+    """
+    place = resolve_place(destination)
+    if place is None:
+        return None
+    unknown = False
+    for entry in allowed:
+        allowed_place = resolve_place(str(entry))
+        if allowed_place is None:
+            unknown = True
+        elif covers(allowed_place, place):
+            return True
+    return None if unknown else False
@@ -1,18 +1,41 @@
 from __future__ import annotations
 
+import contextvars
+import fcntl
+import hashlib
+import json
+import math
 import os
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
-
-import chromadb
-from chromadb.utils import embedding_functions
-from pypdf import PdfReader
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from app.config import get_settings
+from app.singleflight import SingleFlight, normalize_key
+from app.tracing import span
 
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+COLLECTION_NAME = "travel_insurance_policies"
+INDEX_ALIAS_FILE = "index_alias.json"
+# Written by indexes built before the alias existed; still read as a fallback.
+INDEX_VERSION_FILE = "index_version.json"
+INDEX_ADD_BATCH = 256
+# Recent query embeddings: the FAQ lookup, every product of a comparison
+# fan-out and the extractive step embed the same question.
+QUERY_EMBEDDING_CACHE_SIZE = 512
+
+POLICY_PDFS: List[Tuple[str, Path]] = [
+    ("EUROPAX", DATA_DIR / "notice_europax.pdf"),
+    ("GLOBE TRAVELLER", DATA_DIR / "notice_globe.pdf"),
+]
+INDEXED_PRODUCTS: Tuple[str, ...] = tuple(name for name, _ in POLICY_PDFS)
 
 @dataclass
 class PolicyChunk:
@@ -20,9 +43,42 @@ class PolicyChunk:
     product: str
     section: str
     score: float
+    # Every product the text appears in; near-duplicate chunks are stored
+    # once for all products that share them.
+    products: List[str] = field(default_factory=list)
+
+
+def product_flag(product: str) -> str:
+    """Metadata key marking a chunk as part of `product`'s notice."""
+    return "in_" + product.lower().replace(" ", "_")
+
+
+def product_filter(product: str) -> Dict[str, Any]:
+    # Collections built before dedupe only carry "product".
+    return {"$or": [{"product": product}, {product_flag(product): True}]}
+
+
+def chunk_from_metadata(
+    content: str,
+    meta: Dict[str, Any],
+    score: float,
+    product: Optional[str] = None,
+) -> PolicyChunk:
+    """
+    PolicyChunk for a stored chunk. With a product filter, the chunk is
+    reported under that product and its page in that product's notice.
+    """
+    occurrences = [
+        tuple(o.split("@", 1)) for o in (meta.get("occurrences") or "").split("|") if "@" in o
+    ] or [(meta.get("product", "UNKNOWN"), meta.get("section", ""))]
+    products = list(dict.fromkeys(p for p, _ in occurrences))
+    chosen = next((o for o in occurrences if o[0] == product), occurrences[0])
+    return PolicyChunk(content=content, product=chosen[0], section=chosen[1], score=score, products=products)
 
 
 def _load_pdf_text(pdf_path: Path) -> List[Tuple[int, str]]:
+    from pypdf import PdfReader
+
     reader = PdfReader(str(pdf_path))
     pages: List[Tuple[int, str]] = []
     for i, page in enumerate(reader.pages):
@@ -60,7 +116,10 @@ def _split_text_into_chunks(
     return chunks
 
 
+@lru_cache()
 def _get_chroma_client():
+    import chromadb
+
     settings = get_settings()
     persist_dir = settings.vector_db_dir
     os.makedirs(persist_dir, exist_ok=True)
@@ -68,39 +127,233 @@ def _get_chroma_client():
     return client
 
 
+@lru_cache()
+def _get_embedding_function():
+    from chromadb.utils import embedding_functions
 
-def _get_policy_collection():
-    
-    client = _get_chroma_client()
+    return embedding_functions.DefaultEmbeddingFunction()
 
-    collection = client.get_or_create_collection(
-        name="travel_insurance_policies",
+
+_embedding_batcher = None
+_embedding_batcher_lock = threading.Lock()
+
+
+def _get_embedding_batcher():
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        with _embedding_batcher_lock:
+            if _embedding_batcher is None:
+                from app.tools.embedding_batcher import EmbeddingBatcher
+
+                settings = get_settings()
+                _embedding_batcher = EmbeddingBatcher(
+                    _get_embedding_function(),
+                    max_batch=settings.embed_batch_size,
+                    max_wait_ms=settings.embed_batch_wait_ms,
+                )
+    return _embedding_batcher
+
+
+_query_embeddings: "OrderedDict[str, Any]" = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+
+def embed_queries(questions: List[str]) -> List[Any]:
+    """
+    Query embeddings, batched with other concurrent callers unless
+    EMBED_BATCH_SIZE is 1. Recently embedded texts are served from a small
+    cache, so a question is embedded once per request.
+    """
+    found: Dict[str, Any] = {}
+    with _query_embeddings_lock:
+        for q in questions:
+            if q in _query_embeddings:
+                _query_embeddings.move_to_end(q)
+                found[q] = _query_embeddings[q]
+    missing = [q for q in dict.fromkeys(questions) if q not in found]
+    if missing:
+        batched = get_settings().embed_batch_size > 1
+        with span("embedding", texts=len(missing), batched=batched):
+            if batched:
+                vectors = _get_embedding_batcher().embed(missing)
+            else:
+                vectors = list(_get_embedding_function()(missing))
+        found.update(zip(missing, vectors))
+        with _query_embeddings_lock:
+            for q, vector in zip(missing, vectors):
+                _query_embeddings[q] = vector
+            while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                _query_embeddings.popitem(last=False)
+    return [found[q] for q in questions]
+
+
+def embedding_batch_stats() -> Dict[str, float]:
+    if _embedding_batcher is None:
+        return {}
+    return _embedding_batcher.stats()
+
+
+@lru_cache(maxsize=4)
+def _open_collection(name: str):
+    if name != COLLECTION_NAME:
+        # Aliased collections are created by the build; one that has gone
+        # missing must fail loudly rather than serve an empty index.
+        return _get_chroma_client().get_collection(name=name, embedding_function=_get_embedding_function())
+    return _get_chroma_client().get_or_create_collection(
+        name=name,
+        embedding_function=_get_embedding_function(),
     )
-    return collection
 
 
-def build_policy_index(force_rebuild: bool = False):
+def _get_policy_collection():
+    """
+    Handle on the collection the index alias currently points to. Handles
+    are cached per collection name, so a switched alias is picked up on the
+    next query without reopening anything else.
+    """
+    return _open_collection(read_index_alias()["collection"])
+
+
+@contextmanager
+def build_lock(filename: str = ".build.lock", blocking: bool = True) -> Iterator[bool]:
+    """
+    Exclusive cross-process lock in the vector store directory. Yields
+    whether it was acquired; with blocking=False it yields False at once if
+    another process holds it.
+    """
     settings = get_settings()
-    collection = _get_policy_collection()
+    os.makedirs(settings.vector_db_dir, exist_ok=True)
+    lock_path = os.path.join(settings.vector_db_dir, filename)
+    with open(lock_path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _index_build_lock():
+    """
+    Exclusive cross-process lock so that concurrent workers (or a worker and
+    the retriever sidecar) never build the index at the same time.
+    """
+    with build_lock():
+        yield
+
+
+class IndexValidationError(RuntimeError):
+    """A freshly built collection failed validation and was not switched in."""
+
+
+def _alias_path() -> str:
+    return os.path.join(get_settings().vector_db_dir, INDEX_ALIAS_FILE)
+
+
+def _legacy_alias() -> Dict[str, Any]:
+    # Indexes built before aliases: one fixed collection plus a version file.
+    try:
+        with open(os.path.join(get_settings().vector_db_dir, INDEX_VERSION_FILE), "r", encoding="utf-8") as f:
+            version = json.load(f).get("version")
+    except (OSError, ValueError):
+        version = None
+    return {"collection": COLLECTION_NAME, "version": version}
+
+
+_alias_cache: Tuple[Optional[Tuple[int, int]], Dict[str, Any]] = (None, {})
+
+
+def read_index_alias() -> Dict[str, Any]:
+    """
+    The active index: {"collection", "version", "chunks", "switched_at"}.
+    Re-read only when the alias file changes, so other processes (workers,
+    the retriever sidecar) follow a switch on their next query.
+    """
+    global _alias_cache
+    path = _alias_path()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return _legacy_alias()
+    key = (st.st_mtime_ns, st.st_size)
+    cached_key, cached = _alias_cache
+    if cached_key == key:
+        return cached
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            alias = json.load(f)
+    except (OSError, ValueError):
+        return cached or _legacy_alias()
+    _alias_cache = (key, alias)
+    return alias
+
+
+def _write_index_alias(collection: str, version: str, chunks: int) -> None:
+    path = _alias_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(
+            {"collection": collection, "version": version, "chunks": chunks, "switched_at": time.time()},
+            f,
+        )
+    os.replace(tmp, path)
 
-    if force_rebuild:
-        collection.delete(where={})
 
-    pdfs = [
-        ("EUROPAX", DATA_DIR / "notice_europax.pdf"),
-        ("GLOBE TRAVELLER", DATA_DIR / "notice_globe.pdf"),
-    ]
+def get_index_version() -> Optional[str]:
+    """
+    Content hash of the active policy index, or None if the index was built
+    before versions were recorded.
+    """
+    return read_index_alias().get("version")
 
-    print("Building policy index...")
 
+def _content_version(ids: List[str], texts: List[str]) -> str:
+    digest = hashlib.sha256()
+    for doc_id, text in zip(ids, texts):
+        digest.update(doc_id.encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def build_policy_index(force_rebuild: bool = False) -> bool:
+    """
+    Build the index if it is empty (or always, with force_rebuild).
+    Returns True when a new index was switched in.
+    """
+    with _index_build_lock():
+        built = _build_policy_index_locked(force_rebuild)
+        if get_settings().retriever_backend == "exact":
+            from app.tools.exact_index import ensure_exact_index
+
+            ensure_exact_index()
+
+    if built and get_settings().faq_enabled:
+        from app.tools.faq_store import schedule_faq_rebuild
+
+        schedule_faq_rebuild()
+    return built
+
+
+def _load_policy_pages() -> List[Tuple[str, List[Tuple[int, str]]]]:
+    return [(product_name, _load_pdf_text(pdf_path)) for product_name, pdf_path in POLICY_PDFS]
+
+
+def _chunk_policy_pages(
+    pages_by_product: List[Tuple[str, List[Tuple[int, str]]]],
+    max_chars: int = 1200,
+    overlap: int = 200,
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
     ids: List[str] = []
     texts: List[str] = []
     metadatas: List[Dict[str, Any]] = []
 
-    for product_name, pdf_path in pdfs:
-        pages = _load_pdf_text(pdf_path)
+    for product_name, pages in pages_by_product:
         for page_num, page_text in pages:
-            chunks = _split_text_into_chunks(page_text)
+            chunks = _split_text_into_chunks(page_text, max_chars=max_chars, overlap=overlap)
             for idx, chunk in enumerate(chunks):
                 doc_id = f"{product_name.lower().replace(' ', '_')}_p{page_num}_c{idx}"
                 ids.append(doc_id)
@@ -111,47 +364,279 @@ def build_policy_index(force_rebuild: bool = False):
                         "section": f"page:{page_num}",
                     }
                 )
+    return ids, texts, metadatas
+
+
+def _load_policy_chunks() -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    return _chunk_policy_pages(_load_policy_pages())
+
+
+def _validate_collection(collection, ids: List[str], texts: List[str]) -> None:
+    count = collection.count()
+    if count != len(ids):
+        raise IndexValidationError(f"expected {len(ids)} chunks, collection has {count}")
+    for product in INDEXED_PRODUCTS:
+        if not collection.get(where=product_filter(product), limit=1, include=[])["ids"]:
+            raise IndexValidationError(f"no chunks for product {product}")
+    # Smoke query: a chunk's own text must find that chunk.
+    found = collection.query(query_texts=[texts[0]], n_results=3, include=[])["ids"][0]
+    if ids[0] not in found:
+        raise IndexValidationError(f"smoke query for {ids[0]} returned {found}")
+
+
+def _collect_old_collections(keep: Sequence[str]) -> None:
+    """
+    Drop policy collections other than `keep`. The previous version is kept
+    for one more rebuild so queries that already hold its handle can finish.
+    """
+    client = _get_chroma_client()
+    for c in client.list_collections():
+        name = getattr(c, "name", c)
+        if name.startswith(COLLECTION_NAME) and name not in keep:
+            client.delete_collection(name)
+            print(f"Dropped old policy collection '{name}'.")
+    _open_collection.cache_clear()
+
+
+def _active_collection_count() -> int:
+    try:
+        return _get_policy_collection().count()
+    except Exception as exc:
+        print(f"Active policy collection unavailable ({type(exc).__name__}: {exc}); rebuilding.")
+        return 0
+
+
+def _build_policy_index_locked(force_rebuild: bool) -> bool:
+    if not force_rebuild and _active_collection_count() > 0:
+        return False
 
+    print("Building policy index...")
+    ids, texts, metadatas = _load_policy_chunks()
     if not texts:
         raise RuntimeError("No policy text found to index.")
+    threshold = get_settings().index_dedupe_threshold
+    if threshold > 0:
+        from app.tools.chunk_dedupe import collapse_near_duplicates
+
+        loaded = len(ids)
+        ids, texts, metadatas = collapse_near_duplicates(ids, texts, metadatas, threshold)
+        print(f"Collapsed {loaded - len(ids)} near-duplicate chunks ({loaded} -> {len(ids)}).")
+
+    # Blue/green: build and validate a new collection next to the live one,
+    # then switch the alias. Queries keep hitting the old one meanwhile.
+    version = _content_version(ids, texts)
+    name = f"{COLLECTION_NAME}__{version}_{int(time.time() * 1000)}"
+    client = _get_chroma_client()
+    collection = client.create_collection(name=name, embedding_function=_get_embedding_function())
+    try:
+        for start in range(0, len(ids), INDEX_ADD_BATCH):
+            end = start + INDEX_ADD_BATCH
+            collection.add(ids=ids[start:end], documents=texts[start:end], metadatas=metadatas[start:end])
+        _validate_collection(collection, ids, texts)
+    except Exception:
+        client.delete_collection(name)
+        raise
+
+    if get_settings().retriever_backend == "exact":
+        from app.tools.exact_index import export_exact_index
+
+        # Exact-index workers open the new version's files as soon as the
+        # alias switches, so they must exist first.
+        export_exact_index(collection=collection, version=version)
+
+    previous = read_index_alias()["collection"]
+    _write_index_alias(name, version, len(ids))
+    _collect_old_collections(keep=[name, previous])
+    print(f"Indexed {len(texts)} chunks into '{name}' (version {version}).")
+    return True
+
+
+_rebuild_lock = threading.Lock()
+_rebuild_thread: Optional[threading.Thread] = None
+_rebuild_status: Dict[str, Any] = {"running": False, "last_error": None, "last_built": None}
+
+
+def _rebuild_in_background() -> None:
+    try:
+        build_policy_index(force_rebuild=True)
+        _rebuild_status["last_built"] = get_index_version()
+        _rebuild_status["last_error"] = None
+    except Exception as exc:
+        _rebuild_status["last_error"] = f"{type(exc).__name__}: {exc}"
+        print(f"Policy index rebuild failed: {_rebuild_status['last_error']}")
+    finally:
+        _rebuild_status["running"] = False
+
+
+def schedule_index_rebuild() -> bool:
+    """
+    Rebuild the index in a background thread. Returns False if a rebuild is
+    already running.
+    """
+    global _rebuild_thread
+    with _rebuild_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return False
+        _rebuild_status["running"] = True
+        _rebuild_thread = threading.Thread(target=_rebuild_in_background, name="index-rebuild", daemon=True)
+        _rebuild_thread.start()
+        return True
+
+
+def index_status() -> Dict[str, Any]:
+    return {"active": read_index_alias(), "rebuild": dict(_rebuild_status)}
+
+
+def warm_up_retriever() -> None:
+    """
+    Load the embedding model and the HNSW index so the first real query
+    does not pay for it.
+    """
+    _get_embedding_function()(["warm-up"])
+    if get_settings().retriever_backend == "exact":
+        query_policy_chunks_batch(["warm-up"], top_k=1)
+        return
+    collection = _get_policy_collection()
+    if collection.count() > 0:
+        collection.query(query_texts=["warm-up"], n_results=1)
+
+def _results_to_chunks(
+    results: Dict[str, Any],
+    row: int,
+    product: Optional[str] = None,
+) -> List[PolicyChunk]:
+    docs = (results.get("documents") or [[]])[row]
+    metadatas = (results.get("metadatas") or [[]])[row]
+    distances = (results.get("distances") or [[]])[row]
+
+    chunks: List[PolicyChunk] = []
+    for doc, meta, dist in zip(docs, metadatas, distances):
+        score = float(1.0 / (1.0 + dist)) if dist is not None else 0.0
+        chunks.append(chunk_from_metadata(doc, meta or {}, score, product))
+
+    chunks.sort(key=lambda c: c.score, reverse=True)
+    return chunks
+
+
+def query_policy_chunks_batch(
+    questions: List[str],
+    top_k: int = 5,
+    product: Optional[str] = None,
+) -> List[List[PolicyChunk]]:
+    """
+    Run several questions against the local collection in one query call,
+    optionally restricted to one product's chunks.
+    """
+    backend = get_settings().retriever_backend
+    if backend == "exact":
+        from app.tools.exact_index import query_exact
+
+        return query_exact(questions, top_k=top_k, product=product)
+
+    collection = _get_policy_collection()
+
+    query_embeddings = embed_queries(questions)
+    with span("vector.query", backend=backend, queries=len(questions), top_k=top_k, product=product):
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=product_filter(product) if product else None,
+        )
+    return [_results_to_chunks(results, row, product) for row in range(len(questions))]
+
+
+_retrieval_flight: Optional[SingleFlight] = None
+_retrieval_flight_lock = threading.Lock()
 
-    collection.add(
-        ids=ids,
-        documents=texts,
-        metadatas=metadatas,
+
+def _get_retrieval_flight() -> SingleFlight:
+    global _retrieval_flight
+    if _retrieval_flight is None:
+        with _retrieval_flight_lock:
+            if _retrieval_flight is None:
+                _retrieval_flight = SingleFlight("retrieval", get_settings().singleflight_timeout_s)
+    return _retrieval_flight
+
+
+def _retrieve_scoped(question: str, top_k: int, product: Optional[str]) -> List[PolicyChunk]:
+    """
+    Identical concurrent retrievals (same normalized question, top_k and
+    product filter) run once and share the result.
+    """
+    if not get_settings().singleflight_enabled:
+        return _retrieve_scoped_uncoalesced(question, top_k, product)
+    return _get_retrieval_flight().do(
+        (normalize_key(question), top_k, product),
+        lambda: _retrieve_scoped_uncoalesced(question, top_k, product),
     )
 
-    print(f"Indexed {len(texts)} chunks into 'travel_insurance_policies'.")
+
+def _retrieve_scoped_uncoalesced(question: str, top_k: int, product: Optional[str]) -> List[PolicyChunk]:
+    if get_settings().retriever_mode == "sidecar":
+        from app.tools.retriever_sidecar import retrieve_via_sidecar
+
+        with span("retriever.sidecar", kind="client", top_k=top_k, product=product):
+            return retrieve_via_sidecar(question, top_k=top_k, product=product)
+
+    return query_policy_chunks_batch([question], top_k=top_k, product=product)[0]
+
+
+_fanout_executor: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _fanout_lock:
+            if _fanout_executor is None:
+                _fanout_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval-fanout")
+    return _fanout_executor
+
 
 def retrieve_policy_chunks(
     question: str,
     top_k: int = 5,
+    products: Optional[Sequence[str]] = None,
 ) -> List[PolicyChunk]:
-    
-    collection = _get_policy_collection()
+    """
+    Retrieve the top chunks for a question.
+
+    `products` scopes the search: one product applies a metadata filter,
+    several products run one filtered retrieval each in parallel, each for an
+    equal share of top_k, and the best top_k of the merged chunks are kept.
+    Products that are not in the
+    index are ignored; with none left the whole collection is searched.
+    """
+    scoped = [p for p in dict.fromkeys(products or []) if p in INDEXED_PRODUCTS]
+
+    if not scoped:
+        return _retrieve_scoped(question, top_k, None)
+    if len(scoped) == 1:
+        return _retrieve_scoped(question, top_k, scoped[0])
+
+    per_product = max(1, math.ceil(top_k / len(scoped)))
+    executor = _get_fanout_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, _retrieve_scoped, question, per_product, p)
+        for p in scoped
+    ]
+    # A chunk shared by several products comes back from each of their
+    # retrievals; keep it once, under all of them.
+    merged: Dict[str, PolicyChunk] = {}
+    for future in futures:
+        for chunk in future.result():
+            kept = merged.get(chunk.content)
+            if kept is None or chunk.score > kept.score:
+                merged[chunk.content] = chunk
+    chunks = list(merged.values())
 
-    results = collection.query(
-        query_texts=[question],
-        n_results=top_k,
-    )
+    chunks.sort(key=lambda c: c.score, reverse=True)
+    # Shares are rounded up, so there can be more than top_k.
+    return chunks[:top_k]
 
-    docs = results.get("documents", [[]])[0]
-    metadatas = results.get("metadatas", [[]])[0]
-    distances = results.get("distances", [[]])[0]
 
-    chunks: List[PolicyChunk] = []
-    for doc, meta, dist in zip(docs, metadatas, distances):
-        product = meta.get("product", "UNKNOWN")
-        section = meta.get("section", "")
-        score = float(1.0 / (1.0 + dist)) if dist is not None else 0.0
-        chunks.append(
-            PolicyChunk(
-                content=doc,
-                product=product,
-                section=section,
-                score=score,
-            )
-        )
+if __name__ == "__main__":
+    import sys
 
-    chunks.sort(key=lambda c: c.score, reverse=True)
-    return chunks
+    build_policy_index(force_rebuild="--force" in sys.argv[1:])
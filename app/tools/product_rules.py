@@ -1,30 +1,22 @@
 from __future__ import annotations
 
 import json
-from functools import lru_cache
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from app.config import get_settings
+from app.llm import LLMUnavailable, parse_json_reply, simple_chat_call
+from app.tools.catalog import (
+    WORLDWIDE_DESTINATIONS,
+    CatalogSnapshot,
+    get_catalog,
+    product_id,
+)
+from app.tools.gazetteer import destination_covered
 
 
-from app.llm import get_chat_llm
-from langchain_core.messages import SystemMessage, HumanMessage
-import json
-
-PRODUCTS_PATH = Path(__file__).resolve().parent.parent / "data" / "products.json"
-
-@lru_cache()
-def load_products() -> List[Dict[str, Any]]:
-    if not PRODUCTS_PATH.exists():
-        raise FileNotFoundError(f"products.json not found at {PRODUCTS_PATH}")
-    with PRODUCTS_PATH.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-def product_id(product: Dict[str, Any]) -> str:
-    
-    name = str(product.get("name", "")).strip().lower()
-    return name.replace(" ", "_")
+def _allowed_purposes(product: Dict[str, Any], purposes_norm: Optional[Sequence[str]]) -> Sequence[str]:
+    if purposes_norm is not None:
+        return purposes_norm
+    return [str(p).strip().lower() for p in product.get("purposes") or []]
 
 
 def _check_age(product: Dict[str, Any], age: Optional[int]) -> bool:
@@ -40,12 +32,15 @@ def _check_age(product: Dict[str, Any], age: Optional[int]) -> bool:
 
     return True
     
-def _check_purpose(product: Dict[str, Any], purpose: Optional[str]) -> bool:
+def _check_purpose(
+    product: Dict[str, Any],
+    purpose: Optional[str],
+    purposes_norm: Optional[Sequence[str]] = None,
+) -> bool:
     if not purpose:
         return False
     purpose_norm = purpose.strip().lower()
-    allowed = product.get("purposes") or []
-    allowed_norm = [str(p).strip().lower() for p in allowed]
+    allowed_norm = _allowed_purposes(product, purposes_norm)
 
     if any(purpose_norm == a or purpose_norm in a or a in purpose_norm for a in allowed_norm):
         return True
@@ -55,7 +50,6 @@ def _check_purpose(product: Dict[str, Any], purpose: Optional[str]) -> bool:
 
 
 def llm_is_destination_covered(destination: str, allowed: list[str]) -> bool:
-    llm = get_chat_llm()
 
     system_prompt = (
         "You are checking geographic coverage for travel insurance.\n"
@@ -74,28 +68,51 @@ def llm_is_destination_covered(destination: str, allowed: list[str]) -> bool:
         ensure_ascii=False,
     )
 
-    resp = llm.invoke(
-        [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt),
-        ]
-    )
-    content = resp.content if isinstance(resp.content, str) else str(resp.content)
+    content = simple_chat_call(system_prompt, user_prompt, site="destination_check", hedge=True)
 
     try:
-        data = json.loads(content)
+        data = parse_json_reply(content)
         return bool(data.get("covered", False))
     except Exception:
         return False
 
 
-def _check_destination(product: Dict[str, Any], destination: Optional[str]) -> bool:
+def local_destination_match(destination: str, allowed: list[str]) -> bool:
+    """
+    Cheap, LLM-free destination check used when the LLM cannot be called:
+    worldwide products match everything, otherwise a case-insensitive
+    name match against the allowed list.
+    """
+    dest = destination.strip().lower()
+    allowed_norm = [str(a).strip().lower() for a in allowed]
+    if any(a in WORLDWIDE_DESTINATIONS for a in allowed_norm):
+        return True
+    return any(dest == a or dest in a or a in dest for a in allowed_norm if a)
+
+
+def _check_destination(
+    product: Dict[str, Any],
+    destination: Optional[str],
+    worldwide: bool = False,
+) -> bool:
     if destination is None:
         return False
 
+    if worldwide:
+        return True
+
     allowed = product.get("destinations") or []
 
-    return llm_is_destination_covered(destination, allowed)
+    # Known countries and regions are decided locally; the LLM only sees
+    # destinations the gazetteer does not know.
+    covered = destination_covered(destination, allowed)
+    if covered is not None:
+        return covered
+
+    try:
+        return llm_is_destination_covered(destination, allowed)
+    except LLMUnavailable:
+        return local_destination_match(destination, allowed)
 
 
 def _check_duration(product: Dict[str, Any], duration_days: Optional[int]) -> bool:
@@ -115,23 +132,27 @@ def _check_duration(product: Dict[str, Any], duration_days: Optional[int]) -> bo
 def is_product_eligible(
     product: Dict[str, Any],
     user_profile: Dict[str, Any],
+    worldwide: bool = False,
+    purposes_norm: Optional[Sequence[str]] = None,
 ) -> bool:
     age = user_profile.get("age")
     destination = user_profile.get("destination")
     duration_days = user_profile.get("duration_days")
     purpose = user_profile.get("purpose")
 
+    # Destination last: it is the only check that may need an LLM call.
     return (
         _check_age(product, age)
-        and _check_destination(product, destination)
         and _check_duration(product, duration_days)
-        and _check_purpose(product, purpose)
+        and _check_purpose(product, purpose, purposes_norm)
+        and _check_destination(product, destination, worldwide=worldwide)
     )
 
 
 def score_product(
     product: Dict[str, Any],
     user_profile: Dict[str, Any],
+    purposes_norm: Optional[Sequence[str]] = None,
 ) -> float:
     score = 1.0
 
@@ -144,8 +165,7 @@ def score_product(
     purpose = user_profile.get("purpose")
     if purpose:
         purpose_norm = purpose.strip().lower()
-        allowed = [str(p).strip().lower() for p in product.get("purposes", [])]
-        if any(purpose_norm == a for a in allowed):
+        if any(purpose_norm == a for a in _allowed_purposes(product, purposes_norm)):
             score += 0.1
 
     return float(score)
@@ -155,16 +175,22 @@ def score_product(
 def get_eligible_and_scored_products(
     user_profile: Dict[str, Any],
     max_products: int = 2,
+    snapshot: Optional[CatalogSnapshot] = None,
 ) -> List[Tuple[Dict[str, Any], float]]:
-    
-    products = load_products()
-    products = products.get("products")
-    
+    """
+    Pass the `snapshot` the caller is using so a whole request sees one
+    catalog version even if products.json is reloaded meanwhile.
+    """
+    if snapshot is None:
+        snapshot = get_catalog().current()
+
     eligible: List[Tuple[Dict[str, Any], float]] = []
 
-    for product in products:
-        if is_product_eligible(product, user_profile):
-            s = score_product(product, user_profile)
+    for pid, product in snapshot.by_id.items():
+        purposes_norm = snapshot.purposes_norm.get(pid)
+        worldwide = snapshot.worldwide.get(pid, False)
+        if is_product_eligible(product, user_profile, worldwide=worldwide, purposes_norm=purposes_norm):
+            s = score_product(product, user_profile, purposes_norm=purposes_norm)
             eligible.append((product, s))
 
     eligible.sort(key=lambda ps: ps[1], reverse=True)
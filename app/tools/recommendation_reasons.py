@@ -0,0 +1,232 @@
+"""
+Recommendation reasons without a per-request LLM call.
+
+Reasons mostly depend on the recommended products and a coarse view of the
+traveller (age band, region, duration band, purpose), so they are cached per
+(product ids, profile bucket). A deterministic template built from each
+product's `key_features` is the no-LLM fallback.
+
+Pre-generate the cache offline for common buckets with:
+
+    python -m app.tools.recommendation_reasons
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.tools.gazetteer import find_places, resolve_place
+
+REASONS_CACHE_PATH = Path(__file__).resolve().parent.parent / "data" / "reasons_cache.json"
+
+AGE_BANDS: List[Tuple[int, int]] = [(18, 25), (26, 35), (36, 45), (46, 55), (56, 65), (66, 120)]
+DURATION_BANDS: List[Tuple[int, int]] = [(1, 7), (8, 31), (32, 90), (91, 180), (181, 365), (366, 3650)]
+
+# Representative destinations used when pre-generating reasons per region.
+REGION_SAMPLE_DESTINATIONS = {"europe": "France", "world": "Thailand"}
+
+
+def _band(value: Optional[int], bands: List[Tuple[int, int]], suffix: str = "") -> str:
+    if not isinstance(value, int):
+        return "unknown"
+    for lo, hi in bands:
+        if lo <= value <= hi:
+            return f"{lo}-{hi}{suffix}"
+    return "unknown"
+
+
+def age_band(age: Optional[int]) -> str:
+    return _band(age, AGE_BANDS)
+
+
+def duration_band(duration_days: Optional[int]) -> str:
+    return _band(duration_days, DURATION_BANDS, suffix="d")
+
+
+def region_bucket(destination: Optional[str]) -> str:
+    if not destination:
+        return "unknown"
+    # Anything not recognised as European is "world".
+    place = resolve_place(destination)
+    places = [place] if place is not None else [p for _, _, p in find_places(destination)]
+    if places and all("europe" in p.regions for p in places):
+        return "europe"
+    return "world"
+
+
+def bucket_profile(user_profile: Dict[str, Any]) -> Dict[str, str]:
+    purpose = user_profile.get("purpose")
+    return {
+        "age_band": age_band(user_profile.get("age")),
+        "region": region_bucket(user_profile.get("destination")),
+        "duration_band": duration_band(user_profile.get("duration_days")),
+        "purpose": str(purpose).strip().lower() if purpose else "unknown",
+    }
+
+
+def reasons_cache_key(
+    product_ids: List[str],
+    bucket: Dict[str, str],
+    fingerprints: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Product ids are qualified with their catalog fingerprint, so editing a
+    product in products.json invalidates only that product's cached reasons.
+    """
+    fingerprints = fingerprints or {}
+    products = sorted(f"{pid}@{fingerprints.get(pid, '')}" for pid in product_ids)
+    return json.dumps(
+        {"products": products, "profile": bucket},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+
+
+def template_reasons(
+    user_profile: Dict[str, Any],
+    products: List[Dict[str, Any]],
+) -> Dict[str, str]:
+    """
+    Deterministic reasons built from the product sheet and the user's profile.
+    """
+    from app.tools.product_rules import product_id
+
+    trip_bits = []
+    if user_profile.get("duration_days") is not None:
+        trip_bits.append(f"{user_profile['duration_days']}-day")
+    if user_profile.get("purpose"):
+        trip_bits.append(str(user_profile["purpose"]).lower())
+    trip = " ".join(trip_bits + ["trip"])
+    if user_profile.get("destination"):
+        trip += f" to {user_profile['destination']}"
+
+    reasons: Dict[str, str] = {}
+    for p in products:
+        name = p.get("name")
+        limits = []
+        if p.get("age_min") is not None and p.get("age_max") is not None:
+            limits.append(f"travellers aged {p['age_min']}–{p['age_max']}")
+        if p.get("duration_max_days"):
+            limits.append(f"stays of up to {p['duration_max_days']} days")
+        sentence = f"{name} suits your {trip}"
+        if limits:
+            sentence += f": it covers {' and '.join(limits)}"
+        sentence += "."
+        features = [str(f) for f in (p.get("key_features") or [])[:2]]
+        if features:
+            sentence += f" Key features: {'; '.join(features)}."
+        reasons[product_id(p)] = sentence
+    return reasons
+
+
+class ReasonsCache:
+    """
+    In-memory reasons cache, seeded from the pre-generated JSON file and filled
+    lazily as new (products, bucket) combinations are seen.
+    """
+
+    def __init__(self, path: Path = REASONS_CACHE_PATH):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def put(self, key: str, reasons: Dict[str, str]) -> None:
+        with self._lock:
+            self._entries[key] = dict(reasons)
+
+    def save(self) -> None:
+        with self._lock:
+            data = dict(self._entries)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+_cache: Optional[ReasonsCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_reasons_cache() -> ReasonsCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReasonsCache()
+    return _cache
+
+
+def _representative_profile(bucket: Dict[str, str]) -> Dict[str, Any]:
+    lo, hi = (int(x) for x in bucket["age_band"].split("-"))
+    dlo, dhi = (int(x) for x in bucket["duration_band"].rstrip("d").split("-"))
+    return {
+        "age": (lo + hi) // 2,
+        "destination": REGION_SAMPLE_DESTINATIONS[bucket["region"]],
+        "duration_days": (dlo + dhi) // 2,
+        "purpose": bucket["purpose"],
+    }
+
+
+def pregenerate_reasons_cache(max_products: int = 2) -> int:
+    """
+    Generate LLM reasons for every common bucket that yields at least one
+    eligible product and persist them. Returns the number of new entries.
+    """
+    from app.agents.recommendation import PURPOSE_CANONICAL, _llm_reasons
+    from app.tools.catalog import get_catalog
+    from app.tools.product_rules import get_eligible_and_scored_products, product_id
+
+    cache = get_reasons_cache()
+    catalog = get_catalog().current()
+    purposes = sorted({p.lower() for p in PURPOSE_CANONICAL.values()})
+    added = 0
+
+    for lo, hi in AGE_BANDS:
+        for region in REGION_SAMPLE_DESTINATIONS:
+            for dlo, dhi in DURATION_BANDS:
+                for purpose in purposes:
+                    bucket = {
+                        "age_band": f"{lo}-{hi}",
+                        "region": region,
+                        "duration_band": f"{dlo}-{dhi}d",
+                        "purpose": purpose,
+                    }
+                    profile = _representative_profile(bucket)
+                    scored = get_eligible_and_scored_products(
+                        profile, max_products=max_products, snapshot=catalog
+                    )
+                    products = [p for p, _ in scored]
+                    if not products:
+                        continue
+                    key = reasons_cache_key(
+                        [product_id(p) for p in products], bucket, catalog.fingerprints
+                    )
+                    if cache.get(key) is not None:
+                        continue
+                    reasons = _llm_reasons(bucket, products)
+                    if reasons:
+                        cache.put(key, reasons)
+                        added += 1
+
+    cache.save()
+    return added
+
+
+if __name__ == "__main__":
+    n = pregenerate_reasons_cache()
+    print(f"Added {n} reason sets to {REASONS_CACHE_PATH}.")
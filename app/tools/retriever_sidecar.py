@@ -0,0 +1,292 @@
+"""
+Retriever sidecar: one local process owns the Chroma index and the embedding
+model and serves `retrieve_policy_chunks` to the API workers over a Unix socket.
+
+Run it next to uvicorn and start the workers with RETRIEVER_MODE=sidecar:
+
+    python -m app.tools.retriever_sidecar
+    RETRIEVER_MODE=sidecar uvicorn main:app --workers 4
+
+Protocol: one JSON object per line in each direction.
+    -> {"op": "retrieve", "question": "...", "top_k": 5, "product": "EUROPAX" | null}
+    <- {"chunks": [{"content": ..., "product": ..., "section": ..., "score": ...}]}
+    -> {"op": "faq", "question": "..."}
+    <- {"response": {...} | null}
+    -> {"op": "score_sentences", "question": "...", "contents": ["chunk text", ...]}
+    <- {"sentences": [[["sentence", 0.71], ...], ...]}
+    -> {"op": "ping"}
+    <- {"ok": true}
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.tools.policy_retriever import PolicyChunk
+
+
+class SidecarUnavailable(ConnectionError):
+    """The retriever sidecar could not be reached or returned an error."""
+
+
+@dataclass
+class _PendingQuery:
+    question: str
+    top_k: int
+    product: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[List[PolicyChunk]] = None
+    error: Optional[BaseException] = None
+
+
+class QueryBatcher:
+    """
+    Collects questions from concurrent connections for up to `max_wait_ms`
+    (or `max_batch` items) and answers them with one collection query per
+    product filter present in the batch.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="retriever-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, question: str, top_k: int, product: Optional[str] = None) -> List[PolicyChunk]:
+        pending = _PendingQuery(question=question, top_k=top_k, product=product)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result or []
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch: List[_PendingQuery]) -> None:
+        groups: Dict[Optional[str], List[_PendingQuery]] = {}
+        for p in batch:
+            groups.setdefault(p.product, []).append(p)
+        for product, group in groups.items():
+            self._execute_group(group, product)
+
+    def _execute_group(self, group: List[_PendingQuery], product: Optional[str]) -> None:
+        from app.tools.policy_retriever import query_policy_chunks_batch
+
+        top_k = max(p.top_k for p in group)
+        try:
+            results = query_policy_chunks_batch(
+                [p.question for p in group], top_k=top_k, product=product
+            )
+        except Exception as exc:
+            for p in group:
+                p.error = exc
+                p.done.set()
+            return
+
+        for p, chunks in zip(group, results):
+            p.result = chunks[: p.top_k]
+            p.done.set()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self._dispatch(json.loads(line))
+            except Exception as exc:
+                reply = {"error": f"{type(exc).__name__}: {exc}"}
+            self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "retrieve":
+            chunks = self.server.batcher.submit(
+                str(request["question"]),
+                int(request.get("top_k", 5)),
+                request.get("product"),
+            )
+            return {"chunks": [asdict(c) for c in chunks]}
+        if op == "faq":
+            from app.tools.faq_store import lookup_faq_local
+
+            return {"response": lookup_faq_local(str(request["question"]))}
+        if op == "score_sentences":
+            from app.tools.extractive_answer import score_sentences_local
+
+            return {
+                "sentences": score_sentences_local(
+                    str(request["question"]), [str(c) for c in request.get("contents", [])]
+                )
+            }
+        raise ValueError(f"Unknown op: {op!r}")
+
+
+class RetrieverSidecarServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, batcher: QueryBatcher):
+        self.batcher = batcher
+        super().__init__(socket_path, _Handler)
+
+
+class SidecarClient:
+    """
+    Thin client used by API workers. Keeps one connection per thread and
+    reconnects once if the sidecar was restarted.
+    """
+
+    def __init__(self, socket_path: str, timeout_s: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout_s)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        self._local.file = sock.makefile("rwb")
+        return self._local.file
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+        self._local.file = None
+
+    def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+        for attempt in range(2):
+            try:
+                f = getattr(self._local, "file", None) or self._connect()
+                f.write(data)
+                f.flush()
+                line = f.readline()
+                if not line:
+                    raise ConnectionResetError("sidecar closed the connection")
+                break
+            except OSError as exc:
+                self._close()
+                if attempt == 1:
+                    raise SidecarUnavailable(f"Retriever sidecar unreachable: {exc}") from exc
+
+        reply = json.loads(line)
+        if "error" in reply:
+            raise SidecarUnavailable(reply["error"])
+        return reply
+
+    def retrieve(self, question: str, top_k: int = 5, product: Optional[str] = None) -> List[PolicyChunk]:
+        reply = self.request(
+            {"op": "retrieve", "question": question, "top_k": top_k, "product": product}
+        )
+        return [PolicyChunk(**c) for c in reply.get("chunks", [])]
+
+    def lookup_faq(self, question: str) -> Optional[Dict[str, Any]]:
+        return self.request({"op": "faq", "question": question}).get("response")
+
+    def score_sentences(self, question: str, contents: List[str]) -> List[List[Tuple[str, float]]]:
+        reply = self.request({"op": "score_sentences", "question": question, "contents": contents})
+        return [[(s, float(score)) for s, score in chunk] for chunk in reply.get("sentences", [])]
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.request({"op": "ping"}).get("ok"))
+        except SidecarUnavailable:
+            return False
+
+
+_client: Optional[SidecarClient] = None
+_client_lock = threading.Lock()
+
+
+def get_sidecar_client() -> SidecarClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SidecarClient(get_settings().retriever_socket)
+    return _client
+
+
+def retrieve_via_sidecar(
+    question: str,
+    top_k: int = 5,
+    product: Optional[str] = None,
+) -> List[PolicyChunk]:
+    return get_sidecar_client().retrieve(question, top_k=top_k, product=product)
+
+
+def lookup_faq_via_sidecar(question: str) -> Optional[Dict[str, Any]]:
+    return get_sidecar_client().lookup_faq(question)
+
+
+def score_sentences_via_sidecar(question: str, contents: List[str]) -> List[List[Tuple[str, float]]]:
+    return get_sidecar_client().score_sentences(question, contents)
+
+
+def wait_for_sidecar(timeout_s: float = 60.0, interval_s: float = 0.2) -> None:
+    client = get_sidecar_client()
+    deadline = time.monotonic() + timeout_s
+    while not client.ping():
+        if time.monotonic() >= deadline:
+            raise SidecarUnavailable(
+                f"Retriever sidecar not reachable at {client.socket_path} after {timeout_s:.0f}s"
+            )
+        time.sleep(interval_s)
+
+
+def serve() -> None:
+    from app.tools.policy_retriever import build_policy_index, warm_up_retriever
+
+    settings = get_settings()
+
+    build_policy_index(force_rebuild=False)
+    warm_up_retriever()
+
+    socket_path = settings.retriever_socket
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    batcher = QueryBatcher(settings.retriever_batch_size, settings.retriever_batch_wait_ms)
+    with RetrieverSidecarServer(socket_path, batcher) as server:
+        print(f"Retriever sidecar listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    serve()
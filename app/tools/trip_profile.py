@@ -0,0 +1,300 @@
+"""
+Rule-based trip-profile extraction.
+
+Most recommendation messages state the profile plainly ("I'm 35, going to
+Spain for 2 months for tourism"), which regular expressions and the
+destination gazetteer parse without an LLM. Every field comes with a
+confidence; the LLM extractor is only asked for the fields that stay below
+the configured threshold.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.tools.gazetteer import Place, find_places, fold
+
+PROFILE_FIELDS = ("age", "destination", "duration_days", "purpose")
+
+# A message that names no purpose is probably a personal trip, or a long-term
+# stay beyond this many days. The guess stays below the parser threshold
+# (PROFILE_PARSER_MIN_CONFIDENCE, 0.8): the LLM is still asked, and the guess
+# only serves when it is unavailable.
+LONG_STAY_DAYS = 180
+DEFAULT_PURPOSE_CONFIDENCE = 0.5
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "couple of": 2,
+}
+_UNIT_DAYS = {
+    "day": 1, "jour": 1, "night": 1, "nuit": 1,
+    "week": 7, "semaine": 7, "fortnight": 14,
+    "month": 30, "mois": 30,
+    "year": 365, "annee": 365,
+}
+_MONTHS = {
+    "jan": 1, "janv": 1, "january": 1, "janvier": 1,
+    "feb": 2, "fev": 2, "february": 2, "fevrier": 2,
+    "mar": 3, "march": 3, "mars": 3,
+    "apr": 4, "avr": 4, "april": 4, "avril": 4,
+    "may": 5, "mai": 5,
+    "jun": 6, "june": 6, "juin": 6,
+    "jul": 7, "july": 7, "juillet": 7,
+    "aug": 8, "august": 8, "aout": 8,
+    "sep": 9, "sept": 9, "september": 9, "septembre": 9,
+    "oct": 10, "october": 10, "octobre": 10,
+    "nov": 11, "november": 11, "novembre": 11,
+    "dec": 12, "december": 12, "decembre": 12,
+}
+
+_AGE_PATTERNS: List[Tuple["re.Pattern[str]", float]] = [
+    (re.compile(r"\b(\d{1,3})\s*-?\s*(?:years?|yrs?)[\s-]*old\b", re.I), 0.95),
+    (re.compile(r"\b(\d{1,3})\s*(?:y/?o|ans)\b", re.I), 0.95),
+    (re.compile(r"\b(?:aged?|age is)\s*:?\s*(\d{1,3})\b", re.I), 0.95),
+    (
+        re.compile(
+            r"\b(?:i['\u2019]?m|i am|je suis)\s+(\d{1,3})\b(?!\s*(?:-|%|€|\$|days?|nights?|weeks?|months?|years?))",
+            re.I,
+        ),
+        0.85,
+    ),
+]
+
+_AMOUNT = r"(\d+(?:[.,]5)?|" + "|".join(sorted(_NUMBER_WORDS, key=len, reverse=True)) + r")"
+_UNIT = r"(" + "|".join(sorted(_UNIT_DAYS, key=len, reverse=True)) + r")s?"
+_DURATION_RE = re.compile(rf"\b{_AMOUNT}\s*-?\s*{_UNIT}\b(?![\s-]*old)", re.I)
+_HALF_YEAR_RE = re.compile(r"\bhalf a year\b", re.I)
+
+_MONTH = r"(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?"
+_ORDINAL = r"(\d{1,2})(?:st|nd|rd|th|er)?"
+_YEAR = r"(?:,?\s+(\d{4}))?"
+_DATE_PATTERNS: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("iso", re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?\b")),
+    ("day_month", re.compile(rf"\b{_ORDINAL}\s+(?:of\s+)?{_MONTH}{_YEAR}\b", re.I)),
+    ("month_day", re.compile(rf"\b{_MONTH}\s+{_ORDINAL}{_YEAR}\b", re.I)),
+]
+# "3 to 20 August", "du 3 au 20 août"
+_SHARED_MONTH_RE = re.compile(
+    rf"\b(\d{{1,2}})(?:st|nd|rd|th|er)?\s*(?:to|until|till|-|–|au)\s*{_ORDINAL}\s+{_MONTH}{_YEAR}\b",
+    re.I,
+)
+_RANGE_JOIN_RE = re.compile(r"\s*(?:to|until|till|through|and|-|–|—|au|jusqu'au)\s*", re.I)
+
+# Continents a multi-country trip is summarised as.
+_TRIP_REGIONS = (("europe", "Europe"), ("asia", "Asia"), ("americas", "America"), ("africa", "Africa"), ("oceania", "Oceania"))
+
+# Cues before a place name, strongest first.
+_TRAVEL_CUE_RE = re.compile(
+    r"\b(?:to|visit|visiting|towards|trip to|travel(?:l)?ing to|going to|heading to|en|au|aux|à)\s+(?:the\s+)?$",
+    re.I,
+)
+_STAY_CUE_RE = re.compile(r"\b(?:in|across|around|through|within)\s+(?:the\s+)?$", re.I)
+_HOME_CUE_RE = re.compile(r"\b(?:from|live in|living in|based in|resident in|citizen of|j'habite en|je vis en)\s+(?:the\s+)?$", re.I)
+
+
+@dataclass
+class ParsedProfile:
+    values: Dict[str, Any] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+
+    def set(self, name: str, value: Any, confidence: float) -> None:
+        if confidence > self.confidence.get(name, 0.0):
+            self.values[name] = value
+            self.confidence[name] = confidence
+
+    def confident(self, min_confidence: float) -> Dict[str, Any]:
+        return {k: v for k, v in self.values.items() if self.confidence.get(k, 0.0) >= min_confidence}
+
+    def missing(self, min_confidence: float) -> List[str]:
+        return [f for f in PROFILE_FIELDS if self.confidence.get(f, 0.0) < min_confidence]
+
+
+def _parse_age(text: str, profile: ParsedProfile) -> None:
+    ages: Dict[int, float] = {}
+    for pattern, confidence in _AGE_PATTERNS:
+        for match in pattern.finditer(text):
+            age = int(match.group(1))
+            if 0 < age < 120:
+                ages[age] = max(ages.get(age, 0.0), confidence)
+    if not ages:
+        return
+    age, confidence = max(ages.items(), key=lambda a: a[1])
+    # Several travellers ("I'm 35 and my wife is 38"): let the LLM decide.
+    profile.set("age", age, confidence if len(ages) == 1 else 0.5)
+
+
+def _amount(value: str) -> float:
+    value = value.lower()
+    if value in _NUMBER_WORDS:
+        return float(_NUMBER_WORDS[value])
+    return float(value.replace(",", "."))
+
+
+def _unit_days(unit: str) -> int:
+    return _UNIT_DAYS[unit.lower()]
+
+
+def _date_from_match(kind: str, match: "re.Match[str]") -> Optional[Tuple[Optional[int], int, int]]:
+    """(year or None, month, day) of a date mention."""
+    g = match.groups()
+    try:
+        if kind == "iso":
+            return int(g[0]), int(g[1]), int(g[2])
+        if kind == "numeric":
+            # Day first, as in the French notices; year optional.
+            year = int(g[2]) if g[2] else None
+            if year is not None and year < 100:
+                year += 2000
+            return year, int(g[1]), int(g[0])
+        if kind == "day_month":
+            return (int(g[2]) if g[2] else None), _MONTHS[g[1].lower()], int(g[0])
+        return (int(g[2]) if g[2] else None), _MONTHS[g[0].lower()], int(g[1])
+    except (KeyError, ValueError):
+        return None
+
+
+def _to_date(parts: Tuple[Optional[int], int, int], default_year: int) -> Optional[date]:
+    year, month, day = parts
+    try:
+        return date(year or default_year, month, day)
+    except ValueError:
+        return None
+
+
+def _range_days(
+    start: Tuple[Optional[int], int, int],
+    end: Tuple[Optional[int], int, int],
+    today: date,
+) -> Optional[int]:
+    """
+    Inclusive trip length. A missing year means the next occurrence of the
+    start date, and an end before the start rolls into the following year.
+    """
+    start_date = _to_date(start, today.year)
+    if start_date is None:
+        return None
+    if start[0] is None and start_date < today:
+        start_date = _to_date(start, today.year + 1)
+        if start_date is None:
+            return None
+    end_date = _to_date(end, start_date.year)
+    if end_date is None:
+        return None
+    if end[0] is None and end_date < start_date:
+        end_date = _to_date(end, start_date.year + 1)
+        if end_date is None:
+            return None
+    days = (end_date - start_date).days + 1
+    return days if days > 0 else None
+
+
+def _parse_date_range(text: str, today: date) -> Optional[Tuple[int, float]]:
+    shared = _SHARED_MONTH_RE.search(text)
+    if shared:
+        month = _MONTHS[shared.group(3).lower()]
+        year = int(shared.group(4)) if shared.group(4) else None
+        days = _range_days((year, month, int(shared.group(1))), (year, month, int(shared.group(2))), today)
+        if days:
+            return days, 0.9
+
+    mentions: List[Tuple[int, int, Tuple[Optional[int], int, int], str]] = []
+    for kind, pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            if any(s < match.end() and match.start() < e for s, e, _, _ in mentions):
+                continue
+            parts = _date_from_match(kind, match)
+            if parts is not None:
+                mentions.append((match.start(), match.end(), parts, kind))
+    mentions.sort()
+    for (_, end, start_parts, kind), (next_start, _, end_parts, next_kind) in zip(mentions, mentions[1:]):
+        if not _RANGE_JOIN_RE.fullmatch(text[end:next_start]):
+            continue
+        days = _range_days(start_parts, end_parts, today)
+        if days:
+            # 03/04 could be either order.
+            ambiguous = "numeric" in (kind, next_kind) and max(start_parts[2], end_parts[2]) <= 12
+            return days, 0.7 if ambiguous else 0.9
+    return None
+
+
+def _parse_duration(text: str, profile: ParsedProfile, today: date) -> None:
+    date_range = _parse_date_range(text, today)
+    if date_range is not None:
+        profile.set("duration_days", *date_range)
+        return
+    if _HALF_YEAR_RE.search(text):
+        profile.set("duration_days", 180, 0.9)
+        return
+    matches = list(_DURATION_RE.finditer(text))
+    if not matches:
+        return
+    days = [round(_amount(m.group(1)) * _unit_days(m.group(2))) for m in matches]
+    # "2 weeks or 3 weeks", "a week in Spain then a month in Italy": ambiguous.
+    confidence = 0.9 if len(set(days)) == 1 else 0.5
+    profile.set("duration_days", max(1, days[0]), confidence)
+
+
+def _parse_destination(text: str, profile: ParsedProfile) -> None:
+    candidates: List[Tuple[float, str, Place]] = []
+    for start, end, place in find_places(text):
+        before = text[max(0, start - 30) : start]
+        if _HOME_CUE_RE.search(before):
+            continue
+        if _TRAVEL_CUE_RE.search(before):
+            score = 0.95
+        elif _STAY_CUE_RE.search(before):
+            score = 0.85
+        else:
+            score = 0.7
+        # Regions keep the user's wording ("Southeast Asia").
+        name = place.name if place.kind == "country" else text[start:end]
+        candidates.append((score, name, place))
+    if not candidates:
+        return
+
+    names = {name for _, name, _ in candidates}
+    if len(names) == 1:
+        profile.set("destination", candidates[0][1], max(c[0] for c in candidates))
+        return
+    # Several places ("Spain then Italy"): the continent they share, if any.
+    shared = frozenset.intersection(*(place.regions for _, _, place in candidates))
+    for region, label in _TRIP_REGIONS:
+        if region in shared:
+            profile.set("destination", label, 0.85)
+            return
+    profile.set("destination", "World", 0.6)
+
+
+def _parse_purpose(text: str, profile: ParsedProfile, default: bool) -> None:
+    from app.agents.recommendation import PURPOSE_CANONICAL
+
+    lowered = text.lower()
+    for key in sorted(PURPOSE_CANONICAL, key=len, reverse=True):
+        if re.search(rf"(?<!\w){re.escape(key)}(?!\w)", lowered):
+            profile.set("purpose", PURPOSE_CANONICAL[key], 0.9)
+            return
+    duration = profile.values.get("duration_days")
+    if default and duration is not None:
+        purpose = "Long-term stay" if duration > LONG_STAY_DAYS else "Personal trip"
+        profile.set("purpose", purpose, DEFAULT_PURPOSE_CONFIDENCE)
+
+
+def parse_trip_profile(text: str, today: Optional[date] = None, default_purpose: bool = True) -> ParsedProfile:
+    """
+    Age, destination, duration_days and purpose found in `text`, with
+    confidences. default_purpose=False when the purpose is already known, so
+    that the default never replaces it.
+    """
+    profile = ParsedProfile()
+    # Numbers, units and month names are matched without accents ("août").
+    folded = fold(text)
+    _parse_age(folded, profile)
+    _parse_duration(folded, profile, today or date.today())
+    _parse_destination(text, profile)
+    _parse_purpose(text, profile, default_purpose)
+    return profile
@@ -0,0 +1,320 @@
+"""
+Lightweight request tracing with OpenTelemetry-compatible ids and export.
+
+Every `/api/query` gets a root span; graph nodes, LLM calls, embeddings and
+vector queries open child spans through the `span()` context manager. The
+current span lives in a context variable, so it follows the request into
+worker threads wherever the context is copied (graph nodes, hedged LLM calls,
+retrieval fan-out).
+
+Finished spans go to TRACING_EXPORTER:
+    off    nothing is exported (ids are still generated for the response header)
+    jsonl  one JSON object per span appended to TRACING_JSONL_PATH
+    otlp   OTLP/HTTP JSON batches posted to TRACING_OTLP_ENDPOINT
+
+Break down one request from a JSONL export with:
+
+    python -m app.tracing <trace_id> [traces.jsonl]
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import get_settings
+
+_SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    (trace_id, parent span id) from a W3C `traceparent` header, if valid.
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match or set(match.group(1)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+@contextmanager
+def span(
+    name: str,
+    kind: str = "internal",
+    traceparent: Optional[str] = None,
+    **attributes: Any,
+) -> Iterator[Span]:
+    """
+    Open a child of the current span (or a new trace). An incoming
+    `traceparent` makes the span continue the caller's trace.
+    """
+    parent = _current_span.get()
+    remote = parse_traceparent(traceparent) if parent is None else None
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif remote is not None:
+        trace_id, parent_id = remote
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+
+    s = Span(name, trace_id, parent_id=parent_id, kind=kind, attributes=attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as exc:
+        s.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end_ns = time.time_ns()
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.export(s)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """
+    Annotate the current span, if any.
+    """
+    s = _current_span.get()
+    if s is not None:
+        s.set_attributes(attributes)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s: Span) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": _SPAN_KINDS.get(s.kind, 1),
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns or s.start_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+class SpanExporter:
+    """
+    Buffers finished spans and writes them from a background thread, so
+    exporting never blocks the request path. Spans are dropped when the
+    buffer is full.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        jsonl_path: str,
+        otlp_endpoint: str,
+        service_name: str,
+        max_batch: int = 256,
+        flush_interval_s: float = 1.0,
+    ):
+        self.mode = mode
+        self.jsonl_path = jsonl_path
+        self.otlp_endpoint = otlp_endpoint
+        self.service_name = service_name
+        self.max_batch = max_batch
+        self.flush_interval_s = flush_interval_s
+        self.dropped = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10_000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, s: Span) -> None:
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as exc:
+                self.dropped += len(batch)
+                print(f"Span export failed: {type(exc).__name__}: {exc}")
+
+    def _write(self, batch: List[Span]) -> None:
+        if self.mode == "jsonl":
+            os.makedirs(os.path.dirname(self.jsonl_path) or ".", exist_ok=True)
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                for s in batch:
+                    f.write(json.dumps(s.to_record(), ensure_ascii=False, default=str) + "\n")
+            return
+
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": self.service_name}}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "app.tracing"}, "spans": [_otlp_span(s) for s in batch]}
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.otlp_endpoint,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5) as resp:
+            resp.read()
+
+
+_exporter: Optional[SpanExporter] = None
+_exporter_lock = threading.Lock()
+_exporter_checked = False
+
+
+def get_exporter() -> Optional[SpanExporter]:
+    global _exporter, _exporter_checked
+    if not _exporter_checked:
+        with _exporter_lock:
+            if not _exporter_checked:
+                settings = get_settings()
+                if settings.tracing_exporter in ("jsonl", "otlp"):
+                    _exporter = SpanExporter(
+                        settings.tracing_exporter,
+                        jsonl_path=settings.tracing_jsonl_path,
+                        otlp_endpoint=settings.tracing_otlp_endpoint,
+                        service_name=settings.tracing_service_name,
+                    )
+                _exporter_checked = True
+    return _exporter
+
+
+def print_trace(trace_id: str, path: str) -> None:
+    """
+    Print one trace from a JSONL export as an indented span tree.
+    """
+    spans: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record["trace_id"] == trace_id:
+                    spans.append(record)
+    if not spans:
+        print(f"No spans for trace {trace_id} in {path}")
+        return
+
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in sorted(spans, key=lambda s: s["start_ns"]):
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+    t0 = min(s["start_ns"] for s in spans)
+
+    def _print(parent: Optional[str], depth: int) -> None:
+        for s in children.get(parent, []):
+            offset_ms = (s["start_ns"] - t0) / 1e6
+            attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            error = f" ERROR {s['error']}" if s["error"] else ""
+            print(f"{offset_ms:9.1f}ms {s['duration_ms']:9.1f}ms  {'  ' * depth}{s['name']}  {attrs}{error}")
+            _print(s["span_id"], depth + 1)
+
+    _print(None, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("usage: python -m app.tracing <trace_id> [traces.jsonl]")
+    print_trace(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else get_settings().tracing_jsonl_path)
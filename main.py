@@ -1,39 +1,166 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
 from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.admission import (
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    AdmissionController,
+    AdmissionRejected,
+)
 
+from app.admin import index_router as admin_index_router
+from app.admin import router as admin_router
 from app.api_schemas import (
     RecommendationResponse,
     PolicyAnswerResponse,
     ClarificationResponse,
 )
-from app.state import make_initial_state
 from app.config import get_settings
-from app.graph import build_graph
+from app.deadline import deadline_scope, remaining_time
+from app.singleflight import AsyncSingleFlight, normalize_key, singleflight_stats
+from app.tracing import set_attributes, span
 
-from app.tools.policy_retriever import build_policy_index
 
+settings = get_settings()
 
-app = FastAPI(title="Insurance Multi-Agent API")
+# Heavy modules (langgraph, chromadb, pypdf, langchain_openai) are only
+# imported by the warm-up thread or the first request, never at import time.
+# Compiled graphs keyed by `stateful` (checkpointed or not).
+_graph_apps: Dict[bool, Any] = {}
+_graph_lock = threading.Lock()
+_ready = threading.Event()
+_warm_up_error: Optional[str] = None
+
+graph_flight = AsyncSingleFlight("graph", settings.singleflight_timeout_s)
+
+admission = AdmissionController(
+    max_concurrent=settings.admission_max_concurrent,
+    max_queue=settings.admission_max_queue,
+    queue_timeout_s=settings.admission_queue_timeout_s,
+)
 
-settings = get_settings()
-graph_app = build_graph()
 
 class QueryIn(BaseModel):
     message: str
+    # Resume a conversation; without it the request runs on the stateless graph.
+    session_id: Optional[str] = None
+
+
+def get_graph_app(stateful: bool = False):
+    app_ = _graph_apps.get(stateful)
+    if app_ is None:
+        with _graph_lock:
+            app_ = _graph_apps.get(stateful)
+            if app_ is None:
+                from app.graph import build_graph
+
+                app_ = _graph_apps[stateful] = build_graph(stateful=stateful)
+    return app_
+
+
+def _request_priority(message: str) -> int:
+    """
+    Requests the router will answer without any LLM call (e.g. vague
+    "what's covered?" questions routed to clarification_node) jump the queue.
+    """
+    from app.agents.router import _heuristic_intent
+
+    intent, _ = _heuristic_intent(message)
+    return PRIORITY_HIGH if intent == "clarification" else PRIORITY_NORMAL
+
+
+def warm_up() -> None:
+    """
+    Compile the graph, make sure the policy index exists, and load the
+    embedding model + vector index into memory. In sidecar mode the index is
+    owned by the retriever sidecar, so workers only wait for it to answer.
+    """
+    from app.tools.catalog import get_catalog
+
+    get_graph_app(stateful=False)
+    get_graph_app(stateful=True)
+    get_catalog().start_watching()
+
+    if settings.retriever_mode == "sidecar":
+        from app.tools.retriever_sidecar import wait_for_sidecar
+
+        wait_for_sidecar()
+        return
+
+    from app.tools.policy_retriever import build_policy_index, warm_up_retriever
+
+    build_policy_index(force_rebuild=False)
+    warm_up_retriever()
+
+
+def _run_warm_up() -> None:
+    global _warm_up_error
+    try:
+        warm_up()
+    except Exception as exc:
+        _warm_up_error = f"{type(exc).__name__}: {exc}"
+        return
+    _ready.set()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    build_policy_index(force_rebuild=False)
+    threading.Thread(target=_run_warm_up, name="warm-up", daemon=True).start()
     yield
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(title="Insurance Multi-Agent API", lifespan=lifespan)
+app.include_router(admin_router)
+app.include_router(admin_index_router)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    if _ready.is_set():
+        from app.llm import circuit_stats
+        from app.tools.catalog import get_catalog
+
+        # Still ready with the circuit open: degraded answers need no LLM.
+        return {
+            "status": "ready",
+            "catalog_version": get_catalog().current().version,
+            "llm": circuit_stats()["state"],
+        }
+    if _warm_up_error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": _warm_up_error})
+    return JSONResponse(status_code=503, content={"status": "warming_up"})
+
+
+@app.get("/metrics/llm")
+def llm_metrics():
+    from app.llm import circuit_stats, hedge_stats, rate_limit_stats
+    from app.tools.policy_retriever import embedding_batch_stats
+
+    return {
+        "hedging": hedge_stats(),
+        "rate_limit": rate_limit_stats(),
+        "circuit": circuit_stats(),
+        "admission": admission.snapshot(),
+        "embedding_batches": embedding_batch_stats(),
+        "singleflight": singleflight_stats(),
+    }
+
+
 @app.post(
     "/api/query",
     responses={
@@ -53,21 +180,77 @@ def health():
         }
     },
 )
-def query(payload: QueryIn):
+async def query(payload: QueryIn, request: Request, response: Response):
     if not payload.message.strip():
         raise HTTPException(status_code=400, detail="message must not be empty")
 
-    state = make_initial_state(payload.message, max_steps=settings.max_steps)
+    from app.state import make_initial_state
 
-    final_state = graph_app.invoke(
-        state,
-        config={"configurable": {"thread_id": "api-session"}},
+    # The deadline starts before queueing, so time spent waiting for a slot
+    # counts against the request budget.
+    state = make_initial_state(
+        payload.message,
+        max_steps=settings.max_steps,
+        timeout_s=settings.request_timeout_s,
     )
 
-    response = final_state.get("response")
-    if response is None:
+    with span(
+        "POST /api/query",
+        kind="server",
+        traceparent=request.headers.get("traceparent"),
+    ) as root:
+        root.set_attribute("stateful", payload.session_id is not None)
+        trace_headers = {"X-Trace-Id": root.trace_id, "traceparent": root.traceparent}
+        response.headers.update(trace_headers)
+
+        def answer():
+            return _answer(payload, state, trace_headers)
+
+        if payload.session_id is not None or not settings.singleflight_enabled:
+            return await answer()
+
+        # Stateless requests with the same message share one graph run.
+        key = normalize_key(payload.message)
+        root.set_attribute("coalesced", graph_flight.in_flight(key))
+        with deadline_scope(state.get("deadline")):
+            return await graph_flight.do(key, answer)
+
+
+async def _answer(payload: QueryIn, state: Dict[str, Any], trace_headers: Dict[str, str]) -> Dict[str, Any]:
+    from app.state import make_run_config
+
+    queued_at = time.monotonic()
+    # Never queue past the request deadline (a coalesced follower falling
+    # back to its own run has already spent part of it).
+    left = remaining_time(state.get("deadline"))
+    queue_timeout_s = settings.request_timeout_s if left is None else min(settings.request_timeout_s, left)
+    try:
+        async with admission.slot(
+            _request_priority(payload.message),
+            timeout_s=queue_timeout_s,
+        ):
+            set_attributes(queue_wait_ms=round((time.monotonic() - queued_at) * 1000, 3))
+            # Copy the context so node spans become children of the root span.
+            final_state = await run_in_threadpool(
+                contextvars.copy_context().run,
+                get_graph_app(stateful=payload.session_id is not None).invoke,
+                state,
+                config=make_run_config(payload.session_id, settings.max_steps),
+            )
+    except AdmissionRejected as exc:
+        set_attributes(admission_rejected=str(exc))
+        raise HTTPException(
+            status_code=exc.status_code,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after_s), **trace_headers},
+        )
+
+    result = final_state.get("response")
+    if result is None:
         raise HTTPException(
             status_code=500,
             detail="Agent graph finished without a response.",
+            headers=trace_headers,
         )
-    return response
\ No newline at end of file
+    set_attributes(intent=final_state.get("intent"), response_type=result.get("type"))
+    return result
@@ -0,0 +1,281 @@
+"""
+Open-loop HTTP load test for /api/query.
+
+Requests are fired on a Poisson arrival schedule at --rate per second,
+independent of how fast the app answers, with queries drawn from
+tests/test_queries.json according to --mix. Without --url the harness starts
+the stub LLM server and the app (uvicorn, --workers) on local ports, with
+OPENAI_BASE_URL pointing at the stub, and stops both at the end.
+
+    python -m tests.load_test --rate 20 --duration 60 --workers 4
+    python -m tests.load_test --url http://localhost:8000 --rate 50 \
+        --mix recommendation=0.5,policy_answer=0.4,clarification=0.1
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+QUERIES_PATH = ROOT / "tests" / "test_queries.json"
+
+
+@dataclass
+class Result:
+    expected_type: str
+    status: int
+    latency_s: float
+    response_type: Optional[str] = None
+    error: Optional[str] = None
+
+
+def load_queries_by_type() -> Dict[str, List[str]]:
+    with QUERIES_PATH.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    by_type: Dict[str, List[str]] = {}
+    for q in data["test_queries"]:
+        by_type.setdefault(q["expected_type"], []).append(q["query"])
+    return by_type
+
+
+def parse_mix(spec: Optional[str], by_type: Dict[str, List[str]]) -> Dict[str, float]:
+    if not spec:
+        total = sum(len(v) for v in by_type.values())
+        return {t: len(v) / total for t, v in by_type.items()}
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in by_type:
+            raise SystemExit(f"Unknown query type {name!r}; available: {sorted(by_type)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+async def _send(client: httpx.AsyncClient, url: str, expected_type: str, message: str) -> Result:
+    start = time.perf_counter()
+    try:
+        resp = await client.post(f"{url}/api/query", json={"message": message})
+    except httpx.HTTPError as exc:
+        return Result(expected_type, 0, time.perf_counter() - start, error=type(exc).__name__)
+    latency = time.perf_counter() - start
+    response_type = None
+    if resp.status_code == 200:
+        response_type = resp.json().get("type")
+    return Result(expected_type, resp.status_code, latency, response_type=response_type)
+
+
+async def run_load(
+    url: str,
+    rate: float,
+    duration_s: float,
+    mix: Dict[str, float],
+    by_type: Dict[str, List[str]],
+    timeout_s: float,
+    seed: Optional[int] = None,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    types = list(mix)
+    weights = [mix[t] for t in types]
+    tasks: List[asyncio.Task] = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+
+    async with httpx.AsyncClient(timeout=timeout_s, limits=limits) as client:
+        start = time.perf_counter()
+        next_at = start
+        max_lag = 0.0
+        while next_at - start < duration_s:
+            now = time.perf_counter()
+            if next_at > now:
+                await asyncio.sleep(next_at - now)
+            max_lag = max(max_lag, time.perf_counter() - next_at)
+            expected_type = rng.choices(types, weights)[0]
+            message = rng.choice(by_type[expected_type])
+            tasks.append(asyncio.create_task(_send(client, url, expected_type, message)))
+            next_at += rng.expovariate(rate)
+        sent_s = time.perf_counter() - start
+        results: List[Result] = await asyncio.gather(*tasks)
+        total_s = time.perf_counter() - start
+
+    return summarize(results, sent_s, total_s, rate, max_lag)
+
+
+def summarize(
+    results: List[Result],
+    sent_s: float,
+    total_s: float,
+    rate: float,
+    max_lag_s: float,
+) -> Dict[str, Any]:
+    ok = [r for r in results if r.status == 200]
+    latencies = sorted(r.latency_s for r in ok)
+    statuses = Counter(str(r.status) if r.status else r.error or "error" for r in results)
+    by_type: Dict[str, Dict[str, Any]] = {}
+    for t in sorted({r.expected_type for r in results}):
+        rs = [r for r in results if r.expected_type == t]
+        lat = sorted(r.latency_s for r in rs if r.status == 200)
+        by_type[t] = {
+            "sent": len(rs),
+            "ok": len(lat),
+            "p50_ms": round(percentile(lat, 50) * 1000, 1),
+            "p95_ms": round(percentile(lat, 95) * 1000, 1),
+            "type_match": sum(1 for r in rs if r.response_type == t),
+        }
+    return {
+        "target_rate": rate,
+        "sent": len(results),
+        "offered_rate": round(len(results) / sent_s, 2) if sent_s else 0.0,
+        "throughput": round(len(ok) / total_s, 2) if total_s else 0.0,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "statuses": dict(statuses),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p90": round(percentile(latencies, 90) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "max_schedule_lag_ms": round(max_lag_s * 1000, 1),
+        "by_type": by_type,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    lat = report["latency_ms"]
+    print(
+        f"sent {report['sent']} at {report['offered_rate']}/s (target {report['target_rate']}/s), "
+        f"throughput {report['throughput']}/s, error rate {report['error_rate']:.2%}"
+    )
+    print(f"latency ms  p50 {lat['p50']}  p90 {lat['p90']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+    print(f"statuses    {report['statuses']}")
+    if report["max_schedule_lag_ms"] > 50:
+        print(f"warning: load generator fell behind by up to {report['max_schedule_lag_ms']}ms")
+    for t, row in report["by_type"].items():
+        print(
+            f"  {t:<16} sent {row['sent']:>5}  ok {row['ok']:>5}  "
+            f"p50 {row['p50_ms']:>8}ms  p95 {row['p95_ms']:>8}ms  type match {row['type_match']}"
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_http(url: str, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit(f"{url} not ready after {timeout_s:.0f}s")
+
+
+def start_local_stack(args: argparse.Namespace) -> Tuple[str, List[subprocess.Popen]]:
+    stub_port, app_port = _free_port(), _free_port()
+    stub_cmd = [sys.executable, "-m", "tests.stub_llm_server", "--port", str(stub_port)]
+    for spec in args.llm_latency:
+        stub_cmd += ["--latency", spec]
+    if args.llm_error_rate:
+        stub_cmd += ["--error-rate", str(args.llm_error_rate)]
+    if args.llm_rpm:
+        stub_cmd += ["--rpm", str(args.llm_rpm)]
+    stub = subprocess.Popen(stub_cmd, cwd=ROOT)
+
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "stub",
+        LLM_CASSETTE_MODE="off",
+    )
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(app_port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    procs = [stub, app]
+    try:
+        _wait_http(f"http://127.0.0.1:{stub_port}/stats", 30)
+        _wait_http(f"http://127.0.0.1:{app_port}/ready", args.ready_timeout)
+    except BaseException:
+        stop_local_stack(procs)
+        raise
+    return f"http://127.0.0.1:{app_port}", procs
+
+
+def stop_local_stack(procs: List[subprocess.Popen]) -> None:
+    for p in procs:
+        if p.poll() is None:
+            p.send_signal(signal.SIGINT)
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop load test for /api/query.")
+    parser.add_argument("--url", help="running app; omit to start stub LLM + app locally")
+    parser.add_argument("--rate", type=float, default=10.0, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--mix", help="e.g. recommendation=0.5,policy_answer=0.4,clarification=0.1")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local app")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--llm-latency", action="append", default=[], help="passed to the stub's --latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=int, default=0, help="stub provider request limit per minute")
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    args = parser.parse_args()
+
+    by_type = load_queries_by_type()
+    mix = parse_mix(args.mix, by_type)
+
+    procs: List[subprocess.Popen] = []
+    url = args.url
+    if url is None:
+        url, procs = start_local_stack(args)
+    try:
+        report = asyncio.run(
+            run_load(url.rstrip("/"), args.rate, args.duration, mix, by_type, args.timeout, args.seed)
+        )
+    finally:
+        stop_local_stack(procs)
+
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Offline retrieval benchmark over a grid of chunking and retrieval settings.
+
+For every (max_chars, overlap, dedupe threshold) the policy notices are
+re-chunked, de-duplicated and embedded with the local embedding model into a
+throwaway exact index (the live index is not touched); every top_k is then
+scored against the gold set in tests/retrieval_gold.json. Product scoping
+follows the policy RAG node: questions naming one product are filtered to
+it, comparisons fan out per product.
+
+Reported per setting: recall@k (share of gold sections found), MRR, chunk
+count, index size, build time, search latency, and for each confidence
+threshold the share of questions that would be answered and how many of
+those retrieved a gold section.
+
+    python -m tests.retrieval_benchmark --max-chars 800,1200,1600 \
+        --overlap 0,100,200 --top-k 3,5,8 --dedupe 0,0.85 --json bench.json
+    python -m tests.retrieval_benchmark candidates   # pages to pin gold sections
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.agents.policy_rag import CONFIDENCE_THRESHOLD, _retrieval_scope
+from app.config import get_settings
+from app.tools.chunk_dedupe import collapse_near_duplicates
+from app.tools.exact_index import ExactPolicyIndex, write_exact_index
+from app.tools.policy_retriever import (
+    PolicyChunk,
+    _chunk_policy_pages,
+    _get_embedding_function,
+    _load_policy_pages,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+GOLD_PATH = ROOT / "tests" / "retrieval_gold.json"
+EMBED_BATCH = 64
+
+
+@dataclass
+class Row:
+    max_chars: int
+    overlap: int
+    dedupe: float
+    top_k: int
+    chunks: int
+    index_kb: float
+    build_s: float
+    recall: float
+    mrr: float
+    search_p50_ms: float
+    search_p95_ms: float
+    thresholds: Dict[str, Dict[str, float]]
+
+
+def load_gold(path: Path = GOLD_PATH) -> List[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)["questions"]
+
+
+def parse_list(spec: str, cast) -> List[Any]:
+    return [cast(x) for x in spec.split(",") if x.strip()]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    ef = _get_embedding_function()
+    vectors: List[Any] = []
+    for start in range(0, len(texts), EMBED_BATCH):
+        vectors.extend(ef(list(texts[start : start + EMBED_BATCH])))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def _occurrences(meta: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    raw = meta.get("occurrences")
+    if raw:
+        return {tuple(o.split("@", 1)) for o in raw.split("|") if "@" in o}
+    return {(meta.get("product", "UNKNOWN"), meta.get("section", ""))}
+
+
+def _relevant(gold: Dict[str, str], occurrences: Set[Tuple[str, str]]) -> bool:
+    if gold.get("section"):
+        return (gold["product"], gold["section"]) in occurrences
+    return any(product == gold["product"] for product, _ in occurrences)
+
+
+def scoped_query(
+    index: ExactPolicyIndex,
+    query_embedding: np.ndarray,
+    top_k: int,
+    scope: List[str],
+) -> List[PolicyChunk]:
+    """Same scoping and merging as retrieve_policy_chunks."""
+    if len(scope) <= 1:
+        return index.query(query_embedding, top_k=top_k, product=scope[0] if scope else None)[0]
+    per_product = max(1, math.ceil(top_k / len(scope)))
+    merged: Dict[str, PolicyChunk] = {}
+    for product in scope:
+        for chunk in index.query(query_embedding, top_k=per_product, product=product)[0]:
+            kept = merged.get(chunk.content)
+            if kept is None or chunk.score > kept.score:
+                merged[chunk.content] = chunk
+    return sorted(merged.values(), key=lambda c: c.score, reverse=True)
+
+
+def build_setting(
+    pages: List[Tuple[str, List[Tuple[int, str]]]],
+    max_chars: int,
+    overlap: int,
+    dedupe: float,
+    dtype: str,
+    directory: Path,
+) -> Tuple[ExactPolicyIndex, Dict[str, Set[Tuple[str, str]]], float]:
+    start = time.perf_counter()
+    ids, texts, metadatas = _chunk_policy_pages(pages, max_chars=max_chars, overlap=overlap)
+    if dedupe > 0:
+        ids, texts, metadatas = collapse_near_duplicates(ids, texts, metadatas, dedupe)
+    write_exact_index(directory, ids, embed_texts(texts), texts, metadatas, dtype=dtype)
+    build_s = time.perf_counter() - start
+    occurrences = {text: _occurrences(meta) for text, meta in zip(texts, metadatas)}
+    return ExactPolicyIndex(directory), occurrences, build_s
+
+
+def evaluate(
+    index: ExactPolicyIndex,
+    occurrences: Dict[str, Set[Tuple[str, str]]],
+    gold: List[Dict[str, Any]],
+    query_embeddings: np.ndarray,
+    scopes: List[List[str]],
+    top_k: int,
+    thresholds: Sequence[float],
+) -> Dict[str, Any]:
+    recalls: List[float] = []
+    reciprocal_ranks: List[float] = []
+    latencies: List[float] = []
+    top_scores: List[float] = []
+    hits: List[bool] = []
+
+    for item, embedding, scope in zip(gold, query_embeddings, scopes):
+        start = time.perf_counter()
+        chunks = scoped_query(index, embedding, top_k, scope)
+        latencies.append(time.perf_counter() - start)
+
+        found = [occurrences.get(c.content, set()) for c in chunks]
+        gold_items = item["gold"]
+        recalls.append(sum(any(_relevant(g, occ) for occ in found) for g in gold_items) / len(gold_items))
+        rank = next((r for r, occ in enumerate(found, 1) if any(_relevant(g, occ) for g in gold_items)), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        hits.append(rank is not None)
+        top_scores.append(max((c.score for c in chunks), default=0.0))
+
+    latencies.sort()
+    by_threshold: Dict[str, Dict[str, float]] = {}
+    for t in thresholds:
+        answered = [hit for score, hit in zip(top_scores, hits) if score >= t]
+        by_threshold[f"{t:g}"] = {
+            "answered": round(len(answered) / len(gold), 3),
+            "answered_with_gold": round(sum(answered) / len(answered), 3) if answered else 0.0,
+        }
+    return {
+        "recall": round(float(np.mean(recalls)), 3),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 3),
+        "search_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "search_p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "thresholds": by_threshold,
+    }
+
+
+def _dir_kb(directory: Path) -> float:
+    return round(sum(p.stat().st_size for p in directory.iterdir() if p.is_file()) / 1024, 1)
+
+
+def run_grid(
+    max_chars_list: Sequence[int],
+    overlaps: Sequence[int],
+    top_ks: Sequence[int],
+    dedupes: Sequence[float],
+    thresholds: Sequence[float],
+    dtype: str,
+    gold: List[Dict[str, Any]],
+) -> Tuple[List[Row], float]:
+    pages = _load_policy_pages()
+    questions = [item["question"] for item in gold]
+    scopes = [_retrieval_scope(q) for q in questions]
+    start = time.perf_counter()
+    query_embeddings = embed_texts(questions)
+    embed_ms = (time.perf_counter() - start) * 1000 / max(1, len(questions))
+
+    rows: List[Row] = []
+    for max_chars, overlap, dedupe in itertools.product(max_chars_list, overlaps, dedupes):
+        if overlap >= max_chars:
+            continue
+        with tempfile.TemporaryDirectory(prefix="retrieval-bench-") as tmp:
+            index, occurrences, build_s = build_setting(pages, max_chars, overlap, dedupe, dtype, Path(tmp))
+            size_kb = _dir_kb(Path(tmp))
+            for top_k in top_ks:
+                result = evaluate(index, occurrences, gold, query_embeddings, scopes, top_k, thresholds)
+                rows.append(
+                    Row(
+                        max_chars=max_chars,
+                        overlap=overlap,
+                        dedupe=dedupe,
+                        top_k=top_k,
+                        chunks=len(index),
+                        index_kb=size_kb,
+                        build_s=round(build_s, 2),
+                        **result,
+                    )
+                )
+            print(f"  built {max_chars}/{overlap}/dedupe {dedupe:g}: {len(index)} chunks in {build_s:.1f}s")
+    return rows, embed_ms
+
+
+def recommend(rows: List[Row], min_recall: float) -> Optional[Row]:
+    """Smallest, then fastest, then lowest-top_k setting with recall >= min_recall."""
+    eligible = [r for r in rows if r.recall >= min_recall]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r.index_kb, r.search_p95_ms, r.top_k))
+
+
+def print_table(rows: List[Row], embed_ms: float) -> None:
+    print(f"query embedding: {embed_ms:.1f} ms/question (same for every setting)")
+    header = (
+        f"{'chars':>6} {'ovlp':>5} {'dedupe':>6} {'k':>3} {'chunks':>6} {'KiB':>8} {'build_s':>7} "
+        f"{'recall':>6} {'mrr':>5} {'p50_ms':>7} {'p95_ms':>7}  answered/with_gold per threshold"
+    )
+    print(header)
+    for r in rows:
+        answered = "  ".join(
+            f"{t}:{v['answered']:.2f}/{v['answered_with_gold']:.2f}" for t, v in r.thresholds.items()
+        )
+        print(
+            f"{r.max_chars:>6} {r.overlap:>5} {r.dedupe:>6g} {r.top_k:>3} {r.chunks:>6} {r.index_kb:>8} "
+            f"{r.build_s:>7} {r.recall:>6} {r.mrr:>5} {r.search_p50_ms:>7} {r.search_p95_ms:>7}  {answered}"
+        )
+
+
+def print_candidates(gold: List[Dict[str, Any]], top_k: int) -> None:
+    """Top pages per gold question under the default chunking, for annotation."""
+    with tempfile.TemporaryDirectory(prefix="retrieval-bench-") as tmp:
+        index, _, _ = build_setting(
+            _load_policy_pages(), 1200, 200, get_settings().index_dedupe_threshold, "float16", Path(tmp)
+        )
+        embeddings = embed_texts([item["question"] for item in gold])
+        for item, embedding in zip(gold, embeddings):
+            print(item["question"])
+            for chunk in scoped_query(index, embedding, top_k, _retrieval_scope(item["question"])):
+                preview = " ".join(chunk.content.split())[:100]
+                print(f"  {chunk.score:.3f}  {chunk.product} {chunk.section}  {preview}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark for chunking/top_k settings.")
+    parser.add_argument("command", nargs="?", default="run", choices=("run", "candidates"))
+    parser.add_argument("--gold", type=Path, default=GOLD_PATH)
+    parser.add_argument("--max-chars", default="800,1200,1600")
+    parser.add_argument("--overlap", default="0,200")
+    parser.add_argument("--top-k", default="3,5,8")
+    parser.add_argument("--dedupe", default=f"0,{get_settings().index_dedupe_threshold:g}")
+    parser.add_argument("--thresholds", default=f"0.3,{CONFIDENCE_THRESHOLD:g},0.5")
+    parser.add_argument("--dtype", default=get_settings().exact_index_dtype)
+    parser.add_argument("--min-recall", type=float, help="default: recall of the current settings")
+    parser.add_argument("--json", type=Path, help="also write the rows to this file")
+    args = parser.parse_args()
+
+    gold = load_gold(args.gold)
+    if args.command == "candidates":
+        print_candidates(gold, top_k=5)
+        return
+
+    rows, embed_ms = run_grid(
+        parse_list(args.max_chars, int),
+        parse_list(args.overlap, int),
+        parse_list(args.top_k, int),
+        parse_list(args.dedupe, float),
+        parse_list(args.thresholds, float),
+        args.dtype,
+        gold,
+    )
+    print_table(rows, embed_ms)
+
+    min_recall = args.min_recall
+    if min_recall is None:
+        current = next(
+            (
+                r for r in rows
+                if (r.max_chars, r.overlap, r.top_k, r.dedupe)
+                == (1200, 200, 5, get_settings().index_dedupe_threshold)
+            ),
+            None,
+        )
+        min_recall = current.recall if current else 1.0
+    best = recommend(rows, min_recall)
+    if best is None:
+        print(f"no setting reaches recall {min_recall}")
+    else:
+        print(
+            f"smallest/fastest with recall >= {min_recall}: max_chars={best.max_chars} "
+            f"overlap={best.overlap} dedupe={best.dedupe:g} top_k={best.top_k} "
+            f"({best.chunks} chunks, {best.index_kb} KiB, recall {best.recall}, mrr {best.mrr})"
+        )
+    if args.json:
+        args.json.write_text(json.dumps([asdict(r) for r in rows], indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
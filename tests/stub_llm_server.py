@@ -0,0 +1,225 @@
+"""
+OpenAI-compatible stub for load tests: answers /v1/chat/completions with a
+canned reply for each of the app's prompt types after a sampled delay.
+
+    python -m tests.stub_llm_server --port 8100 \
+        --latency default=lognormal:600,0.4 --latency rag_answer=lognormal:1500,0.5
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1.
+
+Latency specs: fixed:MS | uniform:LO_MS,HI_MS | lognormal:MEDIAN_MS,SIGMA
+
+--rpm N emulates a provider request limit: calls beyond N in any 60s window
+get a 429 with retry-after and x-ratelimit-* headers.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PROMPT_TYPES = ("router", "profile_extract", "destination_check", "reasons", "rag_answer")
+
+# First system-prompt line of each call site in app/.
+_PROMPT_MARKERS = {
+    "router": "intent classifier",
+    "profile_extract": "structured trip profile",
+    "destination_check": "geographic coverage",
+    "reasons": "reasons for recommending",
+    "rag_answer": "answering questions based only on the provided policy excerpts",
+}
+
+_DESTINATIONS = ("Spain", "Germany", "France", "Italy", "Thailand", "Japan", "Canada", "USA", "Brazil")
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Sampler returning a delay in seconds for a latency spec.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(x) for x in args.split(",") if x]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000.0
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000.0
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000.0
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def prompt_type(messages: List[Dict[str, Any]]) -> Optional[str]:
+    system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system").lower()
+    for name, marker in _PROMPT_MARKERS.items():
+        if marker in system:
+            return name
+    return None
+
+
+def _user_text(messages: List[Dict[str, Any]]) -> str:
+    return " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+
+
+def _profile_reply(text: str) -> str:
+    age = re.search(r"(\d{1,3})\s*(?:years? old|yo|ans)", text, re.I)
+    duration = re.search(r"(\d+)\s*(day|week|month|year)", text, re.I)
+    days = None
+    if duration:
+        n = int(duration.group(1))
+        days = n * {"day": 1, "week": 7, "month": 30, "year": 365}[duration.group(2).lower()]
+    destination = next((d for d in _DESTINATIONS if d.lower() in text.lower()), None)
+    profile = {
+        "age": int(age.group(1)) if age else None,
+        "destination": destination,
+        "duration_days": days,
+        "purpose": "Business trip" if "business" in text.lower() else "Tourism",
+    }
+    # fenced like a model outside JSON mode; parse_json_reply strips it
+    return "```json\n" + json.dumps(profile) + "\n```"
+
+
+def canned_reply(kind: Optional[str], messages: List[Dict[str, Any]]) -> str:
+    text = _user_text(messages)
+    if kind == "router":
+        has_profile = bool(re.search(r"\d+\s*(?:years? old|yo)", text, re.I))
+        intent = "product_recommendation" if has_profile else "policy_question"
+        return json.dumps({"intent": intent, "confidence": 0.9})
+    if kind == "profile_extract":
+        return _profile_reply(text)
+    if kind == "destination_check":
+        return json.dumps({"covered": True})
+    if kind == "reasons":
+        ids = re.findall(r'"id":\s*"([^"]+)"', text)
+        return json.dumps({"reasons": {pid: f"{pid} fits this trip (stub)." for pid in ids}})
+    if kind == "rag_answer":
+        excerpts = re.findall(r"\[([^|\]]+)\|\s*([^\]]+)\]", text)
+        sources = [{"product": p.strip(), "section": s.strip()} for p, s in excerpts[:2]]
+        return json.dumps(
+            {"answer": "According to the policy excerpts, this is covered (stub).", "confidence": 0.8, "sources": sources}
+        )
+    return "{}"
+
+
+def create_app(
+    latencies: Dict[str, Callable[[], float]],
+    error_rate: float = 0.0,
+    rpm: int = 0,
+) -> FastAPI:
+    app = FastAPI(title="Stub OpenAI API")
+    counts: Dict[str, int] = {name: 0 for name in PROMPT_TYPES + ("unknown", "errors", "rate_limited")}
+    window: deque = deque()
+
+    def _rate_limit_headers(now: float) -> Dict[str, str]:
+        while window and now - window[0] >= 60.0:
+            window.popleft()
+        reset = 60.0 - (now - window[0]) if window else 0.0
+        return {
+            "x-ratelimit-limit-requests": str(rpm),
+            "x-ratelimit-remaining-requests": str(max(0, rpm - len(window))),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+
+    @app.get("/stats")
+    def stats():
+        return counts
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        kind = prompt_type(messages)
+        counts[kind or "unknown"] += 1
+
+        headers: Dict[str, str] = {}
+        if rpm:
+            now = time.monotonic()
+            headers = _rate_limit_headers(now)
+            if len(window) >= rpm:
+                counts["rate_limited"] += 1
+                retry_after = 60.0 - (now - window[0])
+                return JSONResponse(
+                    status_code=429,
+                    content={"error": {"message": "Rate limit reached (stub rpm)", "type": "requests"}},
+                    headers={**headers, "retry-after-ms": str(int(retry_after * 1000))},
+                )
+            window.append(now)
+            headers["x-ratelimit-remaining-requests"] = str(rpm - len(window))
+
+        sampler = latencies.get(kind or "default") or latencies["default"]
+        await asyncio.sleep(sampler())
+
+        if error_rate and random.random() < error_rate:
+            counts["errors"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error"}},
+                headers={"retry-after": "1"},
+            )
+
+        content = canned_reply(kind, messages)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        reply = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        return JSONResponse(content=reply, headers=headers)
+
+    return app
+
+
+def parse_latency_args(specs: List[str]) -> Dict[str, Callable[[], float]]:
+    latencies: Dict[str, Callable[[], float]] = {"default": parse_latency("lognormal:600,0.4")}
+    for spec in specs:
+        name, _, value = spec.partition("=")
+        if name != "default" and name not in PROMPT_TYPES:
+            raise ValueError(f"Unknown prompt type {name!r}; expected default or one of {PROMPT_TYPES}")
+        latencies[name] = parse_latency(value)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        help="TYPE=SPEC, TYPE in default/" + "/".join(PROMPT_TYPES) + " (repeatable)",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before answering 429")
+    args = parser.parse_args()
+
+    app = create_app(parse_latency_args(args.latency), error_rate=args.error_rate, rpm=args.rpm)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
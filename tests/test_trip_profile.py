@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from datetime import date
+
+from app.tools.trip_profile import parse_trip_profile
+
+MIN_CONFIDENCE = 0.8
+TODAY = date(2026, 5, 1)
+
+
+def parse(text: str, **kwargs):
+    return parse_trip_profile(text, today=TODAY, **kwargs)
+
+
+def test_plain_profile_is_fully_confident():
+    parsed = parse("I'm 35, going to Spain for 2 months for tourism")
+    assert parsed.confident(MIN_CONFIDENCE) == {
+        "age": 35,
+        "destination": "Spain",
+        "duration_days": 60,
+        "purpose": "Tourism",
+    }
+    assert parsed.missing(MIN_CONFIDENCE) == []
+
+
+def test_curly_apostrophe_age():
+    assert parse("I’m 42 and visiting Canada for 10 days").values["age"] == 42
+
+
+def test_unnamed_long_purpose_goes_to_llm():
+    parsed = parse("I am 25 and moving to Germany for 2 years for work")
+    assert parsed.values["age"] == 25
+    assert parsed.values["destination"] == "Germany"
+    assert parsed.values["duration_days"] == 730
+    # "Long-term stay" is only a guess.
+    assert parsed.missing(MIN_CONFIDENCE) == ["purpose"]
+    assert parsed.values["purpose"] == "Long-term stay"
+
+
+def test_group_without_age_goes_to_llm():
+    parsed = parse("We are 2 adults going to Japan for 10 days")
+    assert "age" not in parsed.values
+    assert parsed.values["destination"] == "Japan"
+    assert parsed.values["duration_days"] == 10
+    assert parsed.missing(MIN_CONFIDENCE) == ["age", "purpose"]
+
+
+def test_no_default_purpose_when_known():
+    parsed = parse("Actually make it 3 weeks", default_purpose=False)
+    assert parsed.values == {"duration_days": 21}